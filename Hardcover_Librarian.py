@@ -1,7 +1,9 @@
+import time
+STARTUP_BEGAN = time.perf_counter() # Reported by --startup-profile
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-import requests
+from tkinter import filedialog
 import json
 import os
 import webbrowser
@@ -9,6 +11,70 @@ import tkinter.font as tkFont
 from tkinter import scrolledtext
 import traceback
 import base64 # Added for token obfuscation
+import bisect
+import struct
+import tempfile
+from array import array
+import sys
+import argparse
+import threading
+import queue
+import hashlib
+import zlib
+import importlib
+from collections import namedtuple, OrderedDict, deque
+from contextlib import contextmanager
+import codecs
+import heapq
+import operator
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice, zip_longest
+import urllib.parse
+
+# --- Deferred Imports ---
+# requests and numpy alone take longer to import than building the whole window, so heavy
+# modules load on first use instead. The GUI's connection warm-up (warm_up_connection)
+# pulls in requests on a worker thread while the user is still typing.
+class LazyModule:
+    """Stands in for a module that is imported on first attribute access. Safe to use from any thread."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def is_loaded(self):
+        return self._module is not None or self._name in sys.modules
+
+requests = LazyModule('requests')
+cProfile = LazyModule('cProfile')
+pstats = LazyModule('pstats')
+sqlite3 = LazyModule('sqlite3') # Response cache, opened on first use
+csv = LazyModule('csv') # Report export only
+html = LazyModule('html') # Report export only
+mmap = LazyModule('mmap') # Dump audits only
+process_pool = LazyModule('concurrent.futures.process') # Pulls in multiprocessing; dump audits only
+DEFERRED_MODULES = (requests, cProfile, pstats, sqlite3, csv, html, mmap, process_pool)
+
+_optional_modules = {}
+
+def optional_module(name):
+    """Imports an optional dependency on first use. Returns None if it is not installed.
+
+    Used for numpy (faster flag evaluation over large edition lists) and orjson (faster
+    decoding of API responses).
+    """
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
 
 # --- Dark Theme Colors ---
 COLOR_BACKGROUND = "#2E2E2E"
@@ -22,14 +88,11 @@ COLOR_ERROR_FG = "#F44747" # Red for errors
 COLOR_SEPARATOR_FG = "#6A6A6A"
 COLOR_WARNING_FG = "#FF8C00" # DarkOrange for warnings (Missing critical data)
 COLOR_INFO_FG = "#FFCC66"   # Lighter Orange/Gold for info flags (Missing less critical data)
+COLOR_CHANGED_FG = "#C586C0" # Magenta for changes since the last fetch
 
-# --- Global List for Clickable Regions ---
-clickable_regions = []
-
-# --- Configuration File Handling (No changes needed here) ---
+# --- Configuration File Handling ---
 CONFIG_DIR_NAME = "HardcoverFetcher"
 CONFIG_FILE_NAME = "config.json"
-# ... (get_config_path, save_config, load_config remain the same) ...
 def get_config_path():
     """Gets the platform-specific path for the configuration file."""
     app_data_path = os.getenv('APPDATA') # Windows
@@ -45,7 +108,7 @@ def get_config_path():
     try:
         os.makedirs(config_dir, exist_ok=True)
     except OSError as e:
-        print(f"Warning: Could not create config directory {config_dir}: {e}")
+        print(f"Warning: Could not create config directory {config_dir}: {e}", file=sys.stderr)
         return os.path.abspath(CONFIG_FILE_NAME) # Fallback to current dir
     return os.path.join(config_dir, CONFIG_FILE_NAME)
 
@@ -56,7 +119,7 @@ def save_config(config_data):
         with open(config_file, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, indent=4)
     except IOError as e:
-        print(f"Error saving config file to {config_file}: {e}")
+        print(f"Error saving config file to {config_file}: {e}", file=sys.stderr)
         messagebox.showwarning("Config Error", f"Could not save configuration file:\n{e}")
 
 def load_config():
@@ -71,548 +134,5149 @@ def load_config():
                     return {}
                 return json.loads(content)
         except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading/parsing config file from {config_file}: {e}")
+            print(f"Error loading/parsing config file from {config_file}: {e}", file=sys.stderr)
             return {}
     else:
-        print(f"Config file not found at {config_file}. Using defaults.")
+        print(f"Config file not found at {config_file}. Using defaults.", file=sys.stderr)
         return {}
 
-# --- Link Handling (No changes needed here) ---
-def open_book_link(book_slug):
-    """Opens the Hardcover book page in a web browser."""
-    if book_slug:
-        url = f"https://hardcover.app/books/{book_slug}"
-        print(f"Opening URL: {url}")
+def load_saved_token():
+    """Returns the saved bearer token from the config file, or an empty string."""
+    config = load_config()
+    saved_token_b64 = config.get('bearer_token_b64', '')
+    saved_token_plain = config.get('bearer_token', '') # Check for old plain text token
+    if saved_token_b64:
         try:
-            webbrowser.open_new_tab(url)
+            token = base64.b64decode(saved_token_b64).decode()
+            print("Decoded token from bearer_token_b64.", file=sys.stderr)
+            return token
         except Exception as e:
-            messagebox.showerror("Error", f"Could not open link:\n{e}")
-    else:
-        print("Error: No slug provided to open_book_link.")
-        messagebox.showwarning("Link Error", "Could not create link (missing book slug).")
+            print(f"Error decoding saved token: {e}. Please re-enter token.", file=sys.stderr)
+            return ""
+    if saved_token_plain: # If b64 not present, check for old plain one
+        print("Using plain text token from config (will be encoded on next save).", file=sys.stderr)
+        return saved_token_plain
+    return ""
 
-# --- URL Generation Helper (No changes needed here) ---
-def get_platform_url(platform_name, external_id):
-    """Constructs a URL for a given platform and external ID."""
-    if not platform_name or not external_id: return None
-    name = platform_name.lower()
-    if isinstance(external_id, str) and external_id.startswith(('http://', 'https://')):
-        if '.' in external_id: return external_id
-        else: return None
-    ext_id_str = str(external_id)
-    if name == 'goodreads': return f"https://www.goodreads.com/book/show/{ext_id_str}"
-    if name == 'google': return f"https://books.google.com/books?id={ext_id_str}"
-    if name == 'openlibrary':
-        if ext_id_str.startswith(('/books/', '/works/')): return f"https://openlibrary.org{ext_id_str}"
-        else: return f"https://openlibrary.org/search?q={ext_id_str}"
-    return None
+# --- Timing Instrumentation ---
+# Every phase of a fetch and render is timed into one recorder: recent durations per phase
+# (a rolling histogram), Chrome trace events (load the export in chrome://tracing or
+# Perfetto), and per-run totals for the status bar. cProfile capture can be switched on
+# to see where the time inside a phase goes.
+TIMING_HISTORY_SIZE = 500 # Durations kept per phase
+TRACE_EVENT_LIMIT = 50000
+STATUS_PHASES = [ # Phases shown in the status bar, in pipeline order
+    ("scheduler_wait", "queued"), ("connect", "connect"), ("server", "server"), ("download", "download"), ("json_decode", "json"),
+    ("sort", "sort"), ("flag_evaluation", "flags"), ("model_build", "model"), ("widget_insert", "insert"),
+]
 
-# --- Link Handling Callbacks for Output Widget (No changes needed here) ---
-def on_link_enter(event): event.widget.config(cursor="hand2")
-def on_link_leave(event): event.widget.config(cursor="")
-def on_link_click(event):
-    widget = event.widget
-    index = widget.index(f"@{event.x},{event.y}")
-    global clickable_regions
-    for region in clickable_regions:
-        if widget.compare(index, '>=', region['start']) and widget.compare(index, '<', region['end']):
-            url_to_open = region['url']
-            print(f"Opening link: {url_to_open}")
-            try: webbrowser.open_new_tab(url_to_open)
-            except Exception as e: messagebox.showerror("Link Error", f"Could not open URL:\n{url_to_open}\nError: {e}")
-            break
-
-# --- MODIFIED: Function to Display Formatted Data with Flags ---
-def display_formatted_data(widget, book_data):
-    """Formats book data and inserts it into the text widget with colors and flags."""
-    global clickable_regions
-    clickable_regions = []
+class TimingRecorder:
+    """Thread-safe collector of phase timings, trace events and optional cProfile captures."""
 
-    # Define Text Tags (Update colors here)
-    widget.tag_configure("header", foreground=COLOR_HEADER_FG, font=tkFont.Font(weight='bold'))
-    widget.tag_configure("label", foreground=COLOR_LABEL_FG)
-    widget.tag_configure("value", foreground=COLOR_FOREGROUND)
-    widget.tag_configure("hyperlink", foreground=COLOR_ACCENT_FG, underline=True)
-    widget.tag_configure("separator", foreground=COLOR_SEPARATOR_FG)
-    widget.tag_configure("error", foreground=COLOR_ERROR_FG)
-    widget.tag_configure("warning_flag", foreground=COLOR_WARNING_FG, font=tkFont.Font(weight='bold')) # Red/Orange
-    widget.tag_configure("info_flag", foreground=COLOR_INFO_FG, font=tkFont.Font(weight='bold'))    # Yellow/Orange
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=TRACE_EVENT_LIMIT)
+        self.history = {} # phase -> deque of durations in ms
+        self.run_totals = None # phase -> [total ms, count] for the run in progress
+        self.run_bytes = 0
+        self.profiler = None # Main-thread cProfile.Profile while capture is on
+        self.profile_stats = None # pstats.Stats merged from finished captures
 
-    # Nested Helper Function (remains the same)
-    def insert_pair(label_text, value_text, is_link=False, url=None, value_tag="value"):
-        # NOTE: This function no longer handles inserting flags directly for book details.
-        widget.insert(tk.END, label_text, ("label",))
-        value_str = str(value_text or 'N/A')
-        if is_link and url and value_str != 'N/A':
-            start_index = widget.index(f"{tk.END}-1c")
-            widget.insert(tk.END, value_str, ("hyperlink",))
-            end_index = widget.index(f"{tk.END}-1c")
-            clickable_regions.append({'start': start_index, 'end': end_index, 'url': url})
-            widget.insert(tk.END, "\n")
-        else:
-            widget.insert(tk.END, value_str + "\n", (value_tag,))
+    @contextmanager
+    def span(self, phase, **args):
+        """Times the enclosed block as one phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, start, time.perf_counter() - start, **args)
 
-    # Enable widget, clear
-    widget.config(state=tk.NORMAL)
-    widget.delete('1.0', tk.END)
+    def record(self, phase, start, duration, **args):
+        """Records a phase that started at perf_counter() time 'start' and took 'duration' seconds."""
+        duration_ms = max(duration, 0) * 1000
+        event = { "name": phase, "ph": "X", "ts": round((start - self.origin) * 1e6), "dur": round(max(duration, 0) * 1e6),
+                  "pid": os.getpid(), "tid": threading.get_ident(), "args": args }
+        with self.lock:
+            self.events.append(event)
+            self.history.setdefault(phase, deque(maxlen=TIMING_HISTORY_SIZE)).append(duration_ms)
+            if self.run_totals is not None:
+                total = self.run_totals.setdefault(phase, [0.0, 0])
+                total[0] += duration_ms
+                total[1] += 1
+                self.run_bytes += args.get('bytes', 0)
 
-    # --- Book Details ---
-    widget.insert(tk.END, "Book Details:\n", ("header",))
-    widget.insert(tk.END, "-" * 50 + "\n", ("separator",))
-
-    # --- Gather Book-Level Flags ---
-    book_flags = []
-    if not book_data.get('description'):
-        book_flags.append(("[NO DESCRIPTION]", "warning_flag")) # Warning
-    if not book_data.get('default_cover_edition'): book_flags.append(("[NO DEFAULT COVER]", "info_flag")) # Info
-    if not book_data.get('default_ebook_edition'): book_flags.append(("[NO DEFAULT EBOOK]", "info_flag")) # Info
-    if not book_data.get('default_audio_edition'): book_flags.append(("[NO DEFAULT AUDIO]", "info_flag")) # Info
-    if not book_data.get('default_physical_edition'): book_flags.append(("[NO DEFAULT PHYSICAL]", "info_flag")) # Info
-    # --- End Book-Level Flag Gathering ---
-
-    # Insert Book Details (without flags attached here)
-    insert_pair("Title: ", book_data.get('title', 'N/A')) # Flags removed from here
-
-    author_name = "N/A" # Default
-    contributions = book_data.get('contributions', [])
-    if contributions and isinstance(contributions, list) and len(contributions) > 0:
-    # Check if the first contribution is a dict before getting 'author'
-        first_contribution = contributions[0]
-    if isinstance(first_contribution, dict):
-        author_info = first_contribution.get('author') # Get author, could be None or dict
-        # Check if author_info is a dict before getting 'name'
-        if author_info and isinstance(author_info, dict):
-             author_name = author_info.get('name', 'N/A')
-    insert_pair("Author: ", author_name)
+    def start_run(self):
+        """Starts collecting per-phase totals for one fetch-and-display."""
+        with self.lock:
+            self.run_totals = {}
+            self.run_bytes = 0
+        if self.profiler is not None:
+            self.profiler.enable()
 
-    book_slug = book_data.get('slug')
-    slug_url = f"https://hardcover.app/books/{book_slug}" if book_slug else None
-    insert_pair("Slug: ", book_slug, is_link=bool(slug_url), url=slug_url)
+    def finish_run(self):
+        """Stops the current run and returns its phase totals as a short status-bar string."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        with self.lock:
+            totals, self.run_totals = self.run_totals or {}, None
+            run_bytes = self.run_bytes
+        parts = []
+        for phase, label in STATUS_PHASES:
+            if phase not in totals: continue
+            text = f"{label} {totals[phase][0]:.0f} ms"
+            if phase == "download" and run_bytes:
+                text += f" ({run_bytes / 1024:.0f} KB)"
+            parts.append(text)
+        return " · ".join(parts)
 
-    insert_pair("Book ID: ", str(book_data.get('id', 'N/A')))
-    insert_pair("Editions Count: ", str(book_data.get('editions_count', 'N/A')))
-    insert_pair("Users Count: ", str(book_data.get('users_count', 'N/A')))
-    insert_pair("Users Read Count: ", str(book_data.get('users_read_count', 'N/A')))
+    def histogram(self):
+        """Returns count, p50, p90, p99 and max (ms) for each phase over the recent history."""
+        with self.lock:
+            history = {phase: sorted(values) for phase, values in self.history.items()}
+        summary = {}
+        for phase, values in history.items():
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            summary[phase] = { "count": len(values), "p50_ms": round(pick(0.5), 3), "p90_ms": round(pick(0.9), 3),
+                               "p99_ms": round(pick(0.99), 3), "max_ms": round(values[-1], 3) }
+        return summary
 
-    # --- Display Book Flags Separately ---
-    if book_flags:
-        widget.insert(tk.END, "Book Flags: ", ("label",)) # Label for the flags
-        for flag_text, flag_tag in book_flags:
-            widget.insert(tk.END, flag_text + " ", (flag_tag,)) # Insert flags inline
-        widget.insert(tk.END, "\n") # Newline after flags
-    # --- End Book Flag Display ---
+    def export_chrome_trace(self, path):
+        """Writes the trace events (Chrome trace JSON) plus the phase histogram under 'otherData'."""
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({ "traceEvents": events, "displayTimeUnit": "ms", "otherData": { "histogram": self.histogram() } }, f)
 
-    # Display Description if present
-    description = book_data.get('description')
-    if description:
-         widget.insert(tk.END, "Description:\n", ("label",)) # Label on own line
-         widget.insert(tk.END, description[:500] + ("..." if len(description) > 500 else "") + "\n", ("value",))
+    def set_profiling(self, enabled):
+        """Turns cProfile capture on or off. Captures cover the Tk thread during runs and every profiled() call."""
+        if enabled and self.profiler is None:
+            self.profiler = cProfile.Profile()
+        elif not enabled and self.profiler is not None:
+            self._merge_profile(self.profiler)
+            self.profiler = None
 
+    def profiled(self, func):
+        """Wraps func so it runs under its own cProfile capture (for worker threads) while capture is on."""
+        def wrapper(*args, **kwargs):
+            if self.profiler is None:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                self._merge_profile(profile)
+        return wrapper
 
-    widget.insert(tk.END, "\n" + "=" * 50 + "\n\n", ("separator",))
+    def _merge_profile(self, profile):
+        with self.lock:
+            try:
+                if self.profile_stats is None:
+                    self.profile_stats = pstats.Stats(profile)
+                else:
+                    self.profile_stats.add(profile)
+            except TypeError:
+                pass # Profile captured nothing
 
-    # --- Editions Details (Logic remains similar, using new flag colors) ---
-    editions = book_data.get('editions', [])
-    if editions:
-        try:
-            editions.sort(key=lambda e: e.get('score') if isinstance(e, dict) and e.get('score') is not None else -float('inf'))
-        except Exception as sort_e:
-            print(f"Error sorting editions: {sort_e}")
-            widget.insert(tk.END, f"(Could not sort editions: {sort_e})\n", ("error",))
+    def save_profile(self, path):
+        """Writes the captured cProfile data (pstats format). Returns False if nothing has been captured."""
+        if self.profiler is not None:
+            self._merge_profile(self.profiler)
+            self.profiler = cProfile.Profile()
+        if self.profile_stats is None:
+            return False
+        self.profile_stats.dump_stats(path)
+        return True
 
-    if not editions:
-        widget.insert(tk.END,"No editions found in the data.\n", ("value",))
+timings = TimingRecorder()
+
+# --- API Helpers ---
+API_URL = os.getenv('HARDCOVER_API_URL', "https://api.hardcover.app/v1/graphql") # Override to point at a local stub server
+USER_AGENT = "Python Hardcover Librarian Tool V1.0"
+
+# --- Query Builder ---
+# Queries are generated from lists of dotted field paths ("image.url" becomes
+# "image { url }"), so each query profile requests only the fields it actually uses.
+FULL_BOOK_FIELDS = [
+    "id", "title", "slug", "editions_count", "description", "contributions.author.name",
+    "default_audio_edition.id", "default_audio_edition.edition_format",
+    "default_cover_edition.id", "default_cover_edition.edition_format",
+    "default_ebook_edition.id", "default_ebook_edition.edition_format",
+    "default_physical_edition.id", "default_physical_edition.edition_format",
+]
+
+FULL_EDITION_FIELDS = [
+    "id", "score", "edition_format", "asin", "isbn_10", "isbn_13", "pages", "release_date", "image.url",
+    "book_mappings.external_id", "book_mappings.platform.name", "publisher.name", "reading_format.format", "language.language",
+]
+
+# "book"/"edition" list the fields always requested. Profiles with "rules": True also get
+# every field the enabled flag rules read (see BOOK_FLAG_COLUMN_FIELDS/EDITION_FLAG_COLUMN_FIELDS).
+# More profiles can be added in config.json under "query_profiles".
+QUERY_PROFILES = {
+    "full": { "label": "Full review", "book": FULL_BOOK_FIELDS, "edition": FULL_EDITION_FIELDS },
+    "flags": { "label": "Flags only", "book": ["id", "title", "slug", "editions_count"], "edition": ["id", "score"], "rules": True },
+    "identifiers": { "label": "Identifiers only", "book": ["id", "title", "slug", "editions_count"],
+                     "edition": ["id", "asin", "isbn_10", "isbn_13", "book_mappings.external_id", "book_mappings.platform.name"] },
+}
+DEFAULT_QUERY_PROFILE = "full"
+
+# Paged fetching: the book header comes back with the first page of editions, and the
+# remaining editions are requested page by page, ordered by score on the server.
+EDITION_PAGE_SIZE = 100
+EDITION_ORDER = "[{score: asc_nulls_first}, {id: asc}]" # Same order display_formatted_data sorts into
+
+_query_cache = {} # (kind, profile) -> query text
+_profile_hashes = {}
+_query_profiles = None
+
+def get_query_profiles():
+    """Returns the built-in query profiles plus any defined in config.json. Loaded once per process."""
+    global _query_profiles
+    if _query_profiles is None:
+        profiles = dict(QUERY_PROFILES)
+        for name, profile in (load_config().get('query_profiles') or {}).items():
+            if isinstance(profile, dict):
+                profiles[name] = { "label": profile.get('label', name), "book": list(profile.get('book') or []),
+                                   "edition": list(profile.get('edition') or []), "rules": bool(profile.get('rules')) }
+        _query_profiles = profiles
+    return _query_profiles
+
+def get_profile_fields(profile_name):
+    """Returns (book_paths, edition_paths) for a profile. 'id' is always included."""
+    profiles = get_query_profiles()
+    if profile_name not in profiles:
+        raise ValueError(f"Unknown query profile '{profile_name}'. Choose from: {', '.join(sorted(profiles))}.")
+    profile = profiles[profile_name]
+    book_paths = ["id"] + list(profile['book'])
+    edition_paths = ["id"] + list(profile['edition'])
+    if profile.get('rules'):
+        book_rules, edition_rules = get_flag_rules()
+        for rule in book_rules: book_paths.extend(BOOK_FLAG_COLUMN_FIELDS[rule['column']])
+        for rule in edition_rules: edition_paths.extend(EDITION_FLAG_COLUMN_FIELDS[rule['column']])
+    return book_paths, edition_paths
+
+def selection_tree(paths):
+    """Turns dotted field paths into a nested dict, keeping first-seen order and dropping duplicates."""
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+def format_selection(tree, indent):
+    """Formats a selection tree as GraphQL field lines."""
+    lines = []
+    pad = " " * indent
+    for name, children in tree.items():
+        if children:
+            lines.append(f"{pad}{name} {{")
+            lines.append(format_selection(children, indent + 2))
+            lines.append(f"{pad}}}")
+        else:
+            lines.append(pad + name)
+    return "\n".join(lines)
+
+def profile_hash(profile_name):
+    """Returns a hash of the fields a profile requests; used as part of the response cache key."""
+    if profile_name not in _profile_hashes:
+        book_paths, edition_paths = get_profile_fields(profile_name)
+        _profile_hashes[profile_name] = query_hash(" ".join(book_paths) + " | " + " ".join(edition_paths))
+    return _profile_hashes[profile_name]
+
+def build_query(kind, profile_name=DEFAULT_QUERY_PROFILE):
+    """Builds (and memoizes) a query for a profile.
+
+    kind is 'book' (one book with all editions), 'batch' (several books by ID), 'header'
+    (one book with the first page of editions) or 'page' (a page of one book's editions).
+    """
+    key = (kind, profile_name)
+    if key in _query_cache:
+        return _query_cache[key]
+    book_paths, edition_paths = get_profile_fields(profile_name)
+    book_fields = format_selection(selection_tree(book_paths), 8)
+    edition_fields = format_selection(selection_tree(edition_paths), 10)
+    if kind == 'book':
+        query = f"""
+    query MyQuery($bookId: Int!) {{
+      books(where: {{id: {{_eq: $bookId}}}}) {{
+{book_fields}
+        editions {{
+{edition_fields}
+        }}
+      }}
+    }}
+    """
+    elif kind == 'batch':
+        query = f"""
+    query BatchBooks($bookIds: [Int!]!) {{
+      books(where: {{id: {{_in: $bookIds}}}}) {{
+{book_fields}
+        editions {{
+{edition_fields}
+        }}
+      }}
+    }}
+    """
+    elif kind == 'header':
+        query = f"""
+    query BookHeader($bookId: Int!, $limit: Int!) {{
+      books(where: {{id: {{_eq: $bookId}}}}) {{
+{book_fields}
+        editions(order_by: {EDITION_ORDER}, limit: $limit) {{
+{edition_fields}
+        }}
+      }}
+    }}
+    """
+    elif kind == 'page':
+        query = f"""
+    query EditionsPage($bookId: Int!, $limit: Int!, $offset: Int!) {{
+      editions(where: {{book_id: {{_eq: $bookId}}}}, order_by: {EDITION_ORDER}, limit: $limit, offset: $offset) {{
+{format_selection(selection_tree(edition_paths), 8)}
+      }}
+    }}
+    """
     else:
-        widget.insert(tk.END, f"Editions Found ({len(editions)}) - Sorted by Score (Lowest First):\n", ("header",))
-        widget.insert(tk.END, "-" * 50 + "\n", ("separator",))
-
-        LOW_SCORE_THRESHOLD = 500
-
-        for i, edition in enumerate(editions):
-            if not isinstance(edition, dict): continue
-
-            widget.insert(tk.END, f"\n--- Edition {i+1} --- \n", ("header",))
-
-            # --- Gather Edition Flags ---
-            edition_flags = []
-            edition_score = edition.get('score')
-            if edition_score is not None and edition_score < LOW_SCORE_THRESHOLD:
-                edition_flags.append((f"[LOW SCORE:{edition_score}]", "warning_flag")) # Warning
-            if not edition.get('isbn_10') and not edition.get('isbn_13'):
-                edition_flags.append(("[MISSING ISBN]", "warning_flag")) # Warning
-            image_info = edition.get('image')
-            image_url = image_info.get('url') if image_info and isinstance(image_info, dict) else None
-            if not image_url:
-                edition_flags.append(("[NO IMAGE]", "warning_flag")) # Warning
-            if not edition.get('pages'): edition_flags.append(("[NO PAGES]", "info_flag")) # Info
-            if not edition.get('release_date'): edition_flags.append(("[NO RELEASE DATE]", "info_flag")) # Info
-            if not edition.get('publisher'): edition_flags.append(("[NO PUBLISHER]", "info_flag")) # Info
-            if not edition.get('language'): edition_flags.append(("[NO LANGUAGE]", "info_flag")) # Info
-            if not edition.get('edition_format'): edition_flags.append(("[NO FORMAT]", "info_flag")) # Info
-
-            # Check for duplicate platforms within this edition's mappings
-            mappings = edition.get('book_mappings', [])
-            platform_counts = {}
-            if mappings:
-                 for mapping in mappings:
-                      if not isinstance(mapping, dict): continue
-                      platform = mapping.get('platform')
-                      platform_name = platform.get('name', 'N/A') if platform and isinstance(platform, dict) else "N/A"
-                      if platform_name != "N/A":
-                          platform_counts[platform_name] = platform_counts.get(platform_name, 0) + 1
-            dupe_platforms = [p for p, c in platform_counts.items() if c > 1]
-            if dupe_platforms:
-                 edition_flags.append((f"[DUPE PLATFORMS: {', '.join(dupe_platforms)}]", "info_flag")) # Info
-            # --- End Edition Flag Gathering ---
-
-
-            # Insert edition flags near the top
-            if edition_flags:
-                widget.insert(tk.END, "  Flags: ", ("label",))
-                for flag_text, flag_tag in edition_flags:
-                     widget.insert(tk.END, flag_text + " ", (flag_tag,))
-                widget.insert(tk.END, "\n")
-
-            # Insert Edition Details
-            edition_id = edition.get('id')
-            edit_url = f"https://hardcover.app/books/{book_slug}/editions/{edition_id}/edit" if book_slug and edition_id else None
-            insert_pair("  ID: ", edition_id, is_link=bool(edit_url), url=edit_url)
-
-            insert_pair("  Score: ", str(edition_score or 'N/A'))
-            insert_pair("  Format: ", edition.get('edition_format', 'N/A'))
-            insert_pair("  ASIN: ", edition.get('asin') or 'N/A')
-            insert_pair("  ISBN-10: ", edition.get('isbn_10') or 'N/A')
-            insert_pair("  ISBN-13: ", edition.get('isbn_13') or 'N/A')
-            insert_pair("  Pages: ", str(edition.get('pages', 'N/A')))
-            insert_pair("  Release Date: ", edition.get('release_date', 'N/A'))
-
-            publisher_name = "N/A" # Default
-            publisher_info = edition.get('publisher') # Get value, could be None or dict
-            if publisher_info and isinstance(publisher_info, dict): # Check it's a valid dict
-                publisher_name = publisher_info.get('name', 'N/A')
-            insert_pair("  Publisher: ", publisher_name)
-            language_name = "N/A" # Default
-            language_info = edition.get('language') # Get value
-            if language_info and isinstance(language_info, dict): # Check it's valid
-                language_name = language_info.get('language', 'N/A')
-            insert_pair("  Language: ", language_name)
-            reading_fmt = "N/A" # Default
-            reading_fmt_info = edition.get('reading_format') # Get value
-            if reading_fmt_info and isinstance(reading_fmt_info, dict): # Check it's valid
-                reading_fmt = reading_fmt_info.get('format', 'N/A')
-            insert_pair("  Reading Format: ", reading_fmt)
-
-            widget.insert(tk.END, "  Image: ", ("label",))
-            insert_pair("", image_url, is_link=bool(image_url), url=image_url)
-
-            widget.insert(tk.END, "  Platform Mappings:\n", ("label",))
-            if not mappings:
-                widget.insert(tk.END, "    - None found for this edition.\n", ("value",))
-            else:
-                for mapping in mappings:
-                     if not isinstance(mapping, dict): continue
-                     platform = mapping.get('platform')
-                     platform_name = platform.get('name', 'N/A') if platform and isinstance(platform, dict) else "N/A"
-                     external_id = mapping.get('external_id', 'N/A')
+        raise ValueError(f"Unknown query kind '{kind}'.")
+    _query_cache[key] = query
+    return query
+
+# Catalogue enumeration: Book IDs matching a name, one page at a time. Pages follow an ID
+# cursor (id > the last ID seen, in ID order) instead of an offset, so the server never
+# has to skip rows and books added mid-run cannot shift later pages.
+ENUMERATION_FILTERS = {
+    "author": ("BooksByAuthor", "contributions: {author: {name: {_eq: $name}}}"),
+    "publisher": ("BooksByPublisher", "editions: {publisher: {name: {_eq: $name}}}"),
+    "series": ("BooksBySeries", "book_series: {series: {name: {_eq: $name}}}"),
+}
+
+def build_enumeration_query(kind):
+    """Builds the query listing one page of Book IDs for an author, publisher or series. Returns (query, operation_name)."""
+    if kind not in ENUMERATION_FILTERS:
+        raise ValueError(f"Unknown catalogue filter '{kind}'. Choose from: {', '.join(ENUMERATION_FILTERS)}.")
+    operation, condition = ENUMERATION_FILTERS[kind]
+    query = f"""
+    query {operation}($name: String!, $after: Int!, $limit: Int!) {{
+      books(where: {{{condition}, id: {{_gt: $after}}}}, order_by: {{id: asc}}, limit: $limit) {{
+        id
+      }}
+    }}
+    """
+    return query, operation
 
-                     widget.insert(tk.END, "    - Platform: ", ("label",))
-                     widget.insert(tk.END, f"{platform_name}\n", ("value",))
+# Identifier resolution: the editions carrying any of a batch of ISBNs or ASINs, in one query.
+RESOLVE_IDENTIFIERS_QUERY = """
+query ResolveIdentifiers($isbn13: [String!]!, $isbn10: [String!]!, $asins: [String!]!) {
+  editions(where: {_or: [{isbn_13: {_in: $isbn13}}, {isbn_10: {_in: $isbn10}}, {asin: {_in: $asins}}]}, order_by: {id: asc}) {
+    id
+    book_id
+    isbn_13
+    isbn_10
+    asin
+  }
+}
+"""
 
-                     platform_url = get_platform_url(platform_name, external_id)
-                     insert_pair("      External ID: ", external_id, is_link=bool(platform_url), url=platform_url)
+class GraphQLError(Exception):
+    """Raised when the API responds with a GraphQL 'errors' list."""
 
-                # Removed duplicate platform note from here as it's included in flags above
+def build_headers(bearer_token):
+    """Builds the HTTP headers for a Hardcover API request."""
+    return { "accept": "application/json", "authorization": f"Bearer {bearer_token}", "content-type": "application/json", "user-agent": USER_AGENT }
 
+# --- Shared HTTP Session ---
+# One pooled session for the whole process, so repeated fetches reuse the same TLS connection.
+HTTP_POOL_SIZE = 8
+_http_session = None
+_http_session_lock = threading.Lock()
 
-    # Make widget read-only again
-    widget.config(state=tk.DISABLED)
+_connect_time = threading.local() # Seconds spent opening connections during the current request, per thread
 
+def make_timed_adapter():
+    """Returns an HTTPAdapter whose new connections record a 'connect' phase (DNS + TCP + TLS)."""
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
-# --- Function to Display Error Message (No changes needed here) ---
-def display_error_message(widget, error_message):
-    """Displays an error message in the output widget."""
-    # ... (function remains the same) ...
+    def timed_connect(connection_cls):
+        class TimedConnection(connection_cls):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                finally:
+                    elapsed = time.perf_counter() - start
+                    _connect_time.seconds = getattr(_connect_time, 'seconds', 0.0) + elapsed
+                    timings.record("connect", start, elapsed, host=self.host)
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = timed_connect(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = timed_connect(HTTPSConnection)
+
+    class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = { "http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool }
+
+    return TimedHTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+
+def get_http_session():
+    """Returns the process-wide requests.Session, creating it on first use."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = make_timed_adapter()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+def warm_up_connection(timeout=10):
+    """Opens a pooled connection to the API ahead of the first fetch, so that fetch skips DNS, TCP and TLS setup.
+
+    Sends a CORS preflight (OPTIONS), which needs no token and leaves the connection in the
+    session's pool. Returns the seconds it took, or None if the API could not be reached.
+    """
+    start = time.perf_counter()
     try:
-        widget.config(state=tk.NORMAL)
-        widget.delete('1.0', tk.END)
-        widget.tag_configure("error", foreground=COLOR_ERROR_FG) # Ensure tag exists
-        widget.insert(tk.END, "Error:\n", ("error",))
-        widget.insert(tk.END, str(error_message), ("error",)) # Ensure message is string
-        widget.config(state=tk.DISABLED)
-    except tk.TclError as e:
-        print(f"Error displaying error message in widget: {e}")
+        get_http_session().options(API_URL, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return None
+    return time.perf_counter() - start
 
+# --- Request Scheduler ---
+# Every GraphQL request (GUI, worklist, batch and catalog) goes through one scheduler, so
+# the whole process stays under the API's rate limit however many threads are fetching.
+#   * A token bucket allows api_requests_per_minute on average (the API allows 60), with
+#     bursts of up to api_burst requests.
+#   * Concurrency adapts AIMD-style: each success raises the limit by 1/limit (about +1 per
+#     round of requests), each 429, 5xx or connection failure halves it (at most once per
+#     second, so one burst of failures counts once). It stays between 1 and api_max_concurrency.
+#   * Throttled and failed requests are retried up to api_max_retries times with
+#     exponential backoff and full jitter. A Retry-After header pauses every request, not
+#     just the one that got it.
+DEFAULT_API_REQUESTS_PER_MINUTE = 60
+DEFAULT_API_BURST = 10
+DEFAULT_API_MAX_RETRIES = 4
+INITIAL_API_CONCURRENCY = 2
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+RETRY_AFTER_MAX_SECONDS = 300 # Longer Retry-After values are capped so a run never hangs for hours
+DECREASE_INTERVAL_SECONDS = 1.0
+THROUGHPUT_WINDOW_SECONDS = 60
+RETRYABLE_STATUSES = { 429: "throttled", 500: "server_errors", 502: "server_errors", 503: "server_errors", 504: "server_errors" }
 
-# --- Core Logic to Fetch Data ---
-def fetch_and_process_data():
-    """Gets data from GUI, calls API, displays cleaned data and link."""
+def parse_retry_after(value):
+    """Returns the seconds a Retry-After header asks for (delta-seconds or an HTTP date), or None."""
+    if not value: return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    import email.utils
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
 
-    # Reset UI (Same)
-    link_label.grid_remove()
-    status_var.set("Processing...")
-    output_viewer.config(state=tk.NORMAL)
-    output_viewer.delete('1.0', tk.END)
-    output_viewer.config(state=tk.DISABLED)
-    window.update_idletasks()
+class RequestScheduler:
+    """Admits API requests under a token bucket and an adaptive concurrency limit, retrying throttled ones. Thread-safe."""
 
-    # Get Inputs & Validate (Same)
-    bearer_token = token_entry.get().strip()
-    book_id_str = book_id_entry.get().strip()
-    # ... (validation logic remains the same) ...
-    if not bearer_token: msg = "Bearer Token cannot be empty."; messagebox.showerror("Error", msg); status_var.set("Error: Missing Bearer Token."); display_error_message(output_viewer, msg); return
-    if not book_id_str: msg = "Book ID cannot be empty."; messagebox.showerror("Input Error", msg); status_var.set("Error: Missing Book ID."); display_error_message(output_viewer, msg); return
-    if not book_id_str.isdigit(): msg = "Book ID must be a number."; messagebox.showerror("Input Error", msg); status_var.set("Error: Invalid Book ID."); display_error_message(output_viewer, msg); return
-    try: book_id_int = int(book_id_str)
-    except ValueError: msg = "Book ID is not a valid integer."; messagebox.showerror("Input Error", msg); status_var.set("Error: Invalid Book ID format."); display_error_message(output_viewer, msg); return
+    def __init__(self, requests_per_minute=DEFAULT_API_REQUESTS_PER_MINUTE, burst=DEFAULT_API_BURST,
+                 max_concurrency=HTTP_POOL_SIZE, max_retries=DEFAULT_API_MAX_RETRIES):
+        self.rate = requests_per_minute / 60 if requests_per_minute else None # Tokens per second; None = unlimited
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(min(INITIAL_API_CONCURRENCY, self.max_concurrency))
+        self.max_retries = max(0, max_retries)
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self.condition = threading.Condition()
+        self.counters = { "requests": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0, "server_errors": 0, "connection_errors": 0 }
+        self.completions = deque() # monotonic() times of recent successes, for throughput
+        self.started_at = time.monotonic()
 
+    def next_wait(self, now):
+        """Seconds until another request may start (0 = now), or None to wait for a running one to finish. Call with the lock held."""
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.rate is not None and self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
 
-    # --- Encode Token Before Saving Config ---
+    def acquire(self):
+        """Blocks until a request may be sent, then takes a token and a concurrency slot."""
+        start = time.perf_counter()
+        with self.condition:
+            self.waiting += 1
+            try:
+                wait = self.next_wait(time.monotonic())
+                while wait != 0:
+                    self.condition.wait(wait)
+                    wait = self.next_wait(time.monotonic())
+            finally:
+                self.waiting -= 1
+            if self.rate is not None: self.tokens -= 1
+            self.in_flight += 1
+            self.counters["requests"] += 1
+        waited = time.perf_counter() - start
+        if waited > 0.001: timings.record("scheduler_wait", start, waited)
+
+    def release(self, outcome):
+        """Frees a slot and adapts the limit. outcome is 'ok', 'neutral' (e.g. a 401) or a congestion counter name."""
+        now = time.monotonic()
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.counters["succeeded"] += 1
+                self.completions.append(now)
+                while self.completions and self.completions[0] < now - THROUGHPUT_WINDOW_SECONDS:
+                    self.completions.popleft()
+            elif outcome != "neutral":
+                self.counters[outcome] += 1
+                if now - self.decreased_at >= DECREASE_INTERVAL_SECONDS:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.decreased_at = now
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Holds back every request for 'seconds' (from a Retry-After header)."""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff: a random delay up to BACKOFF_BASE_SECONDS * 2**attempt."""
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    @contextmanager
+    def request(self, send):
+        """Sends send() (which returns a requests.Response) when admitted, retrying throttled and failed attempts.
+
+        Yields the final response; its slot is held until the with-block ends, so a streamed
+        body counts against the concurrency limit while it downloads. Connection errors that
+        persist through every retry are re-raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                response = send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.release("connection_errors")
+                if attempt >= self.max_retries:
+                    self.count("failed")
+                    raise
+                delay = self.backoff(attempt)
+            except BaseException:
+                self.release("neutral")
+                self.count("failed")
+                raise
+            else:
+                outcome = RETRYABLE_STATUSES.get(response.status_code, "ok" if response.status_code < 400 else "neutral")
+                if outcome in ("ok", "neutral") or attempt >= self.max_retries:
+                    try:
+                        yield response
+                    finally:
+                        self.release(outcome)
+                        if outcome != "ok": self.count("failed")
+                    return
+                retry_after = parse_retry_after(response.headers.get('retry-after'))
+                response.close()
+                self.release(outcome)
+                delay = self.backoff(attempt)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, RETRY_AFTER_MAX_SECONDS))
+                    self.pause(delay)
+            attempt += 1
+            self.count("retries")
+            start = time.perf_counter()
+            time.sleep(delay)
+            timings.record("scheduler_wait", start, delay, retry=attempt)
+
+    def count(self, counter):
+        with self.condition:
+            self.counters[counter] += 1
+
+    def stats(self):
+        """Returns the counters plus the current limit, in-flight and queued requests, and recent throughput."""
+        now = time.monotonic()
+        with self.condition:
+            window = min(THROUGHPUT_WINDOW_SECONDS, max(now - self.started_at, 1e-9))
+            recent = sum(1 for done in self.completions if done >= now - window)
+            return dict(self.counters, concurrency_limit=round(self.limit, 2), in_flight=self.in_flight, queue_depth=self.waiting,
+                        throughput_per_second=round(recent / window, 2))
+
+    def summary(self):
+        """Returns the stats as one line for the status bar or stderr."""
+        stats = self.stats()
+        text = f"API: {stats['requests']} requests, {stats['throughput_per_second']}/s"
+        if stats['retries']:
+            text += f", {stats['retries']} retried ({stats['throttled']} throttled, {stats['server_errors']} server errors, {stats['connection_errors']} connection errors)"
+        if stats['failed']:
+            text += f", {stats['failed']} failed"
+        return text + f", concurrency {stats['concurrency_limit']:g}, {stats['queue_depth']} queued"
+
+_request_scheduler = None
+_request_scheduler_lock = threading.Lock()
+
+def get_request_scheduler():
+    """Returns the process-wide RequestScheduler, configured from config.json."""
+    global _request_scheduler
+    with _request_scheduler_lock:
+        if _request_scheduler is None:
+            config = load_config()
+            _request_scheduler = RequestScheduler(requests_per_minute=config.get('api_requests_per_minute', DEFAULT_API_REQUESTS_PER_MINUTE),
+                                                  burst=config.get('api_burst', DEFAULT_API_BURST),
+                                                  max_concurrency=config.get('api_max_concurrency', HTTP_POOL_SIZE),
+                                                  max_retries=config.get('api_max_retries', DEFAULT_API_MAX_RETRIES))
+        return _request_scheduler
+
+def post_graphql(bearer_token, query, variables, operation_name, timeout=30):
+    """Posts a GraphQL query through the request scheduler and returns the 'data' dict, raising GraphQLError on API errors."""
+    payload = { "query": query, "variables": variables, "operationName": operation_name }
+    start = None
+    def send():
+        nonlocal start
+        _connect_time.seconds = 0.0
+        start = time.perf_counter()
+        return get_http_session().post(API_URL, headers=build_headers(bearer_token), json=payload, timeout=timeout)
+    with get_request_scheduler().request(send) as response:
+        total = time.perf_counter() - start
+    # response.elapsed runs until the headers arrive; whatever is left is reading the body.
+    headers_at = min(response.elapsed.total_seconds(), total)
+    timings.record("server", start + _connect_time.seconds, headers_at - _connect_time.seconds, operation=operation_name)
+    timings.record("download", start + headers_at, total - headers_at, bytes=len(response.content), operation=operation_name)
+    response.raise_for_status()
     try:
-        # Only encode if the token is not empty
-        encoded_token = base64.b64encode(bearer_token.encode()).decode() if bearer_token else ""
-    except Exception as e:
-        print(f"Error encoding token: {e}")
-        messagebox.showerror("Token Error", f"Could not encode token for saving:\n{e}")
-        encoded_token = "" # Save empty if encoding fails
+        with timings.span("json_decode", operation=operation_name):
+            raw_data = decode_json(response.content)
+    except ValueError as e:
+        e.response_text = response.text[:500] # Kept for error display
+        raise
+    if 'errors' in raw_data:
+        error_message = raw_data['errors'][0]['message'] if raw_data['errors'] else "Unknown API error"
+        raise GraphQLError(error_message)
+    return raw_data.get('data') or {}
 
-    current_config = load_config()
-    current_config['bearer_token_b64'] = encoded_token # Save encoded token under new key
-    # Optionally remove old plain text key if it exists
-    current_config.pop('bearer_token', None)
-    save_config(current_config)
-    # --- End Token Encoding ---
+def decode_json(data):
+    """Decodes a JSON document from bytes, using orjson when it is installed."""
+    orjson = optional_module('orjson')
+    if orjson is not None:
+        return orjson.loads(data) # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return json.loads(data)
 
+# --- Streaming Responses ---
+# Large books are parsed straight off the socket: the book's header fields arrive first and
+# then its editions one at a time, so memory grows with one edition rather than the whole
+# response. The queries list 'editions' last, which is what makes the header come first.
+STREAM_CHUNK_SIZE = 64 * 1024
+_json_decoder = json.JSONDecoder()
 
-    status_var.set(f"Fetching data for ID: {book_id_int}...")
-    window.update_idletasks()
-
-    # API Setup
-    api_url = "https://api.hardcover.app/v1/graphql"
-    # --- <<< USE THE NEW COMPREHENSIVE QUERY >>> ---
-    graphql_query = """
-    query MyQuery($bookId: Int!) {
-      books(where: {id: {_eq: $bookId}}) {
-        id
-        title
-        slug
-        editions_count
-        description
-        contributions {
-          author {
-            name
-          }
-        }
-        editions {
-          id
-          score
-          edition_format
-          asin
-          isbn_10
-          isbn_13
-          pages
-          release_date
-          image {
-            url
-          }
-          book_mappings {
-            external_id
-            platform {
-              name
-            }
-          }
-          publisher {
-            name
-          }
-          reading_format {
-            format
-          }
-          language {
-            language
-          }
-        }
-        default_audio_edition {
-          id
-          edition_format
-        }
-        default_cover_edition {
-          id
-          edition_format
-        }
-        default_ebook_edition {
-          id
-          edition_format
-        }
-        default_physical_edition {
-          id
-          edition_format
-        }
-      }
-    }
+class JSONStreamReader:
+    """Pull parser over an iterable of byte chunks.
+
+    Containers are walked with members()/items(); every other value (including whole
+    nested objects such as one edition) is decoded in one go by value().
     """
-    # --- <<< END NEW QUERY >>> ---
 
-    payload = { "query": graphql_query, "variables": { "bookId": book_id_int }, "operationName": "MyQuery" }
-    headers = { "accept": "application/json", "authorization": f"Bearer {bearer_token}", "content-type": "application/json", "user-agent": "Python Hardcover Librarian Tool V1.0" } # Updated UA
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
 
-    # --- API Request & Processing (largely same, but uses new display function) ---
-    try:
-        response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+    def _fill(self):
+        """Appends the next chunk to the buffer, dropping what has been consumed. Returns False at the end of input."""
+        if self.eof: return False
+        chunk = next(self.chunks, None)
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        if chunk is None:
+            self.eof = True
+            self.buffer += self.utf8.decode(b"", final=True)
+            return False
+        self.bytes_read += len(chunk)
+        self.buffer += self.utf8.decode(chunk)
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character without consuming it ('' at the end of input)."""
+        while True:
+            buffer, pos = self.buffer, self.pos
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            self.pos = pos
+            if pos < len(buffer): return buffer[pos]
+            if not self._fill(): return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Decodes and returns the next complete value."""
+        self.peek()
+        while True:
+            try:
+                result, end = _json_decoder.raw_decode(self.buffer, self.pos)
+                # A number cut off by the chunk boundary ("3." of "3.25") still decodes, so only
+                # accept a value once the character after it shows that it has really ended.
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in ",]} \t\r\n"):
+                    self.pos = end
+                    return result
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self._fill()
+
+    def members(self):
+        """Iterates over an object's keys. The caller must consume each key's value before the next step."""
+        self.expect('{')
+        first = True
+        while True:
+            if self.peek() == '}':
+                self.pos += 1
+                return
+            if not first: self.expect(',')
+            key = self.value()
+            self.expect(':')
+            first = False
+            yield key
+
+    def items(self):
+        """Iterates once per array element. The caller must consume each element before the next step."""
+        self.expect('[')
+        first = True
+        while True:
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            if not first: self.expect(',')
+            first = False
+            yield
+
+def stream_graphql_events(chunks):
+    """Parses a GraphQL response incrementally and yields events:
+
+    ('book', header) when a book's 'editions' list starts (or the book ends without one),
+    ('edition', edition) for each edition, and ('book_end', book) once the book is complete.
+    book_end carries the same dict as the header event, plus any fields listed after
+    'editions'; 'editions' itself is never stored. Top-level edition lists (paged queries)
+    yield only 'edition' events. Raises GraphQLError if the response reports errors.
+    """
+    reader = JSONStreamReader(chunks)
+    for key in reader.members():
+        if key == 'errors':
+            errors = reader.value()
+            raise GraphQLError(errors[0].get('message', "Unknown API error") if errors else "Unknown API error")
+        if key != 'data' or reader.peek() != '{':
+            reader.value()
+            continue
+        for root in reader.members():
+            if reader.peek() != '[':
+                reader.value()
+                continue
+            for _ in reader.items():
+                if root != 'books':
+                    yield ('edition', reader.value())
+                    continue
+                if reader.peek() != '{':
+                    reader.value() # null book
+                    continue
+                book = {}
+                header_sent = False
+                for field in reader.members():
+                    if field == 'editions' and reader.peek() == '[':
+                        yield ('book', book)
+                        header_sent = True
+                        for _ in reader.items():
+                            yield ('edition', reader.value())
+                    else:
+                        book[field] = reader.value()
+                if not header_sent: yield ('book', book)
+                yield ('book_end', book)
+
+def post_graphql_stream(bearer_token, query, variables, operation_name, timeout=30):
+    """Like post_graphql, but yields stream_graphql_events while the response body is still downloading."""
+    payload = { "query": query, "variables": variables, "operationName": operation_name }
+    start = None
+    def send():
+        nonlocal start
+        _connect_time.seconds = 0.0
+        start = time.perf_counter()
+        return get_http_session().post(API_URL, headers=build_headers(bearer_token), json=payload, timeout=timeout, stream=True)
+    with get_request_scheduler().request(send) as response, response:
+        headers_at = time.perf_counter()
+        timings.record("server", start + _connect_time.seconds, headers_at - start - _connect_time.seconds, operation=operation_name)
         response.raise_for_status()
-        raw_data = response.json()
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        events = stream_graphql_events(chunks)
+        try:
+            yield from events
+        finally:
+            # Covers reading, decoding and whatever the consumer did between events.
+            timings.record("stream", headers_at, time.perf_counter() - headers_at, operation=operation_name)
 
-        status_var.set("Data received. Formatting output...")
-        window.update_idletasks()
-
-        # Process API Response
-        if 'errors' in raw_data:
-             error_message = raw_data['errors'][0]['message'] if raw_data['errors'] else "Unknown API error"
-             status_var.set(f"API Error: {error_message}")
-             messagebox.showerror("API Error", f"The API returned an error:\n{error_message}")
-             display_error_message(output_viewer, f"API Error:\n{error_message}")
-             return
-
-        books_data = raw_data.get('data', {}).get('books', [])
-
-        if not books_data:
-             no_book_message = f"No book found for ID {book_id_int}."
-             status_var.set(no_book_message)
-             messagebox.showinfo("Info", no_book_message)
-             display_error_message(output_viewer, no_book_message)
-             return
-
-        book = books_data[0]
-        book_title = book.get('title', 'N/A')
-        actual_book_slug = book.get('slug')
-
-        # --- Generate and Display Using New Function ---
-        display_formatted_data(output_viewer, book) # Call the updated display function
-
-        status_var.set(f"Success! Displaying data for '{book_title}'.")
-
-        # Show Link to main book page (Same)
-        if actual_book_slug:
-            link_text = f"View '{book_title}' on Hardcover"
-            link_label.config(text=link_text, foreground=COLOR_ACCENT_FG)
-            link_label.unbind("<Button-1>")
-            link_label.bind("<Button-1>", lambda e, s=actual_book_slug: open_book_link(s))
-            link_label.grid()
-        else:
-            link_label.grid_remove()
+# --- Response Cache ---
+# Book responses are kept in a SQLite file next to config.json, keyed by Book ID plus a
+# hash of the requested fields, so changing the query never serves stale shapes.
+# The same file keeps a snapshot of every fetched book (the latest version and the one
+# before it, compressed) so a re-fetch can be diffed against what was seen last time.
+# Snapshots do not expire and are not counted against cache_max_mb.
+CACHE_FILE_NAME = "cache.sqlite3"
+DEFAULT_CACHE_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_CACHE_MAX_MB = 200
+DEFAULT_RESOLVE_TTL_SECONDS = 30 * 24 * 60 * 60 # An ISBN or ASIN found on a book rarely moves to another one
+BOOK_VERSIONS_SIZE = 32 # Book dicts whose cache row is remembered for book_model_key (see remember_book_version)
 
+class OfflineCacheMiss(Exception):
+    """Raised in offline mode when a book has not been fetched before."""
 
-    # Exception Handling (Same)
-    except requests.exceptions.Timeout: error_msg = "Network Error: The request timed out."; status_var.set("Network Error: Timeout."); link_label.grid_remove(); messagebox.showerror("Network Error", error_msg); display_error_message(output_viewer, error_msg)
-    except requests.exceptions.RequestException as e: error_msg = f"Network/API Error:\n{e}"; status_var.set("Network/API Error."); link_label.grid_remove(); messagebox.showerror("API Error", f"Failed to connect or get data from the API.\nCheck connection and token.\nError: {e}"); display_error_message(output_viewer, error_msg)
-    except json.JSONDecodeError:
-        error_msg = "Invalid JSON received from API."
-        status_var.set("Error: Invalid JSON received.")
-        link_label.grid_remove()
-        try: error_msg += f"\n\nResponse Text:\n{response.text[:500]}..."
-        except Exception: pass
-        messagebox.showerror("Data Error", "The response from the API was not valid JSON.")
-        display_error_message(output_viewer, error_msg)
-    except Exception as e:
-        error_msg = f"An unexpected error occurred:\n{type(e).__name__}: {e}"
-        status_var.set("An unexpected error occurred.")
-        link_label.grid_remove()
-        messagebox.showerror("Error", error_msg)
-        print(f"Traceback for unexpected error:\n", flush=True); traceback.print_exc()
-        display_error_message(output_viewer, error_msg)
+def get_cache_path():
+    """Gets the path of the response cache, in the same directory as the config file."""
+    return os.path.join(os.path.dirname(get_config_path()), CACHE_FILE_NAME)
 
+def snapshot_payload(book):
+    """Returns a book as canonical JSON bytes: sorted keys and editions ordered by ID, so fetch order never counts as a change."""
+    editions = book.get('editions')
+    if isinstance(editions, list):
+        book = dict(book, editions=sorted(editions, key=lambda e: (e.get('id') or 0) if isinstance(e, dict) else 0))
+    return json.dumps(book, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
 
-# --- GUI Setup ---
-if __name__ == "__main__":
-    window = tk.Tk()
-    window.title("Hardcover Librarian Tool") # New Title
-    window.geometry("850x700") # Adjusted size
-    window.config(bg=COLOR_BACKGROUND)
+def query_hash(query_text):
+    """Returns a short, whitespace-insensitive hash of a GraphQL document."""
+    normalized = " ".join(query_text.split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
 
-    # Style Configuration (Same)
-    style = ttk.Style()
-    default_themes = ['clam', 'alt', 'default']
-    selected_theme = None
-    for theme in default_themes:
-        if theme in style.theme_names():
-            try: style.theme_use(theme); selected_theme = theme; print(f"Using ttk theme: {theme}"); break
-            except tk.TclError: continue
-    if not selected_theme: print("No suitable ttk theme found, using system default.")
-    style.configure('.', background=COLOR_BACKGROUND, foreground=COLOR_FOREGROUND)
-    style.configure('TFrame', background=COLOR_BACKGROUND)
-    style.configure('TLabel', background=COLOR_BACKGROUND, foreground=COLOR_LABEL_FG, anchor=tk.W)
-    style.configure('TNotebook', background=COLOR_BACKGROUND, borderwidth=0, tabposition='nw')
-    style.configure('TNotebook.Tab', background=COLOR_WIDGET_BG, foreground=COLOR_LABEL_FG, padding=[10, 5], borderwidth=1)
-    style.map('TNotebook.Tab', background=[('selected', COLOR_BACKGROUND), ('!selected', COLOR_WIDGET_BG)], foreground=[('selected', COLOR_HEADER_FG), ('!selected', COLOR_LABEL_FG)], expand=[('selected', [1, 1, 1, 0])])
-    style.configure('TButton', background=COLOR_WIDGET_BG, foreground=COLOR_FOREGROUND, padding=8, font=tkFont.Font(weight='bold'))
-    style.map('TButton', background=[('active', COLOR_ACCENT_FG), ('pressed', COLOR_ACCENT_FG)], foreground=[('active', COLOR_BACKGROUND), ('pressed', COLOR_BACKGROUND)])
-    style.configure('TEntry', foreground=COLOR_WIDGET_FG, fieldbackground=COLOR_WIDGET_BG, insertcolor=COLOR_FOREGROUND, borderwidth=1, relief=tk.FLAT)
-    style.map('TEntry', relief=[('focus', tk.SOLID)])
+class ResponseCache:
+    """Size-bounded SQLite cache of book responses with per-entry TTL and LRU eviction. Safe to share between threads."""
 
-    # Main Notebook (Same)
-    notebook = ttk.Notebook(window, style='TNotebook')
-    notebook.pack(pady=10, padx=10, fill="both", expand=True)
+    def __init__(self, path, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            book_id INTEGER NOT NULL, query_hash TEXT NOT NULL, payload TEXT NOT NULL, size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL,
+            PRIMARY KEY (book_id, query_hash))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+            book_id INTEGER NOT NULL, query_hash TEXT NOT NULL, content_hash TEXT NOT NULL, data BLOB NOT NULL,
+            fetched_at REAL NOT NULL, changed_at REAL NOT NULL, previous_data BLOB, previous_fetched_at REAL,
+            PRIMARY KEY (book_id, query_hash))""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS link_checks (
+            url TEXT PRIMARY KEY, ok INTEGER NOT NULL, status TEXT NOT NULL, checked_at REAL NOT NULL)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS identifier_resolutions (
+            identifier TEXT PRIMARY KEY, matches TEXT NOT NULL, resolved_at REAL NOT NULL, expires_at REAL NOT NULL)""")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
 
-    # Tab 1: Input & Controls (Same layout)
-    input_frame = ttk.Frame(notebook, padding="20", style='TFrame')
-    notebook.add(input_frame, text='Fetch Data')
-    input_frame.columnconfigure(1, weight=1)
-    token_label = ttk.Label(input_frame, text="Bearer Token:")
-    token_label.grid(row=0, column=0, sticky=tk.W, pady=5, padx=(0, 10))
-    token_entry = ttk.Entry(input_frame, width=60, show="*", style='TEntry')
-    token_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
-    book_id_label = ttk.Label(input_frame, text="Book ID:")
-    book_id_label.grid(row=1, column=0, sticky=tk.W, pady=5, padx=(0, 10))
-    book_id_entry = ttk.Entry(input_frame, width=20, style='TEntry')
-    book_id_entry.grid(row=1, column=1, sticky=tk.W, pady=5)
-    fetch_button = ttk.Button(input_frame, text="Fetch Data", command=fetch_and_process_data, style='TButton', width=15)
-    fetch_button.grid(row=2, column=0, columnspan=2, pady=(25, 15))
-    status_var = tk.StringVar()
-    status_label = ttk.Label(input_frame, textvariable=status_var, wraplength=750) # Wider wrap
-    status_label.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
-    link_font = tkFont.Font(family="Segoe UI", size=10, underline=True) # Consider generic font families later
-    link_label = ttk.Label(input_frame, text="", style='TLabel', cursor="hand2", font=link_font)
-    link_label.grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=(5, 10))
-    link_label.grid_remove()
+    def get(self, book_id, qhash, allow_expired=False):
+        """Returns (book, fetched_at) for a cached book, or None. Expired entries count as misses unless allow_expired."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT payload, fetched_at, expires_at FROM responses WHERE book_id = ? AND query_hash = ?", (book_id, qhash)).fetchone()
+            if row is None or (row[2] < now and not allow_expired):
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE book_id = ? AND query_hash = ?", (now, book_id, qhash))
+            self.conn.commit()
+        return json.loads(row[0]), row[1]
 
-    # Tab 2: Output Viewer (Same layout)
-    output_frame = ttk.Frame(notebook, padding="5", style='TFrame')
-    notebook.add(output_frame, text='Output')
-    output_frame.rowconfigure(0, weight=1)
-    output_frame.columnconfigure(0, weight=1)
-    output_viewer = scrolledtext.ScrolledText(
-        output_frame, wrap=tk.WORD, state=tk.DISABLED, bg=COLOR_WIDGET_BG, fg=COLOR_FOREGROUND,
-        insertbackground=COLOR_FOREGROUND, selectbackground=COLOR_ACCENT_FG, selectforeground=COLOR_BACKGROUND,
-        borderwidth=0, highlightthickness=1, highlightbackground=COLOR_BACKGROUND, highlightcolor=COLOR_ACCENT_FG,
-        padx=8, pady=8, font=("Consolas", 10) # Monospace preferred for alignment
-    )
-    output_viewer.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
-    output_viewer.tag_bind("hyperlink", "<Enter>", on_link_enter)
-    output_viewer.tag_bind("hyperlink", "<Leave>", on_link_leave)
-    output_viewer.bind("<Button-1>", on_link_click)
+    def put(self, book_id, qhash, book, ttl_seconds=None):
+        """Stores a book response, evicting least recently used entries if the cache grows past max_bytes. Returns its fetched_at."""
+        payload = json.dumps(book, ensure_ascii=False, separators=(',', ':'))
+        size = len(payload)
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE book_id = ? AND query_hash = ?", (book_id, qhash)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", (book_id, qhash, payload, size, now, expires_at, now))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self.conn.commit()
+        return now
 
-    # --- Load Configuration on Startup ---
-    # --- MODIFIED TO HANDLE BASE64 ---
-    config = load_config()
-    saved_token_b64 = config.get('bearer_token_b64', '')
-    saved_token_plain = config.get('bearer_token', '') # Check for old plain text token
-    final_token = ""
+    def _evict(self, target_bytes):
+        """Deletes expired entries, then least recently used ones, until the cache is below target_bytes. Caller holds the lock."""
+        self.conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.total_bytes <= target_bytes:
+            return
+        victims = []
+        freed = 0
+        for book_id, qhash, size in self.conn.execute("SELECT book_id, query_hash, size FROM responses ORDER BY last_access"):
+            if self.total_bytes - freed <= target_bytes: break
+            victims.append((book_id, qhash))
+            freed += size
+        self.conn.executemany("DELETE FROM responses WHERE book_id = ? AND query_hash = ?", victims)
+        self.total_bytes -= freed
+        print(f"Cache: evicted {len(victims)} entries ({freed} bytes).", file=sys.stderr)
 
-    if saved_token_b64:
-        try:
-            final_token = base64.b64decode(saved_token_b64).decode()
-            print("Decoded token from bearer_token_b64.")
-        except Exception as e:
-            print(f"Error decoding saved token: {e}. Please re-enter token.")
-            # Optionally clear the bad token from config here
-    elif saved_token_plain: # If b64 fails or not present, check for old plain one
-        print("Using plain text token from config (will be encoded on next save).")
-        final_token = saved_token_plain
+    def put_snapshot(self, book_id, qhash, book):
+        """Records a fetched version of a book. Returns True if its content differs from the latest snapshot (or there was none).
 
-    if final_token:
-        token_entry.insert(0, final_token)
-        status_var.set("Loaded saved token. Enter Book ID.")
-    else:
-         status_var.set("Enter token and Book ID, then press 'Fetch Data'.")
-    # --- End Base64 Load ---
+        An unchanged book only has its fetched_at bumped, so 'previous' always holds the last
+        version that actually differed.
+        """
+        payload = snapshot_payload(book)
+        content_hash = hashlib.sha1(payload).hexdigest()
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT content_hash, data, fetched_at FROM snapshots WHERE book_id = ? AND query_hash = ?", (book_id, qhash)).fetchone()
+            if row is not None and row[0] == content_hash:
+                self.conn.execute("UPDATE snapshots SET fetched_at = ? WHERE book_id = ? AND query_hash = ?", (now, book_id, qhash))
+                self.conn.commit()
+                return False
+            previous_data, previous_fetched_at = (row[1], row[2]) if row else (None, None)
+            self.conn.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (book_id, qhash, content_hash, zlib.compress(payload), now, now, previous_data, previous_fetched_at))
+            self.conn.commit()
+        return True
+
+    def get_snapshot(self, book_id, qhash, include_previous=True):
+        """Returns the latest snapshot of a book as a dict (book, content_hash, fetched_at, changed_at, previous, previous_fetched_at), or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT content_hash, data, fetched_at, changed_at, previous_data, previous_fetched_at FROM snapshots WHERE book_id = ? AND query_hash = ?",
+                                    (book_id, qhash)).fetchone()
+        if row is None:
+            return None
+        previous = json.loads(zlib.decompress(row[4])) if include_previous and row[4] is not None else None
+        return { "book": json.loads(zlib.decompress(row[1])), "content_hash": row[0], "fetched_at": row[2], "changed_at": row[3],
+                 "previous": previous, "previous_fetched_at": row[5] }
+
+    def snapshot_states(self, book_ids, qhash):
+        """Returns {book_id: (content_hash, changed_at, has_previous)} for the given books without decompressing anything."""
+        states = {}
+        with self.lock:
+            for start in range(0, len(book_ids), 500): # Stay under SQLite's bound-parameter limit
+                ids = book_ids[start:start + 500]
+                query = f"SELECT book_id, content_hash, changed_at, previous_data IS NOT NULL FROM snapshots WHERE query_hash = ? AND book_id IN ({','.join('?' * len(ids))})"
+                for book_id, content_hash, changed_at, has_previous in self.conn.execute(query, (qhash, *ids)):
+                    states[book_id] = (content_hash, changed_at, bool(has_previous))
+        return states
+
+    def iter_books(self, qhash, page_size=200):
+        """Yields every cached book fetched with a query profile, expired or not, in Book ID order. Reads one page per lock hold."""
+        after = -1
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT book_id, payload FROM responses WHERE query_hash = ? AND book_id > ? ORDER BY book_id LIMIT ?",
+                                         (qhash, after, page_size)).fetchall()
+            for after, payload in rows:
+                yield json.loads(payload)
+            if len(rows) < page_size:
+                return
+
+    def get_link_checks(self, urls, ttl_seconds):
+        """Returns {url: LinkStatus} for the URLs checked within the last ttl_seconds."""
+        results = {}
+        oldest = time.time() - ttl_seconds
+        with self.lock:
+            for start in range(0, len(urls), 500):
+                batch = urls[start:start + 500]
+                query = f"SELECT url, ok, status, checked_at FROM link_checks WHERE checked_at >= ? AND url IN ({','.join('?' * len(batch))})"
+                for url, ok, status, checked_at in self.conn.execute(query, (oldest, *batch)):
+                    results[url] = LinkStatus(bool(ok), status, checked_at)
+        return results
+
+    def put_link_checks(self, results):
+        """Stores conclusive link check results ({url: LinkStatus} with ok True or False)."""
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO link_checks VALUES (?, ?, ?, ?)",
+                                  [(url, int(status.ok), status.status, status.checked_at) for url, status in results.items()])
+            self.conn.commit()
+
+    def get_resolutions(self, identifiers, allow_expired=False):
+        """Returns {identifier: [(book_id, edition_id), ...]} for the identifiers resolved before; an empty list means 'not found'."""
+        results = {}
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(identifiers), 500):
+                batch = identifiers[start:start + 500]
+                query = f"SELECT identifier, matches, expires_at FROM identifier_resolutions WHERE identifier IN ({','.join('?' * len(batch))})"
+                for identifier, matches, expires_at in self.conn.execute(query, batch):
+                    if expires_at >= now or allow_expired:
+                        results[identifier] = [tuple(pair) for pair in json.loads(matches)]
+        return results
+
+    def put_resolutions(self, resolutions, ttl_seconds=DEFAULT_RESOLVE_TTL_SECONDS):
+        """Stores {identifier: [(book_id, edition_id), ...]}.
+
+        Identifiers that were not found expire after the response TTL instead, so books added to Hardcover later are picked up.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO identifier_resolutions VALUES (?, ?, ?, ?)",
+                                  [(identifier, json.dumps(matches), now, now + (ttl_seconds if matches else self.ttl_seconds))
+                                   for identifier, matches in resolutions.items()])
+            self.conn.commit()
+
+    def stats(self):
+        """Returns a dict with entry count, size and number of expired entries, plus the number of snapshots, link checks and identifier resolutions."""
+        with self.lock:
+            count, expired = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(expires_at < ?), 0) FROM responses", (time.time(),)).fetchone()
+            snapshots, snapshot_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data) + COALESCE(LENGTH(previous_data), 0)), 0) FROM snapshots").fetchone()
+            link_checks = self.conn.execute("SELECT COUNT(*) FROM link_checks").fetchone()[0]
+            resolutions = self.conn.execute("SELECT COUNT(*) FROM identifier_resolutions").fetchone()[0]
+        return { "path": self.path, "entries": count, "expired": expired, "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                 "snapshots": snapshots, "snapshot_bytes": snapshot_bytes, "link_checks": link_checks, "identifier_resolutions": resolutions }
+
+    def clear(self):
+        """Removes every cached response, snapshot, link check and identifier resolution."""
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.execute("DELETE FROM snapshots")
+            self.conn.execute("DELETE FROM link_checks")
+            self.conn.execute("DELETE FROM identifier_resolutions")
+            self.conn.commit()
+            self.total_bytes = 0
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide ResponseCache, or None if it is disabled in the config or cannot be opened."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            config = load_config()
+            if not config.get('cache_enabled', True):
+                return None
+            try:
+                _response_cache = ResponseCache(get_cache_path(),
+                                                ttl_seconds=config.get('cache_ttl_seconds', DEFAULT_CACHE_TTL_SECONDS),
+                                                max_bytes=int(config.get('cache_max_mb', DEFAULT_CACHE_MAX_MB) * 1024 * 1024))
+            except sqlite3.Error as e:
+                print(f"Warning: Could not open response cache: {e}", file=sys.stderr)
+                return None
+        return _response_cache
+
+# --- Compact Records ---
+# Batch audits can hold tens of thousands of books at once, and a book as decoded JSON is a
+# tree of small dicts. BookRecord/EditionRecord keep the same data in __slots__ objects:
+# nested single-field objects collapse to one value ({"name": ...} -> "name"), platform and
+# publisher names are interned, and mappings become (platform, external_id) tuples. Values
+# that do not have the expected shape (e.g. extra fields from a custom query profile) are
+# kept verbatim in 'extra', so to_dict() always gives back exactly what the API sent.
+_NO_FIT = object() # Returned by a packer when a value does not have the expected shape
+_field_orders = {} # Interned tuples of field names, shared by every record with the same fields
+
+def intern_name(value):
+    """Interns short repeated strings (platform, publisher, language names)."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def pack_single(key, intern=False):
+    """Packer/unpacker pair for an object with exactly one non-empty string field, e.g. {"name": "Tor"} <-> "Tor"."""
+    def pack(value):
+        if value is None: return None
+        if isinstance(value, dict) and len(value) == 1 and isinstance(value.get(key), str) and value[key]:
+            return intern_name(value[key]) if intern else value[key]
+        return _NO_FIT
+    def unpack(value):
+        return None if value is None else { key: value }
+    return pack, unpack
+
+def pack_mappings(value):
+    """[{"external_id": ..., "platform": {"name": ...}}, ...] -> ((platform_name, external_id), ...)."""
+    if not isinstance(value, list): return _NO_FIT
+    packed = []
+    for mapping in value:
+        if not isinstance(mapping, dict) or len(mapping) != 2 or 'external_id' not in mapping: return _NO_FIT
+        platform = mapping.get('platform', _NO_FIT)
+        if platform is None:
+            name = None
+        elif isinstance(platform, dict) and len(platform) == 1 and isinstance(platform.get('name'), str):
+            name = intern_name(platform['name'])
+        else:
+            return _NO_FIT
+        packed.append((name, mapping['external_id']))
+    return tuple(packed)
+
+def unpack_mappings(value):
+    return [{ "external_id": external_id, "platform": None if name is None else { "name": name } } for name, external_id in value]
+
+def pack_default_edition(value):
+    """{"id": 1, "edition_format": "Ebook"} -> (1, "Ebook")."""
+    if value is None: return None
+    if isinstance(value, dict) and value.keys() == {'id', 'edition_format'}:
+        return (value['id'], intern_name(value['edition_format']))
+    return _NO_FIT
+
+def unpack_default_edition(value):
+    return None if value is None else { "id": value[0], "edition_format": value[1] }
+
+def pack_contributions(value):
+    """[{"author": {"name": ...}}, ...] -> (name, ...)."""
+    if not isinstance(value, list): return _NO_FIT
+    names = []
+    for contribution in value:
+        author = contribution.get('author', _NO_FIT) if isinstance(contribution, dict) and len(contribution) == 1 else _NO_FIT
+        if not (isinstance(author, dict) and len(author) == 1 and isinstance(author.get('name'), str)): return _NO_FIT
+        names.append(author['name'])
+    return tuple(names)
+
+def unpack_contributions(value):
+    return [{ "author": { "name": name } } for name in value]
+
+_same = lambda value: value
+
+class CompactRecord:
+    """Base for slotted records built from API dicts. FIELDS lists (api_field, slot, pack, unpack).
+
+    'fields' holds the API field names the source dict had, in order. Slots for fields that were
+    absent are None. get() and keys() behave like the source dict, so code written for dicts
+    also accepts records; hot paths should read the slots directly.
+    """
+    __slots__ = ('fields', 'extra')
+    FIELDS = ()
+    SLOT_FOR = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        extra = None
+        for api_field, slot, pack, _ in cls.FIELDS:
+            value = data.get(api_field, _NO_FIT)
+            packed = None if value is _NO_FIT else pack(value)
+            if packed is _NO_FIT:
+                if extra is None: extra = {}
+                extra[api_field] = value
+                packed = None
+            setattr(record, slot, packed)
+        for key in data:
+            if key not in cls.SLOT_FOR:
+                if extra is None: extra = {}
+                extra[key] = data[key]
+        keys = tuple(data)
+        record.fields = _field_orders.setdefault(keys, keys)
+        record.extra = extra
+        return record
+
+    def keys(self):
+        return self.fields
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def get(self, key, default=None):
+        """Returns the field in its API shape, like dict.get."""
+        if key not in self.fields: return default
+        if self.extra is not None and key in self.extra: return self.extra[key]
+        slot, unpack = self.SLOT_FOR[key]
+        return unpack(getattr(self, slot))
+
+    def to_dict(self):
+        """Rebuilds the API dict this record was made from."""
+        return { key: self.get(key) for key in self.fields }
+
+def define_record_fields(cls, fields):
+    """Sets FIELDS/SLOT_FOR on a record class from (api_field, slot, pack, unpack) tuples."""
+    cls.FIELDS = tuple(fields)
+    cls.SLOT_FOR = { api_field: (slot, unpack) for api_field, slot, _, unpack in fields }
+
+class EditionRecord(CompactRecord):
+    """One edition. 'mappings' is a tuple of (platform_name, external_id)."""
+    __slots__ = ('id', 'score', 'edition_format', 'asin', 'isbn_10', 'isbn_13', 'pages', 'release_date',
+                 'image_url', 'publisher', 'reading_format', 'language', 'mappings')
+
+class BookRecord(CompactRecord):
+    """One book. 'editions' is a tuple of EditionRecords; default_*_edition are (id, edition_format) tuples; 'authors' are names."""
+    __slots__ = ('id', 'title', 'slug', 'editions_count', 'description', 'authors', 'default_audio_edition',
+                 'default_cover_edition', 'default_ebook_edition', 'default_physical_edition', 'editions')
+
+    def to_dict(self):
+        book = super().to_dict()
+        if isinstance(book.get('editions'), tuple):
+            book['editions'] = [edition.to_dict() for edition in book['editions']]
+        return book
+
+def pack_editions(value):
+    if not isinstance(value, list) or not all(isinstance(e, dict) for e in value): return _NO_FIT
+    return tuple(EditionRecord.from_dict(e) for e in value)
+
+define_record_fields(EditionRecord, [
+    ("id", "id", _same, _same), ("score", "score", _same, _same),
+    ("edition_format", "edition_format", intern_name, _same), ("asin", "asin", _same, _same),
+    ("isbn_10", "isbn_10", _same, _same), ("isbn_13", "isbn_13", _same, _same), ("pages", "pages", _same, _same),
+    ("release_date", "release_date", _same, _same), ("image", "image_url", *pack_single('url')),
+    ("publisher", "publisher", *pack_single('name', intern=True)), ("reading_format", "reading_format", *pack_single('format', intern=True)),
+    ("language", "language", *pack_single('language', intern=True)), ("book_mappings", "mappings", pack_mappings, unpack_mappings),
+])
+define_record_fields(BookRecord, [
+    ("id", "id", _same, _same), ("title", "title", _same, _same), ("slug", "slug", _same, _same),
+    ("editions_count", "editions_count", _same, _same), ("description", "description", _same, _same),
+    ("contributions", "authors", pack_contributions, unpack_contributions),
+    *[(name, name, pack_default_edition, unpack_default_edition) for name in
+      ("default_audio_edition", "default_cover_edition", "default_ebook_edition", "default_physical_edition")],
+    ("editions", "editions", pack_editions, _same), # get('editions') gives the EditionRecords themselves
+])
+
+# --- Cross-Book Identifier Index ---
+# Maps normalized identifiers (ISBN, ASIN, platform IDs) to the (book_id, edition_id) that
+# first used them and the latest other edition with them, so an identifier reused by another
+# edition is spotted with one lookup, from either side. To stay small with millions of
+# identifiers, the table stores only a 64-bit hash of each identifier, two packed
+# book/edition pairs and a holder count in flat arrays, plus each book's (hash, pair) list.
+IDENTIFIER_INDEX_FILE_NAME = "identifier_index.bin"
+IDENTIFIER_INDEX_MAGIC = b"HCII"
+IDENTIFIER_INDEX_VERSION = 3
+
+def isbn10_to_isbn13(isbn10):
+    """Converts a valid ISBN-10 to ISBN-13. Returns None if the ISBN-10 is invalid."""
+    if len(isbn10) != 10 or not isbn10[:9].isdigit() or not (isbn10[9].isdigit() or isbn10[9] in 'Xx'):
+        return None
+    check = sum((10 - i) * (10 if c in 'Xx' else int(c)) for i, c in enumerate(isbn10))
+    if check % 11 != 0:
+        return None
+    core = "978" + isbn10[:9]
+    total = sum(int(c) * (1 if i % 2 == 0 else 3) for i, c in enumerate(core))
+    return core + str((10 - total % 10) % 10)
+
+def isbn13_to_isbn10(isbn13):
+    """Converts a valid 978-prefixed ISBN-13 to ISBN-10. Returns None for 979 ISBNs, which have no ISBN-10."""
+    if not is_valid_isbn13(isbn13) or not isbn13.startswith("978"):
+        return None
+    check = (11 - sum((10 - i) * int(c) for i, c in enumerate(isbn13[3:12])) % 11) % 11
+    return isbn13[3:12] + ("X" if check == 10 else str(check))
+
+def is_valid_isbn13(isbn13):
+    """Checks an ISBN-13's length, digits and checksum."""
+    if len(isbn13) != 13 or not isbn13.isdigit():
+        return False
+    return sum(int(c) * (1 if i % 2 == 0 else 3) for i, c in enumerate(isbn13)) % 10 == 0
+
+def normalize_isbn(value):
+    """Returns the ISBN-13 form of an ISBN-10 or ISBN-13 (hyphens and spaces ignored), or None if invalid."""
+    if not value: return None
+    cleaned = str(value).replace('-', '').replace(' ', '').strip()
+    if len(cleaned) == 10:
+        return isbn10_to_isbn13(cleaned)
+    return cleaned if is_valid_isbn13(cleaned) else None
+
+def edition_identifiers(edition):
+    """Returns the normalized identifiers of an edition, e.g. 'isbn:9780…', 'asin:B00…', 'goodreads:123'."""
+    identifiers = set()
+    for field in ('isbn_13', 'isbn_10'):
+        isbn = normalize_isbn(edition.get(field))
+        if isbn: identifiers.add("isbn:" + isbn)
+    asin = edition.get('asin')
+    if asin: identifiers.add("asin:" + str(asin).strip().upper())
+    if isinstance(edition, EditionRecord) and not (edition.extra and 'book_mappings' in edition.extra):
+        for platform_name, external_id in edition.mappings or ():
+            if platform_name and external_id:
+                identifiers.add(f"{platform_name.lower()}:{str(external_id).strip()}")
+        return identifiers
+    for mapping in edition.get('book_mappings') or []:
+        if not isinstance(mapping, dict): continue
+        platform = mapping.get('platform')
+        platform_name = platform.get('name') if platform and isinstance(platform, dict) else None
+        external_id = mapping.get('external_id')
+        if platform_name and external_id:
+            identifiers.add(f"{platform_name.lower()}:{str(external_id).strip()}")
+    return identifiers
+
+class IdentifierIndex:
+    """Open-addressing hash table from identifier hashes to up to two packed (book_id, edition_id) owners. Thread-safe.
+
+    Each slot keeps the first edition recorded with the identifier, the latest other one (enough
+    to flag both sides of a duplicate) and how many editions carry it. The rare identifiers
+    carried by more than two editions keep the ones in between in 'overflow', so a slot that loses
+    an owner is refilled without searching other books. book_entries keeps each book's
+    (identifier hash, packed owner) pairs, so re-recording a book drops the identifiers it no
+    longer carries.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.lock = threading.Lock()
+        self._allocate(capacity)
+        self.count = 0
+        self.book_entries = {} # book_id -> array('Q') of interleaved identifier hash, packed owner
+        self.overflow = {} # identifier hash -> array('Q') of the owners between the first and the latest
+        self.dirty = False
+        self.generation = 0 # Bumped on every change, so memoized book models know their conflict flags are stale
+
+    def _allocate(self, capacity):
+        self.keys = array('Q', bytes(8 * capacity)) # 0 marks an empty slot
+        self.values = array('Q', bytes(8 * capacity)) # First owner
+        self.others = array('Q', bytes(8 * capacity)) # Latest other owner, 0 if none
+        self.holders = array('L', bytes(array('L').itemsize * capacity)) # Editions carrying the identifier
+        self.mask = capacity - 1
+
+    @staticmethod
+    def hash_identifier(identifier):
+        """Returns a non-zero 64-bit hash of an identifier."""
+        return int.from_bytes(hashlib.blake2b(identifier.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+    def _find_slot(self, key):
+        """Returns the slot holding key, or the empty slot where it would go (linear probing)."""
+        keys, mask = self.keys, self.mask
+        slot = key & mask
+        while keys[slot] and keys[slot] != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self):
+        old = (self.keys, self.values, self.others, self.holders)
+        self._allocate(len(self.keys) * 2)
+        for key, value, other, holders in zip(*old):
+            if key:
+                slot = self._find_slot(key)
+                self.keys[slot], self.values[slot], self.others[slot], self.holders[slot] = key, value, other, holders
+
+    def _delete(self, slot):
+        """Empties a slot, shifting later entries of its probe run back so lookups never stop at the hole."""
+        keys, mask = self.keys, self.mask
+        columns = (keys, self.values, self.others, self.holders)
+        hole, probe = slot, slot
+        while True:
+            probe = (probe + 1) & mask
+            if not keys[probe]: break
+            home = keys[probe] & mask
+            # The entry at probe may move into the hole unless its home lies cyclically in (hole, probe]
+            if (home <= hole or home > probe) if hole < probe else (home <= hole and home > probe):
+                for column in columns:
+                    column[hole] = column[probe]
+                hole = probe
+        for column in columns:
+            column[hole] = 0
+        self.count -= 1
+
+    def owners(self, identifier):
+        """Returns the (book_id, edition_id) pairs recorded for an identifier: none, the first owner, or it and the latest other one."""
+        key = self.hash_identifier(identifier)
+        with self.lock:
+            slot = self._find_slot(key)
+            if not self.keys[slot]: return []
+            packed = [self.values[slot]] + ([self.others[slot]] if self.others[slot] else [])
+        return [(value >> 32, value & 0xFFFFFFFF) for value in packed]
+
+    def lookup(self, identifier):
+        """Returns the first (book_id, edition_id) recorded for an identifier, or None."""
+        owners = self.owners(identifier)
+        return owners[0] if owners else None
+
+    def record_editions(self, book_id, editions, append=False):
+        """Records the identifiers of a book's editions, replacing whatever was recorded for that book before.
+
+        With append=True the editions are added to the book's earlier ones instead, for callers
+        that record a book a page at a time.
+        """
+        entries = array('Q')
+        for edition in editions:
+            if not isinstance(edition, (dict, CompactRecord)) or not edition.get('id'): continue
+            packed = (int(book_id) << 32) | int(edition.get('id'))
+            for identifier in sorted(edition_identifiers(edition)):
+                entries.extend((self.hash_identifier(identifier), packed))
+        with self.lock:
+            if append:
+                self._append(int(book_id), entries)
+            else:
+                self._record(int(book_id), entries)
+
+    def _record(self, book_id, entries):
+        """Replaces a book's entries (interleaved identifier hash, packed owner). Caller holds the lock."""
+        old_entries = self.book_entries.get(book_id, array('Q'))
+        if old_entries == entries: return
+        new_packs = {}
+        for key, packed in zip(entries[0::2], entries[1::2]):
+            new_packs.setdefault(key, []).append(packed)
+        for key in dict.fromkeys(old_entries[0::2]):
+            if key not in new_packs: self._update(key, book_id, [])
+        for key, packs in new_packs.items():
+            self._update(key, book_id, packs)
+        if entries:
+            self.book_entries[book_id] = entries
+        else:
+            self.book_entries.pop(book_id, None)
+        self.dirty = True
+        self.generation += 1
+
+    def _append(self, book_id, entries):
+        """Adds entries to a book's, skipping ones it already has. Caller holds the lock."""
+        book_entries = self.book_entries.get(book_id, array('Q'))
+        recorded = set(zip(book_entries[0::2], book_entries[1::2]))
+        new_packs, added = {}, array('Q')
+        for key, packed in zip(entries[0::2], entries[1::2]):
+            if (key, packed) in recorded: continue
+            recorded.add((key, packed))
+            new_packs.setdefault(key, []).append(packed)
+            added.extend((key, packed))
+        if not added: return
+        for key, packs in new_packs.items():
+            self._update(key, book_id, packs, append=True)
+        self.book_entries[book_id] = book_entries + added
+        self.dirty = True
+        self.generation += 1
+
+    def _update(self, key, book_id, packs, append=False):
+        """Replaces (or with append, adds to) a book's holders of one identifier, keeping another book's first owner in first place."""
+        slot = self._find_slot(key)
+        if self.keys[slot]:
+            others = self.others[slot]
+            held = [self.values[slot], *self.overflow.get(key, ()), *([others] if others else [])]
+        elif packs:
+            self.keys[slot] = key
+            self.count += 1
+            held = []
+        else:
+            return
+        if append:
+            held += packs
+        else:
+            kept = [value for value in held if value >> 32 != book_id]
+            held = packs + kept if held and held[0] >> 32 == book_id else kept + packs
+        if not held:
+            self.overflow.pop(key, None)
+            self._delete(slot)
+            return
+        self.values[slot], self.others[slot], self.holders[slot] = held[0], (held[-1] if len(held) > 1 else 0), len(held)
+        if len(held) > 2:
+            self.overflow[key] = array('Q', held[1:-1])
+        else:
+            self.overflow.pop(key, None)
+        if self.count * 2 > len(self.keys): # Keep the load factor at or below 50%
+            self._grow()
+
+    def merge(self, other):
+        """Adds another index's books as if they had been recorded after this index's (replacing books both have)."""
+        with self.lock:
+            for book_id, entries in other.book_entries.items():
+                self._record(book_id, entries)
+
+    def __getstate__(self): # Picklable, so worker processes can return partial indexes
+        return { name: value for name, value in self.__dict__.items() if name != 'lock' }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def find_conflicts(self, edition):
+        """Returns (identifier, book_id, edition_id) for each identifier of this edition that another edition also carries."""
+        edition_id = edition.get('id')
+        conflicts = []
+        for identifier in sorted(edition_identifiers(edition)):
+            other = next((owner for owner in self.owners(identifier) if owner[1] != edition_id), None)
+            if other is not None:
+                conflicts.append((identifier, other[0], other[1]))
+        return conflicts
+
+    def save(self, path):
+        """Writes the index to a file (atomically, via a temporary file)."""
+        with self.lock:
+            book_ids = array('Q', self.book_entries)
+            entry_counts = array('Q', (len(entries) for entries in self.book_entries.values()))
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(struct.pack('<4sIQQQ', IDENTIFIER_INDEX_MAGIC, IDENTIFIER_INDEX_VERSION, len(self.keys), self.count, len(book_ids)))
+                for column in (self.keys, self.values, self.others, array('Q', self.holders), book_ids, entry_counts, *self.book_entries.values()):
+                    column.tofile(f)
+                f.write(struct.pack('<Q', len(self.overflow)))
+                for column in (array('Q', self.overflow), array('Q', (len(owners) for owners in self.overflow.values())), *self.overflow.values()):
+                    column.tofile(f)
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Reads an index written by save(). Older files (version 1 kept first owners only, version 2 no overflow) are upgraded on load."""
+        index = cls(capacity=1)
+        with open(path, 'rb') as f:
+            magic, version = struct.unpack('<4sI', f.read(8))
+            if magic != IDENTIFIER_INDEX_MAGIC or version not in (1, 2, IDENTIFIER_INDEX_VERSION):
+                raise ValueError("Not an identifier index file (or an unsupported version).")
+            capacity, count = struct.unpack('<QQ', f.read(16))
+            book_count = struct.unpack('<Q', f.read(8))[0] if version > 1 else 0
+            index.keys = array('Q'); index.keys.fromfile(f, capacity)
+            index.values = array('Q'); index.values.fromfile(f, capacity)
+            if version > 1:
+                index.others = array('Q'); index.others.fromfile(f, capacity)
+                holders = array('Q'); holders.fromfile(f, capacity)
+                index.holders = array('L', holders)
+                book_ids = array('Q'); book_ids.fromfile(f, book_count)
+                entry_counts = array('Q'); entry_counts.fromfile(f, book_count)
+                for book_id, entry_count in zip(book_ids, entry_counts):
+                    entries = array('Q'); entries.fromfile(f, entry_count)
+                    index.book_entries[book_id] = entries
+                if version > 2:
+                    overflow_count = struct.unpack('<Q', f.read(8))[0]
+                    overflow_keys = array('Q'); overflow_keys.fromfile(f, overflow_count)
+                    overflow_counts = array('Q'); overflow_counts.fromfile(f, overflow_count)
+                    for key, owner_count in zip(overflow_keys, overflow_counts):
+                        owners = array('Q'); owners.fromfile(f, owner_count)
+                        index.overflow[key] = owners
+            else:
+                index.others = array('Q', bytes(8 * capacity))
+                index.holders = array('L', (1 if key else 0 for key in index.keys))
+                for key, value in zip(index.keys, index.values):
+                    if key: index.book_entries.setdefault(value >> 32, array('Q')).extend((key, value))
+                index.dirty = True # Save in the new format
+        index.mask = capacity - 1
+        index.count = count
+        if version == 2:
+            index._rebuild_overflow()
+        return index
+
+    def _rebuild_overflow(self):
+        """Fills 'overflow' from book_entries, for files saved before it was kept."""
+        for entries in self.book_entries.values():
+            for key, packed in zip(entries[0::2], entries[1::2]):
+                slot = self._find_slot(key)
+                if self.holders[slot] > 2 and packed not in (self.values[slot], self.others[slot]):
+                    self.overflow.setdefault(key, array('Q')).append(packed)
+        self.dirty = True # Save in the new format
+
+_identifier_index = None
+_identifier_index_lock = threading.Lock()
+
+def get_identifier_index_path():
+    """Gets the path of the identifier index, next to the response cache."""
+    return os.path.join(os.path.dirname(get_config_path()), IDENTIFIER_INDEX_FILE_NAME)
+
+def get_identifier_index():
+    """Returns the process-wide IdentifierIndex, loading the saved one on first use."""
+    global _identifier_index
+    with _identifier_index_lock:
+        if _identifier_index is None:
+            path = get_identifier_index_path()
+            if os.path.exists(path):
+                try:
+                    _identifier_index = IdentifierIndex.load(path)
+                except (OSError, ValueError, struct.error, EOFError) as e:
+                    print(f"Warning: Could not load identifier index {path}: {e}", file=sys.stderr)
+            if _identifier_index is None:
+                _identifier_index = IdentifierIndex()
+        return _identifier_index
+
+def save_identifier_index():
+    """Saves the identifier index if it has changed since it was loaded or last saved."""
+    if _identifier_index is not None and _identifier_index.dirty:
+        try:
+            _identifier_index.save(get_identifier_index_path())
+        except OSError as e:
+            print(f"Warning: Could not save identifier index: {e}", file=sys.stderr)
+
+def record_book_identifiers(book_id, editions, append=False):
+    """Adds fetched editions to the identifier index (see IdentifierIndex.record_editions)."""
+    if book_id is not None and editions:
+        get_identifier_index().record_editions(book_id, editions, append=append)
+
+_book_versions = OrderedDict() # id(book) -> (book, (book_id, query hash, fetched_at)), most recently used last
+
+def remember_book_version(book, book_id, qhash, fetched_at):
+    """Notes which response cache row a book dict came from, so book_model_key need not hash its content."""
+    _book_versions[id(book)] = (book, (book_id, qhash, fetched_at)) # Holding the book keeps its id from being reused
+    _book_versions.move_to_end(id(book))
+    if len(_book_versions) > BOOK_VERSIONS_SIZE:
+        _book_versions.popitem(last=False)
+
+def book_version(book):
+    """Returns (book_id, query hash, fetched_at) for a book dict read from or written to the response cache, or None."""
+    entry = _book_versions.get(id(book))
+    return entry[1] if entry is not None and entry[0] is book else None
+
+def store_fetched_book(book_id, profile, book):
+    """Caches and snapshots a freshly fetched book and adds its editions to the identifier index."""
+    record_book_identifiers(book_id, book.get('editions'))
+    cache = get_response_cache()
+    if cache:
+        qhash = profile_hash(profile)
+        remember_book_version(book, book_id, qhash, cache.put(book_id, qhash, book))
+        cache.put_snapshot(book_id, qhash, book)
+
+def get_book_snapshot(book_id, profile=DEFAULT_QUERY_PROFILE, include_previous=True):
+    """Returns the latest snapshot of a book (see ResponseCache.get_snapshot), or None."""
+    cache = get_response_cache()
+    return cache.get_snapshot(book_id, profile_hash(profile), include_previous=include_previous) if cache else None
+
+def fetch_with_changes(fetch, book_id, profile=DEFAULT_QUERY_PROFILE):
+    """Runs fetch(), which must go to the API, and returns (book, diff against the book's previous snapshot).
+
+    The diff is empty when this fetch found the book unchanged, and None when the book was
+    not found or has never been fetched before.
+    """
+    started = time.time()
+    book = fetch()
+    snapshot = get_book_snapshot(book_id, profile) if book is not None else None
+    if snapshot is None:
+        return book, None
+    if snapshot["changed_at"] < started:
+        return book, diff_books(book, book)
+    return book, diff_books(snapshot["previous"], book) if snapshot["previous"] is not None else None
+
+def get_cached_book(book_id, allow_expired=False, profile=DEFAULT_QUERY_PROFILE):
+    """Returns (book, fetched_at) from the response cache, or None on a miss."""
+    cache = get_response_cache()
+    if not cache: return None
+    qhash = profile_hash(profile)
+    cached = cache.get(book_id, qhash, allow_expired=allow_expired)
+    if cached is not None:
+        remember_book_version(cached[0], book_id, qhash, cached[1])
+    return cached
+
+def fetch_book(bearer_token, book_id, timeout=30, force_refresh=False, offline=False, profile=DEFAULT_QUERY_PROFILE):
+    """Fetches a single book by ID, using the response cache. Returns the book data, or None if no book has that ID."""
+    if not force_refresh or offline:
+        cached = get_cached_book(book_id, allow_expired=offline, profile=profile)
+        if cached is not None:
+            record_book_identifiers(book_id, cached[0].get('editions'))
+            return cached[0]
+    if offline:
+        raise OfflineCacheMiss(f"Book ID {book_id} has not been fetched before.")
+    data = post_graphql(bearer_token, build_query('book', profile), { "bookId": book_id }, "MyQuery", timeout=timeout)
+    books_data = data.get('books', [])
+    book = books_data[0] if books_data else None
+    if book is not None:
+        store_fetched_book(book_id, profile, book)
+    return book
+
+def fetch_book_paged(bearer_token, book_id, progress=None, page_size=EDITION_PAGE_SIZE, timeout=30, profile=DEFAULT_QUERY_PROFILE):
+    """Fetches a book as a header plus pages of editions, reporting each stage through progress(kind, data).
+
+    progress is called with ('header', book) once, then ('page', editions) for each later page,
+    and should return False to stop early. Returns the assembled book (also stored in the
+    response cache), None if no book has that ID, or None if stopped early.
+    """
+    data = post_graphql(bearer_token, build_query('header', profile), { "bookId": book_id, "limit": page_size }, "BookHeader", timeout=timeout)
+    books_data = data.get('books', [])
+    if not books_data:
+        return None
+    book = books_data[0]
+    editions = list(book.get('editions') or [])
+    record_book_identifiers(book_id, editions) # Before rendering, so shared-identifier flags see them
+    if progress and progress('header', book) is False:
+        return None
+    last_page_size = len(editions)
+    while last_page_size == page_size:
+        data = post_graphql(bearer_token, build_query('page', profile), { "bookId": book_id, "limit": page_size, "offset": len(editions) }, "EditionsPage", timeout=timeout)
+        page = data.get('editions') or []
+        last_page_size = len(page)
+        if not page: break
+        editions.extend(page)
+        record_book_identifiers(book_id, page, append=True)
+        if progress and progress('page', page) is False:
+            return None
+    book = dict(book, editions=editions)
+    store_fetched_book(book_id, profile, book)
+    return book
+
+def fetch_books_batch(bearer_token, book_ids, timeout=30, force_refresh=False, offline=False, profile=DEFAULT_QUERY_PROFILE):
+    """Fetches several books, serving cached ones locally and the rest in one round-trip. Returns a dict of book ID -> book data."""
+    books_by_id = {}
+    missing = []
+    for book_id in book_ids:
+        cached = None if (force_refresh and not offline) else get_cached_book(book_id, allow_expired=offline, profile=profile)
+        if cached is not None:
+            books_by_id[book_id] = cached[0]
+            record_book_identifiers(book_id, cached[0].get('editions'))
+        else: missing.append(book_id)
+    if missing and not offline:
+        data = post_graphql(bearer_token, build_query('batch', profile), { "bookIds": missing }, "BatchBooks", timeout=timeout)
+        for book in data.get('books', []):
+            if not isinstance(book, dict): continue
+            books_by_id[book.get('id')] = book
+            store_fetched_book(book.get('id'), profile, book)
+    return books_by_id
+
+def stream_books_batch(bearer_token, book_ids, timeout=30, profile=DEFAULT_QUERY_PROFILE):
+    """Fetches several books in one round-trip and yields their stream_graphql_events as the response arrives.
+
+    Streamed books are not written to the response cache, since that needs the whole book in
+    memory. Callers that want identifiers indexed must record each edition themselves.
+    """
+    yield from post_graphql_stream(bearer_token, build_query('batch', profile), { "bookIds": list(book_ids) }, "BatchBooks", timeout=timeout)
+
+# --- Identifier Resolver ---
+# Intake lists name books by ISBN or ASIN. Each value is normalized to the same key
+# edition_identifiers uses ('isbn:<ISBN-13>' for both ISBN forms, 'asin:<ASIN>'), looked up
+# in the resolution cache, and the rest are sent in batches to one editions query each.
+# Every key that was asked for is cached, found or not, so re-running a list only queries
+# what is new. Offline, keys missing from the cache fall back to the identifier index
+# (only the first edition seen with an identifier is recorded there).
+DEFAULT_RESOLVE_BATCH_SIZE = 100 # Identifiers per editions query
+
+def normalize_identifier(value):
+    """Returns the key ('isbn:<ISBN-13>' or 'asin:<ASIN>') of an ISBN-10, ISBN-13 or ASIN, or None if the value is none of them.
+
+    Hyphens and spaces are ignored. Digit strings are read as ISBNs and must pass the checksum.
+    """
+    cleaned = str(value).replace('-', '').replace(' ', '').strip().upper()
+    if len(cleaned) in (10, 13) and cleaned[:-1].isdigit():
+        isbn = normalize_isbn(cleaned)
+        return "isbn:" + isbn if isbn else None
+    if len(cleaned) == 10 and cleaned.isascii() and cleaned.isalnum():
+        return "asin:" + cleaned
+    return None
+
+def parse_identifiers(lines, warn=None):
+    """Parses ISBNs and ASINs from lines of text, separated like Book IDs (see parse_book_ids). Returns (input, key) pairs.
+
+    Values with the same key as an earlier one are dropped. Invalid values are kept with key None and reported through warn(message).
+    """
+    entries = []
+    seen = set()
+    for line_no, line in enumerate(lines, start=1):
+        line = line.split('#', 1)[0]
+        for token in line.replace(',', ' ').split():
+            key = normalize_identifier(token)
+            if key is None:
+                if warn: warn(f"'{token}' on line {line_no} is not a valid ISBN or ASIN.")
+                entries.append((token, None))
+            elif key not in seen:
+                seen.add(key)
+                entries.append((token, key))
+    return entries
+
+def resolve_identifier_batch(bearer_token, keys, timeout=30):
+    """Looks up a batch of identifier keys with one editions query. Returns {key: sorted (book_id, edition_id) pairs} for every key."""
+    isbn13s = [key[5:] for key in keys if key.startswith("isbn:")]
+    variables = { "isbn13": isbn13s, "isbn10": [isbn10 for isbn10 in map(isbn13_to_isbn10, isbn13s) if isbn10],
+                  "asins": [key[5:] for key in keys if key.startswith("asin:")] }
+    data = post_graphql(bearer_token, RESOLVE_IDENTIFIERS_QUERY, variables, "ResolveIdentifiers", timeout=timeout)
+    matches = { key: set() for key in keys }
+    for edition in data.get('editions') or []:
+        if not isinstance(edition, (dict, CompactRecord)) or not isinstance(edition.get('book_id'), int): continue
+        for key in edition_identifiers(edition):
+            if key in matches:
+                matches[key].add((edition.get('book_id'), edition.get('id')))
+    return { key: sorted(pairs) for key, pairs in matches.items() }
+
+def resolve_identifiers(bearer_token, keys, batch_size=DEFAULT_RESOLVE_BATCH_SIZE, timeout=30, force_refresh=False, offline=False, progress=None):
+    """Resolves identifier keys to [(book_id, edition_id), ...]: from the cache, then in batched API queries. Returns {key: pairs}.
+
+    An empty list means the API has no edition with that identifier. Offline, keys that neither
+    the cache nor the identifier index know are left out. progress(resolved, total) is called
+    after the cache lookup and after each batch; returning False stops early.
+    """
+    cache = get_response_cache()
+    resolutions = cache.get_resolutions(keys, allow_expired=offline) if cache and not (force_refresh and not offline) else {}
+    if offline:
+        index = get_identifier_index()
+        for key in keys:
+            owners = index.owners(key) if key not in resolutions else None
+            if owners:
+                resolutions[key] = sorted(owners)
+        return resolutions
+    missing = [key for key in keys if key not in resolutions]
+    if progress is not None and progress(len(resolutions), len(keys)) is False:
+        return resolutions
+    with timings.span("resolve_identifiers", identifiers=len(missing)):
+        for batch in chunked(missing, batch_size):
+            found = resolve_identifier_batch(bearer_token, batch, timeout=timeout)
+            if cache: cache.put_resolutions(found)
+            resolutions.update(found)
+            if progress is not None and progress(len(resolutions), len(keys)) is False:
+                break
+    return resolutions
+
+def resolution_records(entries, resolutions):
+    """Turns parse_identifiers entries and their resolutions into one JSON-friendly record per input value.
+
+    status is 'resolved', 'not_found', 'invalid' (not an ISBN or ASIN) or 'unknown' (offline and never resolved).
+    """
+    records = []
+    for value, key in entries:
+        record = { "input": value, "identifier": key, "status": None, "book_ids": [], "edition_ids": [] }
+        if key is None:
+            record["status"] = "invalid"
+        elif key not in resolutions:
+            record["status"] = "unknown"
+        else:
+            pairs = resolutions[key]
+            record["status"] = "resolved" if pairs else "not_found"
+            record["book_ids"] = sorted({ book_id for book_id, _ in pairs })
+            record["edition_ids"] = [edition_id for _, edition_id in pairs]
+        records.append(record)
+    return records
+
+def resolved_book_ids(records):
+    """Returns the distinct Book IDs of resolution records, in input order."""
+    return list(dict.fromkeys(book_id for record in records for book_id in record["book_ids"]))
+
+def summarize_resolutions(records):
+    """One-line summary of resolution records, e.g. '95 of 100 identifiers resolved to 93 books (3 not found, 2 invalid).'"""
+    counts = { status: sum(1 for record in records if record["status"] == status) for status in ("resolved", "not_found", "invalid", "unknown") }
+    details = ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in counts.items() if count and status != "resolved")
+    return f"{counts['resolved']} of {len(records)} identifiers resolved to {len(resolved_book_ids(records))} books" + (f" ({details})." if details else ".")
+
+# --- Link Handling ---
+def open_book_link(book_slug):
+    """Opens the Hardcover book page in a web browser."""
+    if book_slug:
+        url = f"https://hardcover.app/books/{book_slug}"
+        print(f"Opening URL: {url}")
+        try:
+            webbrowser.open_new_tab(url)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open link:\n{e}")
+    else:
+        print("Error: No slug provided to open_book_link.")
+        messagebox.showwarning("Link Error", "Could not create link (missing book slug).")
+
+# --- URL Generation Helper ---
+def get_book_url(book_slug):
+    return f"https://hardcover.app/books/{book_slug}" if book_slug else None
+
+def get_edition_edit_url(book_slug, edition_id):
+    return f"https://hardcover.app/books/{book_slug}/editions/{edition_id}/edit" if book_slug and edition_id else None
+
+def get_platform_url(platform_name, external_id):
+    """Constructs a URL for a given platform and external ID."""
+    if not platform_name or not external_id: return None
+    name = platform_name.lower()
+    if isinstance(external_id, str) and external_id.startswith(('http://', 'https://')):
+        if '.' in external_id: return external_id
+        else: return None
+    ext_id_str = str(external_id)
+    if name == 'goodreads': return f"https://www.goodreads.com/book/show/{ext_id_str}"
+    if name == 'google': return f"https://books.google.com/books?id={ext_id_str}"
+    if name == 'openlibrary':
+        if ext_id_str.startswith(('/books/', '/works/')): return f"https://openlibrary.org{ext_id_str}"
+        else: return f"https://openlibrary.org/search?q={ext_id_str}"
+    return None
+
+# --- Link Health Checks ---
+# An optional stage that probes each edition's image URL and the platform links built by
+# get_platform_url. Probes share one pooled session and run on a thread pool, with at most
+# link_check_per_host requests in flight per host, so a 1,000-edition book is checked in
+# seconds without hammering any one site. HEAD is tried first; hosts that refuse it get a
+# one-byte ranged GET. Conclusive results (reachable, or 404/410) are kept in the response
+# cache database for link_check_ttl_seconds. Anything else (timeouts, 403, 429, 5xx) is
+# inconclusive: it is never flagged or cached, so the next check tries again.
+DEFAULT_LINK_CHECK_WORKERS = 64
+DEFAULT_LINK_CHECK_PER_HOST = 16
+DEFAULT_LINK_CHECK_TTL_SECONDS = 3 * 24 * 60 * 60
+LINK_CHECK_TIMEOUT = 10
+DEAD_LINK_STATUSES = (404, 410)
+LINK_DRAIN_LIMIT = 64 * 1024 # Ranged GET bodies up to this size are read so the connection can be reused
+LINK_RESULTS_MEMORY = 200000 # Most recent results kept in memory for the flag rules
+LINK_CHECK_USER_AGENT = "HardcoverLibrarian-LinkCheck/1.0"
+
+LinkStatus = namedtuple('LinkStatus', ['ok', 'status', 'checked_at']) # ok: True, False (dead) or None (inconclusive)
+
+_link_results = OrderedDict() # URL -> LinkStatus, read by the dead_image and broken_links flag columns
+_link_results_generation = 0 # Bumped whenever _link_results changes; part of the book model memo key
+
+def remember_link_results(results):
+    """Makes link check results visible to the flag rules, forgetting the oldest beyond LINK_RESULTS_MEMORY."""
+    global _link_results_generation
+    _link_results_generation += 1
+    for url, status in results.items():
+        _link_results[url] = status
+        _link_results.move_to_end(url)
+    while len(_link_results) > LINK_RESULTS_MEMORY:
+        _link_results.popitem(last=False)
+
+def forget_link_results():
+    global _link_results_generation
+    _link_results_generation += 1
+    _link_results.clear()
+
+def link_problem(url):
+    """Returns the status (e.g. '404') of a checked URL found dead, or None if it is fine or was not checked."""
+    status = _link_results.get(url) if url else None
+    return status.status if status is not None and status.ok is False else None
+
+def edition_link_urls(editions):
+    """Returns the unique image and platform URLs of the editions, in first-seen order."""
+    urls = {}
+    for edition in editions:
+        if not isinstance(edition, (dict, CompactRecord)): continue
+        image_url = get_image_url(edition)
+        if image_url: urls[image_url] = None
+        for platform_name, external_id in mapping_pairs(edition):
+            url = get_platform_url(platform_name, external_id)
+            if url: urls[url] = None
+    return list(urls)
+
+def book_link_urls(books):
+    """edition_link_urls over every edition of the books."""
+    return edition_link_urls(edition for book in books for edition in book.get('editions') or [])
+
+def interleave_by_host(urls):
+    """Orders URLs round-robin across hosts, so workers are not all queued behind one host's limit."""
+    by_host = {}
+    for url in urls:
+        by_host.setdefault(urllib.parse.urlsplit(url).netloc.lower(), []).append(url)
+    return [url for group in zip_longest(*by_host.values()) for url in group if url is not None]
+
+class LinkChecker:
+    """Checks URLs concurrently over pooled connections, with a per-host concurrency limit and a TTL cache."""
+
+    def __init__(self, max_workers=DEFAULT_LINK_CHECK_WORKERS, per_host=DEFAULT_LINK_CHECK_PER_HOST, timeout=LINK_CHECK_TIMEOUT, ttl_seconds=DEFAULT_LINK_CHECK_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.ttl_seconds = ttl_seconds
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = LINK_CHECK_USER_AGENT
+        self.host_limits = {} # host -> BoundedSemaphore(per_host)
+        self.head_refused = set() # Hosts whose HEAD failed where GET worked; they get GET straight away
+        self.lock = threading.Lock()
+
+    def host_limit(self, host):
+        with self.lock:
+            limit = self.host_limits.get(host)
+            if limit is None:
+                limit = self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+        return limit
+
+    def probe(self, url):
+        """Checks one URL with HEAD, falling back to a one-byte ranged GET. Returns a LinkStatus.
+
+        Any 4xx/5xx answer to HEAD is confirmed with the GET before the link counts as dead,
+        since many hosts mishandle HEAD (403, 404, 405, 501...) while serving GET normally.
+        """
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self.host_limit(host):
+            try:
+                head = None if host in self.head_refused else self.session.head(url, allow_redirects=True, timeout=self.timeout)
+                response = head
+                if head is None or head.status_code >= 400:
+                    response = self.session.get(url, headers={"Range": "bytes=0-0"}, allow_redirects=True, timeout=self.timeout, stream=True)
+                    length = response.headers.get('content-length')
+                    if response.status_code == 206 or (length and length.isdigit() and int(length) <= LINK_DRAIN_LIMIT):
+                        response.content # Read the small body so the connection goes back to the pool
+                    response.close()
+                    if head is not None and response.status_code < 400:
+                        self.head_refused.add(host)
+            except requests.exceptions.Timeout:
+                return LinkStatus(None, "timeout", time.time())
+            except requests.exceptions.RequestException as e:
+                return LinkStatus(None, type(e).__name__, time.time())
+        code = response.status_code
+        return LinkStatus(True if code < 400 else (False if code in DEAD_LINK_STATUSES else None), str(code), time.time())
+
+    def check(self, urls, progress=None):
+        """Checks URLs, serving fresh cached results first. Returns {url: LinkStatus} and makes the results visible to the flag rules.
+
+        progress(done, total) is called from the calling thread every few probes; it may
+        return False to stop early, in which case unchecked URLs are left out.
+        """
+        urls = list(dict.fromkeys(u for u in urls if u))
+        cache = get_response_cache()
+        results = cache.get_link_checks(urls, self.ttl_seconds) if cache else {}
+        to_probe = interleave_by_host([u for u in urls if u not in results])
+        probed = {}
+        if to_probe:
+            with timings.span("link_check", urls=len(to_probe)):
+                executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_probe)), thread_name_prefix="link-check")
+                try:
+                    futures = { executor.submit(self.probe, url): url for url in to_probe }
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        probed[futures[future]] = future.result()
+                        if progress and (done % 50 == 0 or done == len(to_probe)) and progress(done, len(to_probe)) is False:
+                            break
+                finally:
+                    executor.shutdown(wait=True, cancel_futures=True)
+        if cache and probed:
+            cache.put_link_checks({ url: status for url, status in probed.items() if status.ok is not None })
+        results.update(probed)
+        remember_link_results(results)
+        return results
+
+_link_checker = None
+_link_checker_lock = threading.Lock()
+
+def get_link_checker():
+    """Returns the process-wide LinkChecker, configured from config.json."""
+    global _link_checker
+    with _link_checker_lock:
+        if _link_checker is None:
+            config = load_config()
+            _link_checker = LinkChecker(max_workers=config.get('link_check_workers', DEFAULT_LINK_CHECK_WORKERS),
+                                        per_host=config.get('link_check_per_host', DEFAULT_LINK_CHECK_PER_HOST),
+                                        ttl_seconds=config.get('link_check_ttl_seconds', DEFAULT_LINK_CHECK_TTL_SECONDS))
+        return _link_checker
+
+def summarize_link_checks(results):
+    """Returns a one-line count of checked, dead and inconclusive links."""
+    dead = sum(1 for status in results.values() if status.ok is False)
+    unknown = sum(1 for status in results.values() if status.ok is None)
+    return f"{len(results)} links checked, {dead} dead" + (f", {unknown} inconclusive" if unknown else "")
+
+# --- Data-Quality Flag Rules ---
+# Rules are declarative: each one names a column (extracted once per collection by the
+# *_FLAG_COLUMNS functions below), a test to run over that whole column, and how to label
+# the result. Thresholds, severity and enabled state can be overridden per rule in
+# config.json under "flag_rules", e.g. {"low_score": {"threshold": 300, "severity": "info"}}.
+Flag = namedtuple('Flag', ['rule', 'text', 'severity', 'value'])
+
+SEVERITY_TAGS = { "warning": "warning_flag", "info": "info_flag" } # Severity -> text tag in the Output tab
+
+BOOK_FLAG_RULES = [
+    { "id": "no_description", "text": "[NO DESCRIPTION]", "severity": "warning", "column": "description", "test": "missing" },
+    { "id": "no_default_cover", "text": "[NO DEFAULT COVER]", "severity": "info", "column": "default_cover_edition", "test": "missing" },
+    { "id": "no_default_ebook", "text": "[NO DEFAULT EBOOK]", "severity": "info", "column": "default_ebook_edition", "test": "missing" },
+    { "id": "no_default_audio", "text": "[NO DEFAULT AUDIO]", "severity": "info", "column": "default_audio_edition", "test": "missing" },
+    { "id": "no_default_physical", "text": "[NO DEFAULT PHYSICAL]", "severity": "info", "column": "default_physical_edition", "test": "missing" },
+]
+
+EDITION_FLAG_RULES = [
+    { "id": "low_score", "text": "[LOW SCORE:{value}]", "severity": "warning", "column": "score", "test": "below", "threshold": 500 },
+    { "id": "missing_isbn", "text": "[MISSING ISBN]", "severity": "warning", "column": "isbn", "test": "missing" },
+    { "id": "no_image", "text": "[NO IMAGE]", "severity": "warning", "column": "image_url", "test": "missing" },
+    { "id": "dead_image", "text": "[DEAD IMAGE: {value}]", "severity": "warning", "column": "dead_image", "test": "nonempty" },
+    { "id": "no_pages", "text": "[NO PAGES]", "severity": "info", "column": "pages", "test": "missing" },
+    { "id": "no_release_date", "text": "[NO RELEASE DATE]", "severity": "info", "column": "release_date", "test": "missing" },
+    { "id": "no_publisher", "text": "[NO PUBLISHER]", "severity": "info", "column": "publisher", "test": "missing" },
+    { "id": "no_language", "text": "[NO LANGUAGE]", "severity": "info", "column": "language", "test": "missing" },
+    { "id": "no_format", "text": "[NO FORMAT]", "severity": "info", "column": "edition_format", "test": "missing" },
+    { "id": "dupe_platforms", "text": "[DUPE PLATFORMS: {value}]", "severity": "info", "column": "dupe_platforms", "test": "nonempty" },
+    { "id": "shared_identifiers", "text": "[SHARED IDS: {value}]", "severity": "warning", "column": "shared_identifiers", "test": "nonempty" },
+    { "id": "broken_links", "text": "[BROKEN LINKS: {value}]", "severity": "warning", "column": "broken_links", "test": "nonempty" },
+]
+
+def get_image_url(edition):
+    """Returns the edition's image URL, or None."""
+    image_info = edition.get('image')
+    return image_info.get('url') if image_info and isinstance(image_info, dict) else None
+
+def get_duplicate_platforms(edition):
+    """Returns the platform names that appear more than once in an edition's book_mappings."""
+    platform_counts = {}
+    for mapping in edition.get('book_mappings') or []:
+        if not isinstance(mapping, dict): continue
+        platform = mapping.get('platform')
+        platform_name = platform.get('name') if platform and isinstance(platform, dict) else None
+        if platform_name:
+            platform_counts[platform_name] = platform_counts.get(platform_name, 0) + 1
+    return [p for p, c in platform_counts.items() if c > 1]
+
+def get_dead_image(edition):
+    """Returns the status of the edition's image URL if a link check found it dead."""
+    return link_problem(get_image_url(edition)) if _link_results else None
+
+def get_broken_links(edition):
+    """Returns the platforms whose generated URL a link check found dead."""
+    if not _link_results: return []
+    return sorted({ platform_name for platform_name, external_id in mapping_pairs(edition) if link_problem(get_platform_url(platform_name, external_id)) })
+
+def get_shared_identifiers(edition):
+    """Describes identifiers of this edition that the identifier index has seen on another edition."""
+    return [f"{identifier} (book {book_id}, edition {edition_id})" for identifier, book_id, edition_id in get_identifier_index().find_conflicts(edition)]
+
+# Column name -> the query fields it reads. Used by the query builder, and to skip rules
+# whose fields were not requested by the current query profile.
+BOOK_FLAG_COLUMN_FIELDS = {
+    "description": ["description"],
+    "default_cover_edition": ["default_cover_edition.id"],
+    "default_ebook_edition": ["default_ebook_edition.id"],
+    "default_audio_edition": ["default_audio_edition.id"],
+    "default_physical_edition": ["default_physical_edition.id"],
+}
+
+EDITION_FLAG_COLUMN_FIELDS = {
+    "score": ["score"],
+    "isbn": ["isbn_10", "isbn_13"],
+    "image_url": ["image.url"],
+    "pages": ["pages"],
+    "release_date": ["release_date"],
+    "publisher": ["publisher.name"],
+    "language": ["language.language"],
+    "edition_format": ["edition_format"],
+    "dupe_platforms": ["book_mappings.platform.name"],
+    "shared_identifiers": ["isbn_10", "isbn_13", "asin", "book_mappings.external_id", "book_mappings.platform.name"],
+    "dead_image": ["image.url"],
+    "broken_links": ["book_mappings.external_id", "book_mappings.platform.name"],
+}
+
+# Column name -> extractor. Only the columns used by enabled rules are built.
+BOOK_FLAG_COLUMNS = {
+    "description": lambda b: b.get('description'),
+    "default_cover_edition": lambda b: b.get('default_cover_edition'),
+    "default_ebook_edition": lambda b: b.get('default_ebook_edition'),
+    "default_audio_edition": lambda b: b.get('default_audio_edition'),
+    "default_physical_edition": lambda b: b.get('default_physical_edition'),
+}
+
+EDITION_FLAG_COLUMNS = {
+    "score": lambda e: e.get('score'),
+    "isbn": lambda e: e.get('isbn_10') or e.get('isbn_13'),
+    "image_url": get_image_url,
+    "pages": lambda e: e.get('pages'),
+    "release_date": lambda e: e.get('release_date'),
+    "publisher": lambda e: e.get('publisher'),
+    "language": lambda e: e.get('language'),
+    "edition_format": lambda e: e.get('edition_format'),
+    "dupe_platforms": get_duplicate_platforms,
+    "shared_identifiers": get_shared_identifiers,
+    "dead_image": get_dead_image,
+    "broken_links": get_broken_links,
+}
+
+# The same columns read straight from BookRecord/EditionRecord slots. Records holding a value
+# in an unexpected shape (see CompactRecord.extra) fall back to the dict extractors above.
+def record_column(fast, slow):
+    return lambda record: fast(record) if record.extra is None else slow(record)
+
+def get_record_duplicate_platforms(edition):
+    """get_duplicate_platforms for an EditionRecord: one pass over its (platform, external_id) tuples."""
+    platform_counts = {}
+    for platform_name, _ in edition.mappings or ():
+        if platform_name:
+            platform_counts[platform_name] = platform_counts.get(platform_name, 0) + 1
+    return [p for p, c in platform_counts.items() if c > 1]
+
+def get_record_broken_links(edition):
+    """get_broken_links for an EditionRecord."""
+    if not _link_results: return []
+    return sorted({ platform_name for platform_name, external_id in edition.mappings or () if link_problem(get_platform_url(platform_name, external_id)) })
+
+BOOK_RECORD_COLUMNS = { name: record_column(operator.attrgetter(name), BOOK_FLAG_COLUMNS[name]) for name in BOOK_FLAG_COLUMNS }
+
+EDITION_RECORD_COLUMNS = {
+    "score": record_column(operator.attrgetter('score'), EDITION_FLAG_COLUMNS['score']),
+    "isbn": record_column(lambda e: e.isbn_10 or e.isbn_13, EDITION_FLAG_COLUMNS['isbn']),
+    "image_url": record_column(operator.attrgetter('image_url'), get_image_url),
+    "pages": record_column(operator.attrgetter('pages'), EDITION_FLAG_COLUMNS['pages']),
+    "release_date": record_column(operator.attrgetter('release_date'), EDITION_FLAG_COLUMNS['release_date']),
+    "publisher": record_column(operator.attrgetter('publisher'), EDITION_FLAG_COLUMNS['publisher']),
+    "language": record_column(operator.attrgetter('language'), EDITION_FLAG_COLUMNS['language']),
+    "edition_format": record_column(operator.attrgetter('edition_format'), EDITION_FLAG_COLUMNS['edition_format']),
+    "dupe_platforms": record_column(get_record_duplicate_platforms, get_duplicate_platforms),
+    "shared_identifiers": get_shared_identifiers, # edition_identifiers reads records directly
+    "dead_image": record_column(lambda e: link_problem(e.image_url) if _link_results else None, get_dead_image),
+    "broken_links": record_column(get_record_broken_links, get_broken_links),
+}
+
+_flag_rules = None
+
+def apply_rule_overrides(default_rules, overrides):
+    """Returns a copy of default_rules with per-rule config overrides applied."""
+    rules = []
+    for rule in default_rules:
+        rule = dict(rule)
+        override = overrides.get(rule['id'])
+        if isinstance(override, dict):
+            rule.update({k: v for k, v in override.items() if k in ('threshold', 'severity', 'enabled')})
+        if rule['severity'] not in SEVERITY_TAGS:
+            print(f"Warning: Unknown severity '{rule['severity']}' for flag rule '{rule['id']}', using 'info'.", file=sys.stderr)
+            rule['severity'] = "info"
+        if rule.get('enabled', True):
+            rules.append(rule)
+    return rules
+
+def get_flag_rules():
+    """Returns (book_rules, edition_rules) with config.json overrides applied. Loaded once per process."""
+    global _flag_rules
+    if _flag_rules is None:
+        overrides = load_config().get('flag_rules') or {}
+        _flag_rules = (apply_rule_overrides(BOOK_FLAG_RULES, overrides), apply_rule_overrides(EDITION_FLAG_RULES, overrides))
+    return _flag_rules
+
+def rule_mask(rule, column):
+    """Evaluates one rule's test over a whole column. Returns the indices of the rows it flags."""
+    test = rule['test']
+    np = optional_module('numpy')
+    if test == 'below':
+        threshold = rule['threshold']
+        if np is not None:
+            values = np.array([v if isinstance(v, (int, float)) else np.nan for v in column], dtype=float)
+            return np.flatnonzero(values < threshold).tolist() # NaN (missing score) never compares below
+        return [i for i, v in enumerate(column) if isinstance(v, (int, float)) and v < threshold]
+    if test == 'missing':
+        if np is not None: # Truthiness of an object array is taken element by element in C
+            values = np.fromiter(column, dtype=object, count=len(column))
+            return np.flatnonzero(~values.astype(bool)).tolist()
+        return [i for i, v in enumerate(column) if not v]
+    if test == 'nonempty':
+        return [i for i, v in enumerate(column) if v]
+    raise ValueError(f"Unknown flag rule test '{test}' in rule '{rule['id']}'.")
+
+def format_flag_value(value):
+    """Formats a flagged value for display inside the flag text."""
+    return ", ".join(str(v) for v in value) if isinstance(value, (list, tuple)) else value
+
+def evaluate_rules(rules, columns_spec, column_fields, rows):
+    """Evaluates rules over a list of records in one columnar pass. Returns a list of Flag lists aligned with rows.
+
+    Rules reading a field that none of the records has (because the query profile did not
+    request it) are skipped rather than reported as missing data.
+    """
+    results = [[] for _ in rows]
+    valid = [i for i, row in enumerate(rows) if isinstance(row, (dict, CompactRecord))]
+    valid_rows = [rows[i] for i in valid]
+    if not valid_rows:
+        return results
+    present = {} # Top-level field -> whether any record has it
+    def has_field(field):
+        if field not in present:
+            present[field] = any(field in row for row in valid_rows) # Stops at the first record for requested fields
+        return present[field]
+    columns = {}
+    for rule in rules:
+        name = rule['column']
+        if not all(has_field(path.split('.', 1)[0]) for path in column_fields[name]):
+            continue
+        if name not in columns:
+            extract = columns_spec[name]
+            columns[name] = [extract(row) for row in valid_rows]
+        column = columns[name]
+        for i in rule_mask(rule, column):
+            value = column[i]
+            text = rule['text'].format(value=format_flag_value(value))
+            results[valid[i]].append(Flag(rule['id'], text, rule['severity'], value))
+    return results
+
+def evaluate_book_flags(books, rules=None):
+    """Evaluates book-level rules over a list of books (dicts or BookRecords). Returns a list of Flag lists, one per book."""
+    with timings.span("flag_evaluation", rows=len(books)):
+        columns_spec = BOOK_RECORD_COLUMNS if books and isinstance(books[0], BookRecord) else BOOK_FLAG_COLUMNS
+        return evaluate_rules(rules if rules is not None else get_flag_rules()[0], columns_spec, BOOK_FLAG_COLUMN_FIELDS, books)
+
+def evaluate_edition_flags(editions, rules=None):
+    """Evaluates edition-level rules over a list of editions (dicts or EditionRecords, from one or many books). Returns a list of Flag lists, one per edition."""
+    with timings.span("flag_evaluation", rows=len(editions)):
+        columns_spec = EDITION_RECORD_COLUMNS if editions and isinstance(editions[0], EditionRecord) else EDITION_FLAG_COLUMNS
+        return evaluate_rules(rules if rules is not None else get_flag_rules()[1], columns_spec, EDITION_FLAG_COLUMN_FIELDS, editions)
+
+def flag_to_dict(flag):
+    """Converts a Flag into a JSON-friendly dict."""
+    return { "rule": flag.rule, "severity": flag.severity, "text": flag.text, "value": flag.value }
+
+def audit_books(books):
+    """Flags a collection of books in one pass over all their editions. Returns one audit dict per book."""
+    all_editions = []
+    owners = []
+    for book_index, book in enumerate(books):
+        for edition in (book.get('editions') or []):
+            all_editions.append(edition)
+            owners.append(book_index)
+    book_flags = evaluate_book_flags(books)
+    edition_flags = evaluate_edition_flags(all_editions)
+    audits = [{ "book_flags": [flag_to_dict(f) for f in flags], "edition_flags": [], "flag_counts": {} } for flags in book_flags]
+    for edition, owner, flags in zip(all_editions, owners, edition_flags):
+        add_edition_audit(audits[owner], edition, flags)
+    for audit, flags in zip(audits, book_flags):
+        count_flags(audit, flags)
+    return audits
+
+def add_edition_audit(audit, edition, flags):
+    """Adds one edition's flags to a book's audit dict."""
+    if not flags: return
+    audit["edition_flags"].append({ "edition_id": edition.get('id'), "flags": [flag_to_dict(f) for f in flags] })
+    count_flags(audit, flags)
+
+def count_flags(audit, flags):
+    for flag in flags:
+        audit["flag_counts"][flag.rule] = audit["flag_counts"].get(flag.rule, 0) + 1
+
+# --- Snapshot Diffing ---
+# A re-fetched book is compared with its previous snapshot edition by edition (keyed by
+# edition ID). The diff is a JSON-friendly dict so batch output can carry it as-is:
+#   {"book_fields": [...], "book_flags_fixed": [...], "book_flags_introduced": [...],
+#    "editions": [{"id": 1, "status": "changed", "fields": [...], "score": [old, new],
+#                  "mappings_added": [[platform, external_id]], "mappings_removed": [...],
+#                  "flags_fixed": [rule ids], "flags_introduced": [rule ids]}, ...]}
+# "status" is "added", "removed" or "changed"; keys with nothing to report are left out.
+def mapping_pairs(edition):
+    """Returns an edition's book_mappings as a set of (platform name, external ID) pairs."""
+    pairs = set()
+    for mapping in edition.get('book_mappings') or []:
+        if not isinstance(mapping, dict): continue
+        platform = mapping.get('platform')
+        pairs.add((platform.get('name') if isinstance(platform, dict) else None, mapping.get('external_id')))
+    return pairs
+
+def flag_rule_changes(old_flags, new_flags):
+    """Returns (fixed, introduced) rule IDs between two Flag lists. A flag whose value changed (e.g. a different low score) counts as neither."""
+    old_rules = [f.rule for f in old_flags]
+    new_rules = [f.rule for f in new_flags]
+    return [r for r in old_rules if r not in new_rules], [r for r in new_rules if r not in old_rules]
+
+def sort_pairs(pairs):
+    return sorted([list(p) for p in pairs], key=lambda p: (str(p[0]), str(p[1])))
+
+def diff_books(old_book, new_book):
+    """Compares two versions of a book and returns the diff described above. Editions without an ID are ignored."""
+    old_editions = { e.get('id'): e for e in old_book.get('editions') or [] if isinstance(e, dict) and e.get('id') is not None }
+    new_editions = { e.get('id'): e for e in new_book.get('editions') or [] if isinstance(e, dict) and e.get('id') is not None }
+    changed_ids = [i for i, e in new_editions.items() if i in old_editions and old_editions[i] != e]
+    added_ids = [i for i in new_editions if i not in old_editions]
+    removed_ids = [i for i in old_editions if i not in new_editions]
+
+    # One columnar flag pass per side, over just the editions that differ
+    old_side = [old_editions[i] for i in changed_ids + removed_ids]
+    new_side = [new_editions[i] for i in changed_ids + added_ids]
+    old_flags = dict(zip(changed_ids + removed_ids, evaluate_edition_flags(old_side))) if old_side else {}
+    new_flags = dict(zip(changed_ids + added_ids, evaluate_edition_flags(new_side))) if new_side else {}
+
+    editions = []
+    for edition_id in changed_ids:
+        old, new = old_editions[edition_id], new_editions[edition_id]
+        change = { "id": edition_id, "status": "changed", "fields": sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k)) }
+        if old.get('score') != new.get('score'):
+            change["score"] = [old.get('score'), new.get('score')]
+        if 'book_mappings' in change["fields"]:
+            old_pairs, new_pairs = mapping_pairs(old), mapping_pairs(new)
+            if new_pairs - old_pairs: change["mappings_added"] = sort_pairs(new_pairs - old_pairs)
+            if old_pairs - new_pairs: change["mappings_removed"] = sort_pairs(old_pairs - new_pairs)
+        fixed, introduced = flag_rule_changes(old_flags[edition_id], new_flags[edition_id])
+        if fixed: change["flags_fixed"] = fixed
+        if introduced: change["flags_introduced"] = introduced
+        editions.append(change)
+    for edition_id in added_ids:
+        change = { "id": edition_id, "status": "added" }
+        if new_flags[edition_id]: change["flags_introduced"] = [f.rule for f in new_flags[edition_id]]
+        editions.append(change)
+    for edition_id in removed_ids:
+        change = { "id": edition_id, "status": "removed" }
+        if old_flags[edition_id]: change["flags_fixed"] = [f.rule for f in old_flags[edition_id]]
+        editions.append(change)
+
+    book_fixed, book_introduced = flag_rule_changes(*evaluate_book_flags([old_book, new_book]))
+    return {
+        "book_fields": sorted(k for k in set(old_book) | set(new_book) if k != 'editions' and old_book.get(k) != new_book.get(k)),
+        "book_flags_fixed": book_fixed,
+        "book_flags_introduced": book_introduced,
+        "editions": editions,
+    }
+
+def diff_is_empty(diff):
+    return not diff["book_fields"] and not diff["editions"]
+
+def summarize_diff(diff):
+    """Returns a one-line summary of a diff, e.g. 'editions: 2 changed, 1 added; flags: 3 fixed, 1 introduced'."""
+    if diff_is_empty(diff):
+        return "no changes"
+    counts = {}
+    fixed = len(diff["book_flags_fixed"])
+    introduced = len(diff["book_flags_introduced"])
+    for change in diff["editions"]:
+        counts[change["status"]] = counts.get(change["status"], 0) + 1
+        fixed += len(change.get("flags_fixed", ()))
+        introduced += len(change.get("flags_introduced", ()))
+    parts = ["book details changed"] if diff["book_fields"] else []
+    if counts:
+        parts.append("editions: " + ", ".join(f"{counts[status]} {status}" for status in ("changed", "added", "removed") if status in counts))
+    if fixed or introduced:
+        parts.append(f"flags: {fixed} fixed, {introduced} introduced")
+    return "; ".join(parts)
+
+def describe_edition_change(change):
+    """Returns the text of the marker shown in a changed edition's block."""
+    if change["status"] != "changed":
+        parts = [f"{change['status']} since the last fetch"]
+    else:
+        parts = []
+        if "score" in change:
+            parts.append(f"score {change['score'][0]} -> {change['score'][1]}")
+        mapping_changes = [f"+{p}:{e}" for p, e in change.get("mappings_added", ())] + [f"-{p}:{e}" for p, e in change.get("mappings_removed", ())]
+        if mapping_changes:
+            parts.append("mappings " + ", ".join(mapping_changes))
+        other = [f for f in change["fields"] if f not in ('score', 'book_mappings')]
+        if other:
+            parts.append(", ".join(other))
+    return "; ".join(parts + describe_flag_changes(change.get("flags_fixed"), change.get("flags_introduced")))
+
+def describe_flag_changes(fixed, introduced):
+    """Returns marker phrases for fixed and newly introduced flag rules."""
+    parts = []
+    if fixed:
+        parts.append("fixed " + ", ".join(fixed))
+    if introduced:
+        parts.append("new flags " + ", ".join(introduced))
+    return parts
+
+# --- Link Handling Callbacks for Output Widget ---
+def on_link_enter(event): event.widget.config(cursor="hand2")
+def on_link_leave(event): event.widget.config(cursor="")
+def on_link_click(event):
+    widget = event.widget
+    link_index = getattr(widget, 'link_index', None) # Set by render_text_model
+    if link_index is None: return
+    line, col = widget.index(f"@{event.x},{event.y}").split('.')
+    url_to_open = link_index.lookup(int(line), int(col))
+    if url_to_open:
+        print(f"Opening link: {url_to_open}")
+        try: webbrowser.open_new_tab(url_to_open)
+        except Exception as e: messagebox.showerror("Link Error", f"Could not open URL:\n{url_to_open}\nError: {e}")
+
+# --- Output Rendering ---
+# Book output is built once into a flat, tagged TextModel and then inserted into the
+# widget in large batches. Insertion is spread over several after() callbacks so the
+# first screenful appears straight away and the rest streams in without blocking Tk.
+RENDER_FIRST_CHUNK = 300 # Segments inserted synchronously (about one screenful)
+RENDER_CHUNK = 4000 # Segments per later after() batch
+RENDER_MODEL_CACHE_SIZE = 8
+
+class TextModel:
+    """A flat list of (text, tags) segments plus the line/column position of every link and block."""
+
+    def __init__(self):
+        self.segments = [] # Flattened text, tags, text, tags, ... ready for Text.insert
+        self.sealed = 0 # Segments before this position are already in a widget and must not change
+        self.link_index = LinkIndex()
+        self.blocks = [] # (key, first segment position, first line) per block, see begin_block
+        self.edition_index = EditionIndex()
+        self.block_start = 0
+        self.line = 1
+        self.col = 0
+
+    def begin_block(self, key):
+        """Starts a block (the book header, the editions heading or one edition) that patch_rendered_model can replace on its own.
+
+        Blocks start at column 0 and never share a segment with the block before them.
+        """
+        self.block_start = len(self.segments)
+        self.blocks.append((key, self.block_start, self.line))
+
+    def add(self, text, tags=()):
+        """Appends text, merging it into the previous segment when the tags match."""
+        if not text: return
+        if len(self.segments) > self.sealed and len(self.segments) > self.block_start and self.segments[-1] == tags:
+            self.segments[-2] += text
+        else:
+            self.segments.append(text)
+            self.segments.append(tags)
+        newlines = text.count("\n")
+        if newlines:
+            self.line += newlines
+            self.col = len(text) - text.rfind("\n") - 1
+        else:
+            self.col += len(text)
+
+    def add_link(self, text, url):
+        """Appends hyperlink text and records where it lands. Link text must not contain newlines."""
+        start_col = self.col
+        self.add(text, ("hyperlink",))
+        self.link_index.add(self.line, start_col, self.col, url)
+
+    def add_pair(self, label_text, value_text, url=None, value_tag="value"):
+        """Appends a 'Label: value' line, making the value a link when a URL is given."""
+        self.add(label_text, ("label",))
+        value_str = str(value_text or 'N/A')
+        if url and value_str != 'N/A':
+            self.add_link(value_str, url)
+            self.add("\n")
+        else:
+            self.add(value_str + "\n", (value_tag,))
+
+    def copy_block(self, source, number):
+        """Appends block 'number' of another model, with its links, as a block of this one."""
+        key, start, line = source.blocks[number]
+        if number + 1 < len(source.blocks):
+            end, end_line = source.blocks[number + 1][1], source.blocks[number + 1][2]
+        else:
+            end, end_line = len(source.segments), source.line
+        self.begin_block(key)
+        shift = self.line - line
+        links = source.link_index
+        for i in range(bisect.bisect_left(links.starts, (line, 0)), bisect.bisect_left(links.starts, (end_line, 0))):
+            self.link_index.add(links.starts[i][0] + shift, links.starts[i][1], links.ends[i], links.urls[i])
+        self.segments.extend(source.segments[start:end])
+        self.line += end_line - line
+        self.col = 0 # Blocks end with a newline
+
+    def segment_count(self):
+        return len(self.segments) // 2
+
+class LinkIndex:
+    """Sorted interval index over link positions; looks up the link under a line/column with one bisect."""
+
+    def __init__(self):
+        self.starts = [] # (line, start_col), kept sorted because links are added in text order
+        self.ends = []
+        self.urls = []
+
+    def add(self, line, start_col, end_col, url):
+        """Adds a link. Links must be added in text order."""
+        self.starts.append((line, start_col))
+        self.ends.append(end_col)
+        self.urls.append(url)
+
+    def lookup(self, line, col):
+        """Returns the URL of the link covering (line, col), or None."""
+        i = bisect.bisect_right(self.starts, (line, col)) - 1
+        if i >= 0 and self.starts[i][0] == line and col < self.ends[i]:
+            return self.urls[i]
+        return None
+
+    def __len__(self):
+        return len(self.urls)
+
+EDITION_FACETS = ("flag", "edition_format", "publisher", "language", "reading_format", "platform")
+NO_FACET_VALUE = "(none)"
+
+def nested_field(edition, key, field):
+    """Returns edition[key][field] (e.g. the publisher's name), or None."""
+    value = edition.get(key)
+    return value.get(field) if value.__class__ is dict else None
+
+def nested_name(edition, key, field):
+    """Returns edition[key][field], or NO_FACET_VALUE when it is missing."""
+    return nested_field(edition, key, field) or NO_FACET_VALUE
+
+class EditionIndex:
+    """Inverted index from facet values (flag rule, format, publisher, ...) to the edition blocks of a TextModel."""
+
+    def __init__(self):
+        self.postings = { facet: {} for facet in EDITION_FACETS } # facet -> value -> ascending block numbers
+        self.count = 0
+
+    def add(self, block, edition, flags):
+        """Indexes one edition block under each of its facet values. Blocks must be added in order."""
+        self.count += 1
+        postings = self.postings
+        for flag in flags:
+            postings["flag"].setdefault(flag.rule, []).append(block)
+        postings["edition_format"].setdefault(edition.get('edition_format') or NO_FACET_VALUE, []).append(block)
+        postings["publisher"].setdefault(nested_name(edition, 'publisher', 'name'), []).append(block)
+        postings["language"].setdefault(nested_name(edition, 'language', 'language'), []).append(block)
+        postings["reading_format"].setdefault(nested_name(edition, 'reading_format', 'format'), []).append(block)
+        platforms = { nested_name(mapping, 'platform', 'name') for mapping in edition.get('book_mappings') or () if mapping.__class__ is dict } or (NO_FACET_VALUE,)
+        for platform in platforms:
+            postings["platform"].setdefault(platform, []).append(block)
+
+    def values(self, facet):
+        """Returns (value, edition count) pairs for a facet, most common first."""
+        return sorted(((value, len(blocks)) for value, blocks in self.postings[facet].items()), key=lambda item: (-item[1], str(item[0])))
+
+    def select(self, criteria):
+        """Returns the block numbers of editions matching every {facet: value} in criteria, in display order."""
+        lists = sorted((self.postings[facet].get(value, []) for facet, value in criteria.items()), key=len)
+        if not lists: return []
+        matches = set(lists[0])
+        for blocks in lists[1:]:
+            matches.intersection_update(blocks)
+            if not matches: break
+        return sorted(matches)
+
+_output_fonts = {}
+
+def configure_output_tags(widget):
+    """Configures the Output tab's text tags once. Fonts are created once per process and shared."""
+    if 'bold' not in _output_fonts:
+        _output_fonts['bold'] = tkFont.Font(weight='bold')
+    bold_font = _output_fonts['bold']
+    widget.tag_configure("header", foreground=COLOR_HEADER_FG, font=bold_font)
+    widget.tag_configure("label", foreground=COLOR_LABEL_FG)
+    widget.tag_configure("value", foreground=COLOR_FOREGROUND)
+    widget.tag_configure("hyperlink", foreground=COLOR_ACCENT_FG, underline=True)
+    widget.tag_configure("separator", foreground=COLOR_SEPARATOR_FG)
+    widget.tag_configure("error", foreground=COLOR_ERROR_FG)
+    widget.tag_configure("warning_flag", foreground=COLOR_WARNING_FG, font=bold_font) # Red/Orange
+    widget.tag_configure("info_flag", foreground=COLOR_INFO_FG, font=bold_font)    # Yellow/Orange
+    widget.tag_configure("changed", foreground=COLOR_CHANGED_FG)
+
+def edition_sort_key(edition):
+    """Sort key putting editions without a score first, then lowest score first."""
+    score = edition.get('score') if isinstance(edition, (dict, CompactRecord)) else None
+    return score if score is not None else -float('inf')
+
+def book_content_hash(book):
+    """Returns a cheap, order-stable hash of a book's data."""
+    return hashlib.sha1(json.dumps(book, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def get_author_name(book_data):
+    """Returns the name of the first credited author, or 'N/A'."""
+    contributions = book_data.get('contributions') or []
+    first_contribution = contributions[0] if isinstance(contributions, list) and contributions else None
+    if isinstance(first_contribution, dict):
+        author_info = first_contribution.get('author') # Get author, could be None or dict
+        if author_info and isinstance(author_info, dict):
+             return author_info.get('name', 'N/A')
+    return "N/A"
+
+def add_book_header(model, book_data, book_flags, diff=None):
+    """Appends the 'Book Details' section, with a summary of changes when a diff against the previous snapshot is given."""
+    model.begin_block('header')
+    model.add("Book Details:\n", ("header",))
+    model.add("-" * 50 + "\n", ("separator",))
+
+    model.add_pair("Title: ", book_data.get('title', 'N/A'))
+    model.add_pair("Author: ", get_author_name(book_data))
+
+    book_slug = book_data.get('slug')
+    slug_url = f"https://hardcover.app/books/{book_slug}" if book_slug else None
+    model.add_pair("Slug: ", book_slug, url=slug_url)
+
+    model.add_pair("Book ID: ", str(book_data.get('id', 'N/A')))
+    model.add_pair("Editions Count: ", str(book_data.get('editions_count', 'N/A')))
+    model.add_pair("Users Count: ", str(book_data.get('users_count', 'N/A')))
+    model.add_pair("Users Read Count: ", str(book_data.get('users_read_count', 'N/A')))
+
+    # --- Display Book Flags Separately ---
+    if book_flags:
+        model.add("Book Flags: ", ("label",)) # Label for the flags
+        for flag in book_flags:
+            model.add(flag.text + " ", (SEVERITY_TAGS[flag.severity],)) # Insert flags inline
+        model.add("\n") # Newline after flags
+
+    if diff is not None:
+        model.add("Changes Since Last Fetch: ", ("label",))
+        model.add(summarize_diff(diff) + "\n", ("changed",))
+        if diff["book_fields"]:
+            model.add("  Changed Fields: ", ("label",))
+            model.add(", ".join(diff["book_fields"]) + "\n", ("changed",))
+        if diff["book_flags_fixed"] or diff["book_flags_introduced"]:
+            model.add("  Book Flags: ", ("label",))
+            model.add("; ".join(describe_flag_changes(diff["book_flags_fixed"], diff["book_flags_introduced"])) + "\n", ("changed",))
+        removed = [str(c["id"]) for c in diff["editions"] if c["status"] == "removed"]
+        if removed:
+            model.add("  Removed Editions: ", ("label",))
+            model.add(", ".join(removed) + "\n", ("changed",))
+
+    # Display Description if present
+    description = book_data.get('description')
+    if description:
+         model.add("Description:\n", ("label",)) # Label on own line
+         model.add(description[:500] + ("..." if len(description) > 500 else "") + "\n", ("value",))
+
+    model.add("\n" + "=" * 50 + "\n\n", ("separator",))
+
+def add_edition_block(model, position, edition, edition_flags, book_slug, change=None):
+    """Appends the block for one edition. position is its 1-based number in the sorted list; change is its entry from diff_books, if any."""
+    model.begin_block(('edition', edition.get('id')))
+    model.add(f"\n--- Edition {position} --- \n", ("header",))
+
+    # Insert edition flags near the top
+    if edition_flags:
+        model.add("  Flags: ", ("label",))
+        for flag in edition_flags:
+             model.add(flag.text + " ", (SEVERITY_TAGS[flag.severity],))
+        model.add("\n")
+    if change:
+        model.add("  Changed: ", ("label",))
+        model.add(describe_edition_change(change) + "\n", ("changed",))
+
+    # Insert Edition Details
+    edition_id = edition.get('id')
+    edit_url = get_edition_edit_url(book_slug, edition_id)
+    model.add_pair("  ID: ", edition_id, url=edit_url)
+
+    model.add_pair("  Score: ", str(edition.get('score') or 'N/A'))
+    model.add_pair("  Format: ", edition.get('edition_format', 'N/A'))
+    model.add_pair("  ASIN: ", edition.get('asin') or 'N/A')
+    model.add_pair("  ISBN-10: ", edition.get('isbn_10') or 'N/A')
+    model.add_pair("  ISBN-13: ", edition.get('isbn_13') or 'N/A')
+    model.add_pair("  Pages: ", str(edition.get('pages', 'N/A')))
+    model.add_pair("  Release Date: ", edition.get('release_date', 'N/A'))
+
+    publisher_info = edition.get('publisher') # Get value, could be None or dict
+    model.add_pair("  Publisher: ", publisher_info.get('name', 'N/A') if publisher_info and isinstance(publisher_info, dict) else "N/A")
+    language_info = edition.get('language')
+    model.add_pair("  Language: ", language_info.get('language', 'N/A') if language_info and isinstance(language_info, dict) else "N/A")
+    reading_fmt_info = edition.get('reading_format')
+    model.add_pair("  Reading Format: ", reading_fmt_info.get('format', 'N/A') if reading_fmt_info and isinstance(reading_fmt_info, dict) else "N/A")
+
+    image_url = get_image_url(edition)
+    model.add("  Image: ", ("label",))
+    model.add_pair("", image_url, url=image_url)
+
+    mappings = edition.get('book_mappings', [])
+    model.add("  Platform Mappings:\n", ("label",))
+    if not mappings:
+        model.add("    - None found for this edition.\n", ("value",))
+    else:
+        for mapping in mappings:
+             if not isinstance(mapping, dict): continue
+             platform = mapping.get('platform')
+             platform_name = platform.get('name', 'N/A') if platform and isinstance(platform, dict) else "N/A"
+             external_id = mapping.get('external_id', 'N/A')
+
+             model.add("    - Platform: ", ("label",))
+             model.add(f"{platform_name}\n", ("value",))
+             model.add_pair("      External ID: ", external_id, url=get_platform_url(platform_name, external_id))
+
+def add_editions_heading(model, edition_count):
+    """Appends the heading above the edition blocks, or a note when there are none."""
+    model.begin_block('heading')
+    if not edition_count:
+        model.add("No editions found in the data.\n", ("value",))
+        return
+    model.add(f"Editions Found ({edition_count}) - Sorted by Score (Lowest First):\n", ("header",))
+    model.add("-" * 50 + "\n", ("separator",))
+
+def add_edition_blocks(model, editions, first_position, book_slug, changes=None):
+    """Flags a run of already-sorted editions in one columnar pass and appends their blocks. changes maps edition ID -> diff entry."""
+    all_edition_flags = evaluate_edition_flags(editions)
+    changes = changes or {}
+    for i, edition in enumerate(editions):
+        model.edition_index.add(len(model.blocks), edition, all_edition_flags[i])
+        add_edition_block(model, first_position + i, edition, all_edition_flags[i], book_slug, changes.get(edition.get('id')))
+
+def build_book_model(book_data, diff=None):
+    """Builds the full TextModel for a book: details, book flags, then editions sorted by score. A diff adds change markers."""
+    with timings.span("model_build"):
+        model = TextModel()
+        add_book_header(model, book_data, evaluate_book_flags([book_data])[0], diff)
+
+        # --- Editions Details ---
+        editions = [e for e in (book_data.get('editions') or []) if isinstance(e, dict)]
+        with timings.span("sort", editions=len(editions)):
+            editions.sort(key=edition_sort_key)
+        add_editions_heading(model, len(editions))
+        if editions:
+            changes = { c["id"]: c for c in diff["editions"] if c["status"] != "removed" } if diff else None
+            add_edition_blocks(model, editions, 1, book_data.get('slug'), changes)
+    return model
+
+_render_model_cache = OrderedDict() # book_model_key -> TextModel, most recently used last
+
+def book_model_key(book_data):
+    """Memo key for a book's TextModel. Besides the book's content, its flags depend on the link check
+    results and the identifier index, so the key carries both of their generations. A book that came
+    from the response cache is identified by its cache row; only other books have their content hashed."""
+    return (book_version(book_data) or book_content_hash(book_data), _link_results_generation, get_identifier_index().generation)
+
+def get_book_model(book_data):
+    """Returns the TextModel for a book, reusing a memoized one when the same data was shown recently."""
+    key = book_model_key(book_data)
+    model = _render_model_cache.get(key)
+    if model is not None:
+        _render_model_cache.move_to_end(key)
+        return model
+    model = build_book_model(book_data)
+    remember_book_model(key, model)
+    return model
+
+def remember_book_model(key, model):
+    """Stores a model in the memo cache under a book_model_key key."""
+    _render_model_cache[key] = model
+    _render_model_cache.move_to_end(key)
+    if len(_render_model_cache) > RENDER_MODEL_CACHE_SIZE:
+        _render_model_cache.popitem(last=False)
+
+def cancel_render(widget):
+    """Stops a render that is still streaming into the widget."""
+    job = getattr(widget, 'render_job', None)
+    if job is not None:
+        widget.after_cancel(job)
+        widget.render_job = None
+
+def render_text_model(widget, model, on_done=None):
+    """Replaces the widget's content with the model. The first chunk is inserted now, the rest in after() batches."""
+    cancel_render(widget) # A newer render replaces one still streaming in
+    widget.link_index = model.link_index
+    widget.render_model = model
+    widget.render_pos = 0
+    widget.render_on_done = on_done
+    widget.config(state=tk.NORMAL)
+    widget.delete('1.0', tk.END)
+    pump_render(widget, RENDER_FIRST_CHUNK)
+
+def after_render(widget, callback):
+    """Calls callback once the widget's current render has finished streaming in (now, if it already has)."""
+    if getattr(widget, 'render_job', None) is None:
+        callback()
+    else:
+        previous = widget.render_on_done
+        widget.render_on_done = (lambda: (previous(), callback())) if previous else callback
+
+def append_rendered(widget):
+    """Streams segments added to the widget's model since its last render (e.g. a new page of editions)."""
+    if getattr(widget, 'render_job', None) is None:
+        pump_render(widget, RENDER_FIRST_CHUNK)
+
+def pump_render(widget, count):
+    """Inserts up to 'count' pending segments of the widget's model, rescheduling itself while more remain."""
+    segments = widget.render_model.segments
+    start = widget.render_pos
+    end = min(len(segments), start + count * 2)
+    with timings.span("widget_insert", segments=(end - start) // 2):
+        widget.config(state=tk.NORMAL)
+        if end > start:
+            widget.insert(tk.END, *segments[start:end])
+        widget.config(state=tk.DISABLED)
+    widget.render_pos = end
+    widget.render_model.sealed = max(widget.render_model.sealed, end)
+    if end < len(segments):
+        widget.render_job = widget.after(1, pump_render, widget, RENDER_CHUNK)
+    else:
+        widget.render_job = None
+        on_done, widget.render_on_done = widget.render_on_done, None
+        if on_done: on_done()
+
+def block_bounds(model):
+    """Returns (first segment, end segment, start index, end index) for each of a model's blocks, as Text widget indices."""
+    bounds = []
+    for i, (key, start, line) in enumerate(model.blocks):
+        if i + 1 < len(model.blocks):
+            end, end_index = model.blocks[i + 1][1], f"{model.blocks[i + 1][2]}.0"
+        else:
+            end, end_index = len(model.segments), f"{model.line}.{model.col}"
+        bounds.append((start, end, f"{line}.0", end_index))
+    return bounds
+
+def patch_rendered_model(widget, model):
+    """Makes the widget show 'model', replacing only the blocks whose text differs from what it shows now. Returns the number of blocks replaced.
+
+    Blocks are compared position by position, so an edition that moved in the sort order
+    replaces the blocks between its old and new place. Falls back to render_text_model (and
+    returns None) while a render is still streaming in or when either model has no blocks.
+    """
+    old = getattr(widget, 'render_model', None)
+    if (old is None or not old.blocks or not model.blocks or getattr(widget, 'render_job', None) is not None
+            or widget.render_pos != len(old.segments)):
+        render_text_model(widget, model)
+        return None
+    old_bounds, new_bounds = block_bounds(old), block_bounds(model)
+    common = min(len(old_bounds), len(new_bounds))
+    replaced = 0
+    with timings.span("widget_insert", blocks=len(new_bounds)):
+        widget.config(state=tk.NORMAL)
+        # Tails first: everything above them keeps its index
+        if len(old_bounds) > common:
+            widget.delete(old_bounds[common][2], tk.END)
+        elif len(new_bounds) > common:
+            widget.insert(tk.END, *model.segments[new_bounds[common][0]:])
+        for i in reversed(range(common)): # Bottom-up, so replacing a block never moves the ones still to check
+            old_start, old_end, start_index, end_index = old_bounds[i]
+            new_start, new_end = new_bounds[i][:2]
+            segments = model.segments[new_start:new_end]
+            if old.segments[old_start:old_end] == segments: continue
+            widget.delete(start_index, end_index)
+            if segments:
+                widget.insert(start_index, *segments)
+            replaced += 1
+        widget.config(state=tk.DISABLED)
+    widget.link_index = model.link_index
+    widget.render_model = model
+    widget.render_pos = len(model.segments)
+    model.sealed = len(model.segments)
+    return replaced + abs(len(old_bounds) - len(new_bounds))
+
+def filtered_model(model, blocks):
+    """Builds a model showing the book header and only the given edition blocks of 'model', copied rather than re-formatted."""
+    view = TextModel()
+    view.edition_index = model.edition_index
+    view.copy_block(model, 0)
+    view.begin_block('heading')
+    view.add(f"Editions Matching Filters ({len(blocks)} of {model.edition_index.count}) - Sorted by Score (Lowest First):\n", ("header",))
+    view.add("-" * 50 + "\n", ("separator",))
+    for number in blocks:
+        view.copy_block(model, number)
+    return view
+
+def display_formatted_data(widget, book_data, on_done=None):
+    """Formats book data and inserts it into the text widget with colors and flags."""
+    render_text_model(widget, get_book_model(book_data), on_done=on_done)
+
+
+# --- Function to Display Error Message ---
+def display_error_message(widget, error_message):
+    """Displays an error message in the output widget."""
+    # ... (function remains the same) ...
+    try:
+        cancel_render(widget)
+        widget.link_index = None
+        widget.config(state=tk.NORMAL)
+        widget.delete('1.0', tk.END)
+        widget.tag_configure("error", foreground=COLOR_ERROR_FG) # Ensure tag exists
+        widget.insert(tk.END, "Error:\n", ("error",))
+        widget.insert(tk.END, str(error_message), ("error",)) # Ensure message is string
+        widget.config(state=tk.DISABLED)
+    except tk.TclError as e:
+        print(f"Error displaying error message in widget: {e}")
+
+
+# --- Background Fetch Engine ---
+class FetchEngine:
+    """Runs fetches on a thread pool and hands results back to the Tk thread via window.after.
+
+    Each submission belongs to a 'channel'. Submitting to a channel makes any earlier
+    submission on that channel stale: it is cancelled if it has not started yet, and its
+    result is dropped if it has. Submissions with an on_progress callback get a 'progress'
+    keyword argument they can call from the worker thread; it returns False once stale.
+    """
+    POLL_INTERVAL_MS = 30
+
+    def __init__(self, root, max_workers=4):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        self.results = queue.Queue()
+        self.latest = {} # channel -> ticket of the newest submission
+        self.pending = {} # ticket -> (future, channel, callbacks, cancelled event)
+        self.next_ticket = 0
+        self.polling = False
+
+    def submit(self, channel, func, *args, on_success=None, on_error=None, on_progress=None):
+        """Runs func(*args) in the background. Returns a ticket number for this submission."""
+        self.cancel(channel)
+        self.next_ticket += 1
+        ticket = self.next_ticket
+        self.latest[channel] = ticket
+        cancelled = threading.Event()
+        kwargs = {}
+        if on_progress:
+            # Runs on the worker thread: only touch the thread-safe queue here, never Tk.
+            def report_progress(*payload):
+                if cancelled.is_set(): return False
+                self.results.put((ticket, 'progress', payload))
+                return True
+            kwargs['progress'] = report_progress
+        future = self.executor.submit(func, *args, **kwargs)
+        self.pending[ticket] = (future, channel, (on_success, on_error, on_progress), cancelled)
+        future.add_done_callback(lambda f, t=ticket: self.results.put((t, 'done', None)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        return ticket
+
+    def cancel(self, channel):
+        """Marks the current submission on a channel as stale and cancels it if not yet running."""
+        ticket = self.latest.pop(channel, None)
+        if ticket is not None and ticket in self.pending:
+            self.pending[ticket][3].set()
+            self.pending[ticket][0].cancel()
+
+    def in_flight(self):
+        """Returns the number of submissions that have not been delivered yet."""
+        return len(self.pending)
+
+    def _poll(self):
+        """Delivers finished results on the Tk thread, then reschedules itself while work is pending."""
+        while True:
+            try: ticket, kind, payload = self.results.get_nowait()
+            except queue.Empty: break
+            future, channel, (on_success, on_error, on_progress), cancelled = self.pending[ticket]
+            if kind == 'done': del self.pending[ticket]
+            if cancelled.is_set() or future.cancelled() or self.latest.get(channel) != ticket:
+                continue # Stale: a newer request replaced this one
+            try:
+                if kind == 'progress':
+                    on_progress(*payload)
+                    continue
+                del self.latest[channel]
+                error = future.exception()
+                if error is not None:
+                    if on_error: on_error(error)
+                elif on_success:
+                    on_success(future.result())
+            except Exception:
+                print("Error in fetch result callback:", flush=True); traceback.print_exc()
+        if self.pending:
+            self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        else:
+            self.polling = False
+
+    def shutdown(self):
+        """Stops accepting work and cancels anything not yet started."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Worklist Prefetching ---
+# Librarians review queues of books one after another. While one book is on screen, the
+# next few are fetched and turned into TextModels on worker threads, so "Next" only has to
+# insert an already-built model. Entries behind the reviewer are dropped, and the entries
+# held ahead are capped both by count (depth) and by estimated memory (max_bytes).
+DEFAULT_PREFETCH_DEPTH = 3
+DEFAULT_PREFETCH_MAX_MB = 150
+ESTIMATED_BYTES_PER_EDITION = 3500 # Decoded dicts; measured by benchmarks/run_benchmarks.py
+
+class PrefetchEntry:
+    """State of one worklist book: 'queued', 'fetching', 'ready', 'failed' or 'reviewed' (already shown)."""
+    __slots__ = ('book_id', 'state', 'book', 'model', 'size', 'error')
+
+    def __init__(self, book_id):
+        self.book_id = book_id
+        self.state = 'queued'
+        self.book = self.model = self.error = None
+        self.size = 0
+
+def estimate_prefetch_bytes(book, model):
+    """Rough memory held by a prefetched book and its TextModel."""
+    text_bytes = sum(sys.getsizeof(text) for text in model.segments[0::2]) if model else 0
+    return text_bytes + len((book or {}).get('editions') or []) * ESTIMATED_BYTES_PER_EDITION
+
+def prefetch_book(bearer_token, book_id, force_refresh=False, offline=False, profile=DEFAULT_QUERY_PROFILE):
+    """Worker-thread half of a prefetch: fetches a book (cache first) and builds its TextModel. Returns (book, model, size)."""
+    book = fetch_book(bearer_token, book_id, force_refresh=force_refresh, offline=offline, profile=profile)
+    model = build_book_model(book) if book is not None else None
+    return book, model, estimate_prefetch_bytes(book, model)
+
+class WorklistPrefetcher:
+    """Keeps the books after the current worklist position fetched and pre-rendered, within depth and memory limits.
+
+    Runs on the Tk thread; the fetching itself goes through a FetchEngine, one channel per
+    book. on_change(index) is called whenever an entry's state changes.
+    """
+
+    def __init__(self, engine, depth=DEFAULT_PREFETCH_DEPTH, max_bytes=DEFAULT_PREFETCH_MAX_MB * 1024 * 1024, on_change=None):
+        self.engine = engine
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.on_change = on_change
+        self.book_ids = []
+        self.entries = []
+        self.position = -1
+        self.held_bytes = 0
+        self.bearer_token = ""
+        self.fetch_options = ()
+
+    def load(self, book_ids, bearer_token, force_refresh=False, offline=False, profile=DEFAULT_QUERY_PROFILE):
+        """Replaces the worklist. Prefetching starts with the first move_to()."""
+        self.stop()
+        self.book_ids = list(book_ids)
+        self.entries = [PrefetchEntry(book_id) for book_id in self.book_ids]
+        self.position = -1
+        self.held_bytes = 0
+        self.bearer_token = bearer_token
+        self.fetch_options = (force_refresh, offline, profile)
+
+    def stop(self):
+        """Cancels every prefetch still running."""
+        for entry in self.entries:
+            if entry.state == 'fetching':
+                self.engine.cancel(('prefetch', entry.book_id))
+                entry.state = 'queued'
+
+    def move_to(self, index):
+        """Makes 'index' the current book. Returns its PrefetchEntry; entry.state is 'ready' if it can be shown at once."""
+        if 0 <= self.position < len(self.entries) and self.position != index:
+            self._drop(self.position, 'reviewed')
+        self.position = index
+        for i, entry in enumerate(self.entries):
+            if (i < index or i > index + self.depth) and entry.state in ('fetching', 'ready'):
+                self._drop(i, 'queued') # Skipped over, or no longer near enough after jumping back
+        entry = self.entries[index]
+        if entry.state == 'fetching':
+            self.engine.cancel(('prefetch', entry.book_id)) # The caller fetches it in the foreground instead
+            entry.state = 'queued'
+        self.fill()
+        return entry
+
+    def release(self, index):
+        """Hands the current entry's data over to the caller and forgets it."""
+        self._drop(index, 'reviewed')
+
+    def fill(self):
+        """Starts prefetches for the next 'depth' books, unless the memory budget is used up."""
+        for i in range(self.position + 1, min(len(self.entries), self.position + 1 + self.depth)):
+            entry = self.entries[i]
+            if entry.state not in ('queued', 'reviewed'): continue # Going back re-prefetches reviewed books too
+            if self.held_bytes >= self.max_bytes: break
+            entry.state = 'fetching'
+            self.engine.submit(('prefetch', entry.book_id), prefetch_book, self.bearer_token, entry.book_id, *self.fetch_options,
+                               on_success=lambda result, i=i: self._on_ready(i, result),
+                               on_error=lambda error, i=i: self._on_failed(i, error))
+            self._changed(i)
+
+    def _on_ready(self, index, result):
+        entry = self.entries[index]
+        entry.book, entry.model, entry.size = result
+        entry.state = 'ready'
+        self.held_bytes += entry.size
+        # Over budget: give back the book furthest ahead, unless it is the only one held.
+        while self.held_bytes > self.max_bytes:
+            held = [i for i, e in enumerate(self.entries) if e.state == 'ready' and i > self.position]
+            if len(held) <= 1: break
+            self._drop(held[-1], 'queued')
+        self._changed(index)
+
+    def _on_failed(self, index, error):
+        entry = self.entries[index]
+        entry.state = 'failed'
+        entry.error = error
+        self._changed(index)
+        self.fill()
+
+    def _drop(self, index, state):
+        entry = self.entries[index]
+        if entry.state == 'fetching':
+            self.engine.cancel(('prefetch', entry.book_id))
+        self.held_bytes -= entry.size
+        entry.book = entry.model = entry.error = None
+        entry.size = 0
+        entry.state = state
+        self._changed(index)
+
+    def _changed(self, index):
+        if self.on_change: self.on_change(index)
+
+
+# --- Core Logic to Fetch Data ---
+def fetch_and_process_data():
+    """Gets data from GUI and starts a background fetch. Results are shown by on_fetch_progress/on_fetch_success/on_fetch_error."""
+    global streamed_view, displayed_book_id
+    streamed_view = None
+    fetch_engine.cancel('links')
+    clear_output_filters()
+    status_var.set("Processing...")
+
+    # Get Inputs & Validate
+    bearer_token = token_entry.get().strip()
+    book_id_str = book_id_entry.get().strip()
+    if not bearer_token: msg = "Bearer Token cannot be empty."; messagebox.showerror("Error", msg); status_var.set("Error: Missing Bearer Token."); display_error_message(output_viewer, msg); return
+    if not book_id_str: msg = "Book ID cannot be empty."; messagebox.showerror("Input Error", msg); status_var.set("Error: Missing Book ID."); display_error_message(output_viewer, msg); return
+    if not book_id_str.isdigit(): msg = "Book ID must be a number."; messagebox.showerror("Input Error", msg); status_var.set("Error: Invalid Book ID."); display_error_message(output_viewer, msg); return
+    try: book_id_int = int(book_id_str)
+    except ValueError: msg = "Book ID is not a valid integer."; messagebox.showerror("Input Error", msg); status_var.set("Error: Invalid Book ID format."); display_error_message(output_viewer, msg); return
+
+
+    # --- Encode Token Before Saving Config ---
+    try:
+        # Only encode if the token is not empty
+        encoded_token = base64.b64encode(bearer_token.encode()).decode() if bearer_token else ""
+    except Exception as e:
+        print(f"Error encoding token: {e}")
+        messagebox.showerror("Token Error", f"Could not encode token for saving:\n{e}")
+        encoded_token = "" # Save empty if encoding fails
+
+    current_config = load_config()
+    current_config['bearer_token_b64'] = encoded_token # Save encoded token under new key
+    # Optionally remove old plain text key if it exists
+    current_config.pop('bearer_token', None)
+    save_config(current_config)
+    # --- End Token Encoding ---
+
+
+    force_refresh = force_refresh_var.get()
+    offline = offline_var.get()
+    profile = profile_names_by_label.get(profile_var.get(), DEFAULT_QUERY_PROFILE)
+    timings.start_run()
+
+    # Re-fetching the book on screen keeps it there; only the blocks that changed are replaced
+    patch_in_place = (displayed_book_id == book_id_int and force_refresh and not offline and getattr(output_viewer, 'render_job', None) is None)
+    if not patch_in_place:
+        displayed_book_id = None
+        link_label.grid_remove()
+        cancel_render(output_viewer)
+        output_viewer.config(state=tk.NORMAL)
+        output_viewer.delete('1.0', tk.END)
+        output_viewer.config(state=tk.DISABLED)
+
+    # Cached books are rendered straight away, without a trip through the fetch pool.
+    if not force_refresh or offline:
+        cached = get_cached_book(book_id_int, allow_expired=offline, profile=profile)
+        if cached is not None:
+            fetch_engine.cancel('book')
+            record_book_identifiers(book_id_int, cached[0].get('editions'))
+            on_fetch_success(book_id_int, cached[0], fetched_at=cached[1])
+            return
+    if offline:
+        on_fetch_error(OfflineCacheMiss(f"Book ID {book_id_int} has not been fetched before."))
+        return
+
+    status_var.set(f"Fetching data for ID: {book_id_int}...")
+    # Submitting on the 'book' channel drops any earlier, still-running Book ID fetch.
+    if patch_in_place:
+        fetch_engine.submit('book', timings.profiled(fetch_with_changes),
+                            lambda: fetch_book(bearer_token, book_id_int, force_refresh=True, profile=profile), book_id_int, profile,
+                            on_success=lambda result, b=book_id_int: on_fetch_success(b, result[0], diff=result[1]),
+                            on_error=on_fetch_error)
+        return
+    # The header and first page render as soon as they arrive; later pages are appended.
+    fetch_engine.submit('book', timings.profiled(lambda progress: fetch_with_changes(lambda: fetch_book_paged(bearer_token, book_id_int, progress=progress, profile=profile), book_id_int, profile)),
+                        on_progress=lambda kind, data, b=book_id_int: on_fetch_progress(b, kind, data),
+                        on_success=lambda result, b=book_id_int: on_fetch_success(b, result[0], diff=result[1]),
+                        on_error=on_fetch_error)
+
+def on_fetch_progress(book_id_int, kind, data):
+    """Renders the book header and each page of editions as they arrive. Runs on the Tk thread."""
+    global streamed_view
+    if kind == 'header':
+        book = data
+        editions = book.get('editions') or []
+        model = TextModel()
+        add_book_header(model, book, evaluate_book_flags([book])[0])
+        add_editions_heading(model, book.get('editions_count') or len(editions))
+        streamed_view = { "book_id": book_id_int, "model": model, "shown": 0, "slug": book.get('slug'), "total": book.get('editions_count') or 0 }
+        show_book_link(book)
+        render_text_model(output_viewer, model)
+    elif streamed_view is None or streamed_view['book_id'] != book_id_int:
+        return
+    else:
+        editions = data
+    add_edition_blocks(streamed_view['model'], editions, streamed_view['shown'] + 1, streamed_view['slug'])
+    streamed_view['shown'] += len(editions)
+    append_rendered(output_viewer)
+    status_var.set(f"Loaded {streamed_view['shown']} of {streamed_view['total']} editions...")
+
+def show_book_link(book):
+    """Shows the 'View on Hardcover' link for a book, or hides it when the book has no slug."""
+    book_title = book.get('title', 'N/A')
+    actual_book_slug = book.get('slug')
+    if actual_book_slug:
+        link_text = f"View '{book_title}' on Hardcover"
+        link_label.config(text=link_text, foreground=COLOR_ACCENT_FG)
+        link_label.unbind("<Button-1>")
+        link_label.bind("<Button-1>", lambda e, s=actual_book_slug: open_book_link(s))
+        link_label.grid()
+    else:
+        link_label.grid_remove()
+
+def on_fetch_success(book_id_int, book, fetched_at=None, diff=None):
+    """Displays a fetched book. Runs on the Tk thread.
+
+    fetched_at is set when the book came from the cache. diff (from fetch_with_changes) marks
+    what changed since the previous fetch; when the book is already on screen, only the
+    blocks that changed are re-rendered.
+    """
+    global streamed_view, displayed_book_id, displayed_book
+    if book is None:
+         timings.finish_run()
+         displayed_book_id = None
+         no_book_message = f"No book found for ID {book_id_int}."
+         status_var.set(no_book_message)
+         messagebox.showinfo("Info", no_book_message)
+         display_error_message(output_viewer, no_book_message)
+         return
+
+    book_title = book.get('title', 'N/A')
+    marked = diff is not None and not diff_is_empty(diff)
+    if streamed_view is not None and streamed_view['book_id'] == book_id_int:
+        # Already on screen page by page. The streamed model is not memoized: its early pages were
+        # flagged before later pages reached the identifier index.
+        streamed_view = None
+        if marked: # Add the change markers once the last page is in
+            after_render(output_viewer, lambda: show_patched_model(build_book_model(book, diff)))
+    elif diff is not None and displayed_book_id == book_id_int:
+        patch_rendered_model(output_viewer, build_book_model(book, diff) if marked else get_book_model(book))
+        show_book_link(book)
+    else:
+        status_var.set("Data received. Formatting output...")
+        if marked:
+            render_text_model(output_viewer, build_book_model(book, diff))
+        else:
+            display_formatted_data(output_viewer, book) # Call the updated display function
+        show_book_link(book)
+    displayed_book_id, displayed_book = book_id_int, book
+
+    if fetched_at is None:
+        status_var.set(f"Success! Displaying data for '{book_title}'." + (f" Changes since last fetch: {summarize_diff(diff)}." if diff is not None else ""))
+    else:
+        age_minutes = int((time.time() - fetched_at) // 60)
+        status_var.set(f"Displaying cached data for '{book_title}' (fetched {age_minutes} min ago). Tick 'Force refresh' to re-fetch.")
+    after_render(output_viewer, show_run_timings)
+    start_link_check(book_id_int, book, diff if marked else None)
+
+def start_link_check(book_id_int, book, diff=None):
+    """Probes a displayed book's image and platform links in the background when 'Check links' is ticked, then re-flags it in place."""
+    if not check_links_var.get() or offline_var.get(): return
+    urls = book_link_urls([book])
+    if not urls: return
+    fetch_engine.submit('links', lambda progress: get_link_checker().check(urls, progress=progress),
+                        on_progress=lambda done, total: status_var.set(f"Checking links: {done} of {total}..."),
+                        on_success=lambda results, b=book_id_int: on_links_checked(b, book, diff, results),
+                        on_error=lambda error: status_var.set(f"Link check failed: {error}"))
+
+def on_links_checked(book_id_int, book, diff, results):
+    """Re-renders the edition blocks whose flags changed after a link check. Runs on the Tk thread."""
+    status_var.set(f"Links for '{book.get('title', 'N/A')}': {summarize_link_checks(results)}.")
+    if displayed_book_id != book_id_int or not any(status.ok is False for status in results.values()):
+        return
+    model = build_book_model(book, diff)
+    if diff is None:
+        remember_book_model(book_model_key(book), model) # The memoized model predates the dead-link flags
+    after_render(output_viewer, lambda: show_patched_model(model))
+
+def show_run_timings():
+    """Ends the timing run and appends its per-phase totals to the status bar, plus the scheduler's counters if requests were retried."""
+    global scheduler_retries_shown
+    summary = timings.finish_run()
+    if summary:
+        status_var.set(f"{status_var.get()}\n{summary}")
+    retries = get_request_scheduler().stats()["retries"]
+    if retries > scheduler_retries_shown:
+        scheduler_retries_shown = retries
+        status_var.set(f"{status_var.get()}\n{get_request_scheduler().summary()}")
+
+def export_timings():
+    """Saves the recorded phases as a Chrome trace (and any cProfile capture next to it)."""
+    path = filedialog.asksaveasfilename(title="Export Timings", defaultextension=".json", initialfile="hardcover_trace.json",
+                                        filetypes=[("Chrome trace", "*.json"), ("All files", "*.*")])
+    if not path: return
+    try:
+        timings.export_chrome_trace(path)
+        message = f"Trace written to {path}. Open it in chrome://tracing or ui.perfetto.dev."
+        profile_path = os.path.splitext(path)[0] + ".prof"
+        if timings.save_profile(profile_path):
+            message += f"\ncProfile data written to {profile_path}."
+        status_var.set(message)
+    except OSError as e:
+        messagebox.showerror("Export Error", f"Could not write the trace:\n{e}")
+
+def export_output_report():
+    """Saves the book on the Output tab as a CSV, JSONL or HTML report, limited to the filtered editions while a filter is active."""
+    if displayed_book_id is None or displayed_book is None:
+        messagebox.showinfo("Export Report", "Fetch a book first.")
+        return
+    path = filedialog.asksaveasfilename(title="Export Report", defaultextension=".csv", initialfile=f"hardcover_book_{displayed_book_id}.csv",
+                                        filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("HTML", "*.html"), ("All files", "*.*")])
+    if not path: return
+    book = displayed_book
+    editions = sorted((e for e in book.get('editions') or [] if isinstance(e, dict)), key=edition_sort_key)
+    if filter_view is not None and getattr(output_viewer, 'render_model', None) is filter_view['shown']:
+        shown_ids = { key[1] for key, _, _ in filter_view['shown'].blocks if isinstance(key, tuple) and key[0] == 'edition' }
+        editions = [e for e in editions if e.get('id') in shown_ids]
+    edition_flags = [[flag_to_dict(f) for f in flags] for flags in evaluate_edition_flags(editions)]
+    book_flags = [flag_to_dict(f) for f in evaluate_book_flags([book])[0]]
+    try:
+        writer = open_report_writer(path)
+        try:
+            writer.begin_book(book)
+            writer.add_editions(book, editions, edition_flags)
+            writer.end_book(book, book_flags)
+        finally:
+            writer.close()
+    except (ValueError, OSError) as e:
+        messagebox.showerror("Export Error", f"Could not write the report:\n{e}")
+        return
+    status_var.set(f"Report with {len(editions)} editions written to {path}.")
+
+def on_fetch_error(error):
+    """Reports a failed fetch. Runs on the Tk thread."""
+    global displayed_book_id
+    timings.finish_run()
+    displayed_book_id = None
+    link_label.grid_remove()
+    if isinstance(error, OfflineCacheMiss):
+        error_msg = f"Offline mode: {error}"
+        status_var.set("Offline: book not in local cache.")
+        display_error_message(output_viewer, error_msg)
+    elif isinstance(error, GraphQLError):
+        error_message = str(error)
+        status_var.set(f"API Error: {error_message}")
+        messagebox.showerror("API Error", f"The API returned an error:\n{error_message}")
+        display_error_message(output_viewer, f"API Error:\n{error_message}")
+    elif isinstance(error, requests.exceptions.Timeout):
+        error_msg = "Network Error: The request timed out."; status_var.set("Network Error: Timeout."); messagebox.showerror("Network Error", error_msg); display_error_message(output_viewer, error_msg)
+    elif isinstance(error, json.JSONDecodeError):
+        error_msg = "Invalid JSON received from API."
+        status_var.set("Error: Invalid JSON received.")
+        if getattr(error, 'response_text', None): error_msg += f"\n\nResponse Text:\n{error.response_text}..."
+        messagebox.showerror("Data Error", "The response from the API was not valid JSON.")
+        display_error_message(output_viewer, error_msg)
+    elif isinstance(error, requests.exceptions.HTTPError) and error.response is not None and error.response.status_code in RETRYABLE_STATUSES:
+        error_msg = f"The API is still busy after {get_request_scheduler().max_retries} retries (HTTP {error.response.status_code}). Wait a minute and fetch again.\n\n{get_request_scheduler().summary()}"
+        status_var.set(f"API busy (HTTP {error.response.status_code}).")
+        messagebox.showerror("API Busy", error_msg)
+        display_error_message(output_viewer, error_msg)
+    elif isinstance(error, requests.exceptions.RequestException):
+        error_msg = f"Network/API Error:\n{error}"; status_var.set("Network/API Error."); messagebox.showerror("API Error", f"Failed to connect or get data from the API.\nCheck connection and token.\nError: {error}"); display_error_message(output_viewer, error_msg)
+    else:
+        error_msg = f"An unexpected error occurred:\n{type(error).__name__}: {error}"
+        status_var.set("An unexpected error occurred.")
+        messagebox.showerror("Error", error_msg)
+        print(f"Traceback for unexpected error:\n", flush=True); traceback.print_exception(type(error), error, error.__traceback__)
+        display_error_message(output_viewer, error_msg)
+
+# --- Worklist Panel ---
+RESOLUTION_COMMENTS = { "not_found": "no edition has this identifier", "invalid": "not an ISBN or ASIN", "unknown": "not resolved before (offline)" }
+WORKLIST_STATE_LABELS = { "queued": "", "fetching": "prefetching...", "ready": "ready", "failed": "failed", "reviewed": "reviewed" }
+
+def load_worklist():
+    """Loads the Book IDs pasted into the Worklist tab and shows the first one."""
+    warnings = []
+    book_ids = parse_book_ids(worklist_text.get('1.0', tk.END).splitlines(), warn=warnings.append)
+    bearer_token = token_entry.get().strip()
+    if not book_ids:
+        messagebox.showerror("Worklist", "No valid Book IDs found.")
+        return
+    if not bearer_token and not offline_var.get():
+        messagebox.showerror("Error", "Bearer Token cannot be empty.")
+        return
+    profile = profile_names_by_label.get(profile_var.get(), DEFAULT_QUERY_PROFILE)
+    worklist.load(book_ids, bearer_token, force_refresh=force_refresh_var.get(), offline=offline_var.get(), profile=profile)
+    worklist_listbox.delete(0, tk.END)
+    for index in range(len(book_ids)):
+        worklist_listbox.insert(tk.END, worklist_row_text(index))
+    if warnings:
+        messagebox.showwarning("Worklist", "\n".join(warnings[:10]) + ("\n..." if len(warnings) > 10 else ""))
+    show_worklist_book(0)
+
+def load_worklist_file():
+    """Reads Book IDs from a text file into the Worklist tab and loads them."""
+    path = filedialog.askopenfilename(title="Load Worklist", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+    if not path: return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except OSError as e:
+        messagebox.showerror("Worklist", f"Could not read the file:\n{e}")
+        return
+    worklist_text.delete('1.0', tk.END)
+    worklist_text.insert('1.0', content)
+    load_worklist()
+
+def resolve_worklist_identifiers():
+    """Resolves the ISBNs and ASINs pasted into the Worklist tab in the background, then loads the Book IDs they belong to."""
+    warnings = []
+    entries = parse_identifiers(worklist_text.get('1.0', tk.END).splitlines(), warn=warnings.append)
+    keys = [key for _, key in entries if key]
+    bearer_token = token_entry.get().strip()
+    if not keys:
+        messagebox.showerror("Worklist", "No valid ISBNs or ASINs found.")
+        return
+    if not bearer_token and not offline_var.get():
+        messagebox.showerror("Error", "Bearer Token cannot be empty.")
+        return
+    worklist_status_var.set(f"Resolving {len(keys)} identifiers...")
+    fetch_engine.submit('resolve', resolve_identifiers, bearer_token, keys, DEFAULT_RESOLVE_BATCH_SIZE, 30, force_refresh_var.get(), offline_var.get(),
+                        on_success=lambda resolutions: on_identifiers_resolved(entries, resolutions, warnings), on_error=on_resolve_error,
+                        on_progress=lambda done, total: worklist_status_var.set(f"Resolving identifiers: {done} of {total} done..."))
+
+def on_identifiers_resolved(entries, resolutions, warnings):
+    """Replaces the worklist text with the resolved Book IDs (each commented with the identifier it came from) and loads them."""
+    records = resolution_records(entries, resolutions)
+    lines = []
+    for record in records:
+        if record["book_ids"]:
+            lines.extend(f"{book_id}  # {record['input']}" for book_id in record["book_ids"])
+        else:
+            lines.append(f"# {record['input']}: {RESOLUTION_COMMENTS[record['status']]}")
+    worklist_text.delete('1.0', tk.END)
+    worklist_text.insert('1.0', "\n".join(lines) + "\n")
+    summary = summarize_resolutions(records)
+    worklist_status_var.set(summary)
+    if warnings:
+        messagebox.showwarning("Worklist", "\n".join(warnings[:10]) + ("\n..." if len(warnings) > 10 else ""))
+    if resolved_book_ids(records):
+        load_worklist()
+        worklist_status_var.set(f"{summary} {worklist_status_var.get()}")
+
+def on_resolve_error(error):
+    worklist_status_var.set("Could not resolve the identifiers.")
+    messagebox.showerror("Worklist", f"Could not resolve the identifiers:\n{type(error).__name__}: {error}")
+
+def show_worklist_book(index):
+    """Shows the worklist book at 'index': straight from the prefetcher if it is ready, otherwise through a normal fetch."""
+    global streamed_view, displayed_book_id, displayed_book
+    if not 0 <= index < len(worklist.entries): return
+    previous = worklist.position
+    entry = worklist.move_to(index)
+    book_id_entry.delete(0, tk.END)
+    book_id_entry.insert(0, str(entry.book_id))
+    if entry.state == 'ready' and entry.book is not None:
+        fetch_engine.cancel('book')
+        clear_output_filters()
+        streamed_view = None
+        render_text_model(output_viewer, entry.model)
+        displayed_book_id, displayed_book = entry.book_id, entry.book
+        show_book_link(entry.book)
+        start_link_check(entry.book_id, entry.book)
+        status_var.set(f"Showing prefetched '{entry.book.get('title', 'N/A')}' (book {index + 1} of {len(worklist.entries)}).")
+        worklist.release(index)
+    else:
+        fetch_and_process_data()
+    for row in (previous, index):
+        refresh_worklist_row(row)
+    worklist_listbox.selection_clear(0, tk.END)
+    worklist_listbox.selection_set(index)
+    worklist_listbox.see(index)
+    worklist_status_var.set(f"Book {index + 1} of {len(worklist.entries)}. Prefetching up to {worklist.depth} ahead.")
+    notebook.select(output_frame)
+
+def worklist_row_text(index):
+    entry = worklist.entries[index]
+    marker = "▶" if index == worklist.position else " "
+    return f"{marker} {index + 1:>4}.  {entry.book_id:<10} {WORKLIST_STATE_LABELS[entry.state]}"
+
+def refresh_worklist_row(index):
+    """Redraws one row of the worklist (called by the prefetcher when an entry changes state)."""
+    if not 0 <= index < worklist_listbox.size(): return
+    selected = worklist_listbox.selection_includes(index)
+    worklist_listbox.delete(index)
+    worklist_listbox.insert(index, worklist_row_text(index))
+    if selected: worklist_listbox.selection_set(index)
+
+def on_worklist_double_click(event):
+    selection = worklist_listbox.curselection()
+    if selection: show_worklist_book(selection[0])
+
+# --- Output Filter Bar ---
+# Narrows the Output tab to the editions matching one value per facet, using the
+# EditionIndex built alongside the book's TextModel. Filtered views copy the matching
+# blocks out of the full model, so changing a filter never re-fetches or re-flags.
+FILTER_LABELS = { "flag": "Flag", "edition_format": "Format", "publisher": "Publisher", "language": "Language", "reading_format": "Reading Format", "platform": "Platform" }
+FILTER_ANY = "Any"
+
+def filter_source_model():
+    """Returns the full model behind the Output tab: the one being filtered, or whatever is shown when no filter is active."""
+    shown = getattr(output_viewer, 'render_model', None)
+    if filter_view is not None and shown is filter_view['shown']:
+        return filter_view['source']
+    return shown
+
+def refresh_filter_choices(facet):
+    """Fills a filter dropdown with the current book's values for that facet, most common first."""
+    model = filter_source_model()
+    values = model.edition_index.values(facet) if model is not None else []
+    filter_choices[facet] = { f"{value} ({count})": value for value, count in values }
+    filter_combos[facet].config(values=[FILTER_ANY] + list(filter_choices[facet]))
+
+def apply_output_filters(*_):
+    """Re-renders the Output tab with only the editions matching every selected filter."""
+    global filter_view
+    source = filter_source_model()
+    if source is None or not source.blocks: return
+    criteria = { facet: filter_choices[facet][var.get()] for facet, var in filter_vars.items() if var.get() in filter_choices.get(facet, {}) }
+    start = time.perf_counter()
+    if not criteria:
+        filter_view = None
+        render_text_model(output_viewer, source)
+        filter_status_var.set("")
+        return
+    shown = filtered_model(source, source.edition_index.select(criteria))
+    filter_view = { "source": source, "shown": shown }
+    render_text_model(output_viewer, shown)
+    filter_status_var.set(f"{len(shown.blocks) - 2} of {source.edition_index.count} editions ({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+def clear_output_filters(rerender=False):
+    """Resets every filter to Any. With rerender, the full model is shown again straight away."""
+    global filter_view
+    active = filter_view is not None
+    for var in filter_vars.values():
+        var.set(FILTER_ANY)
+    filter_status_var.set("")
+    if rerender and active:
+        apply_output_filters()
+    filter_view = None
+
+def show_patched_model(model):
+    """Shows an updated full model for the book on screen, keeping the active filters."""
+    if filter_view is not None and getattr(output_viewer, 'render_model', None) is filter_view['shown']:
+        filter_view['source'] = model
+        apply_output_filters()
+    else:
+        patch_rendered_model(output_viewer, model)
+
+# --- Statistics Tab ---
+# Aggregate statistics over many books: every cached book of the selected query profile, or
+# a dump / batch output file. Columns are built once on a worker thread; the threshold and
+# row count only trigger a recompute over them, which is fast enough to run on the Tk thread.
+def load_statistics_source(books, description, errors=()):
+    """Builds EditionColumns from an iterable of books in the background, then shows their statistics.
+
+    errors is the list the book reader adds unreadable lines to, reported once the columns are built.
+    """
+    stats_status_var.set(f"Reading {description}...")
+    fetch_engine.submit('statistics', build_edition_columns, books, on_success=lambda columns: show_statistics_columns(columns, errors),
+                        on_error=on_statistics_error,
+                        on_progress=lambda books_read, editions: stats_status_var.set(f"Reading {description}: {books_read:,} books, {editions:,} editions..."))
+
+def load_statistics_from_cache():
+    """Analyses every cached book fetched with the query profile selected on the Fetch Data tab."""
+    cache = get_response_cache()
+    if cache is None:
+        messagebox.showerror("Statistics", "The response cache is disabled or could not be opened.")
+        return
+    profile = profile_names_by_label.get(profile_var.get(), DEFAULT_QUERY_PROFILE)
+    load_statistics_source(cache.iter_books(profile_hash(profile)), f"cached books ({profile_var.get()})")
+
+def load_statistics_file():
+    """Analyses the books in a JSON/JSONL dump or a batch/catalog output file."""
+    path = filedialog.askopenfilename(title="Load Books", filetypes=[("JSON Lines", "*.jsonl"), ("JSON", "*.json"), ("All files", "*.*")])
+    if not path: return
+    errors = []
+    load_statistics_source(read_dump_books(path, errors), os.path.basename(path), errors)
+
+def show_statistics_columns(columns, errors):
+    global stats_columns, stats_skipped_lines
+    stats_columns, stats_skipped_lines = columns, len(errors)
+    recompute_statistics()
+
+def on_statistics_error(error):
+    stats_status_var.set("Could not read the books.")
+    messagebox.showerror("Statistics", f"Could not read the books:\n{type(error).__name__}: {error}")
+
+def recompute_statistics(*_):
+    """Recomputes and shows the statistics of the loaded columns with the current threshold and row count."""
+    if stats_columns is None:
+        stats_status_var.set("Load cached books or a file first.")
+        return
+    try:
+        low_score = float(stats_threshold_var.get()) if stats_threshold_var.get().strip() else None
+        top = int(stats_top_var.get())
+        if top < 1: raise ValueError
+    except ValueError:
+        messagebox.showerror("Statistics", "The low-score threshold must be a number and the row count a whole number of at least 1.")
+        return
+    start = time.perf_counter()
+    stats = edition_statistics(stats_columns, low_score=low_score, top=top)
+    elapsed = time.perf_counter() - start
+    render_text_model(stats_viewer, build_statistics_model(stats))
+    if low_score is None:
+        stats_threshold_var.set(f"{stats['low_score_threshold']:g}")
+    errors = f" {stats_skipped_lines} unreadable lines skipped." if stats_skipped_lines else ""
+    stats_status_var.set(f"{stats['books']:,} books, {stats['editions']:,} editions. Computed in {elapsed * 1000:.0f} ms "
+                         f"({'NumPy' if optional_module('numpy') else 'pure Python'}).{errors}")
+
+
+def apply_dark_theme():
+    """Selects a ttk theme that honours custom colours and configures the dark widget styles."""
+    selected_theme = None
+    for theme in ['clam', 'alt', 'default']:
+        if theme in style.theme_names():
+            try: style.theme_use(theme); selected_theme = theme; print(f"Using ttk theme: {theme}", file=sys.stderr); break
+            except tk.TclError: continue
+    if not selected_theme: print("No suitable ttk theme found, using system default.", file=sys.stderr)
+    style.configure('.', background=COLOR_BACKGROUND, foreground=COLOR_FOREGROUND)
+    style.configure('TFrame', background=COLOR_BACKGROUND)
+    style.configure('TLabel', background=COLOR_BACKGROUND, foreground=COLOR_LABEL_FG, anchor=tk.W)
+    style.configure('TNotebook', background=COLOR_BACKGROUND, borderwidth=0, tabposition='nw')
+    style.configure('TNotebook.Tab', background=COLOR_WIDGET_BG, foreground=COLOR_LABEL_FG, padding=[10, 5], borderwidth=1)
+    style.map('TNotebook.Tab', background=[('selected', COLOR_BACKGROUND), ('!selected', COLOR_WIDGET_BG)], foreground=[('selected', COLOR_HEADER_FG), ('!selected', COLOR_LABEL_FG)], expand=[('selected', [1, 1, 1, 0])])
+    style.configure('TButton', background=COLOR_WIDGET_BG, foreground=COLOR_FOREGROUND, padding=8, font=tkFont.Font(weight='bold'))
+    style.map('TButton', background=[('active', COLOR_ACCENT_FG), ('pressed', COLOR_ACCENT_FG)], foreground=[('active', COLOR_BACKGROUND), ('pressed', COLOR_BACKGROUND)])
+    style.configure('TEntry', foreground=COLOR_WIDGET_FG, fieldbackground=COLOR_WIDGET_BG, insertcolor=COLOR_FOREGROUND, borderwidth=1, relief=tk.FLAT)
+    style.map('TEntry', relief=[('focus', tk.SOLID)])
+    style.configure('TCheckbutton', background=COLOR_BACKGROUND, foreground=COLOR_LABEL_FG)
+    style.configure('TCombobox', foreground=COLOR_WIDGET_FG, fieldbackground=COLOR_WIDGET_BG, background=COLOR_WIDGET_BG, arrowcolor=COLOR_FOREGROUND)
+    style.map('TCombobox', fieldbackground=[('readonly', COLOR_WIDGET_BG)], foreground=[('readonly', COLOR_WIDGET_FG)])
+    style.map('TCheckbutton', background=[('active', COLOR_BACKGROUND)], foreground=[('active', COLOR_FOREGROUND)])
+
+def load_profile_choices():
+    """Fills the Fields combobox with the built-in and config.json query profiles."""
+    profile_names_by_label.clear()
+    profile_names_by_label.update({profile['label']: name for name, profile in get_query_profiles().items()})
+    profile_combo['values'] = list(profile_names_by_label)
+
+def finish_startup(startup_marks, profile_startup=False):
+    """Startup work that waits until the window has been drawn: the theme, config.json (query profiles,
+    prefetch limits), the saved token and the connection warm-up."""
+    window.update_idletasks() # Flush the pending first paint
+    startup_marks['first_paint'] = time.perf_counter()
+    startup_marks['deferred_loaded'] = [m._name for m in DEFERRED_MODULES if m.is_loaded()]
+    apply_dark_theme()
+    load_profile_choices()
+    final_token = load_saved_token()
+    if final_token:
+        token_entry.insert(0, final_token)
+        status_var.set("Loaded saved token. Enter Book ID.")
+    else:
+        status_var.set("Enter token and Book ID, then press 'Fetch Data'.")
+    config = load_config()
+    try:
+        worklist.depth = max(1, int(config.get('prefetch_depth', DEFAULT_PREFETCH_DEPTH)))
+        worklist.max_bytes = float(config.get('prefetch_max_mb', DEFAULT_PREFETCH_MAX_MB)) * 1024 * 1024
+    except (TypeError, ValueError):
+        print("Warning: Invalid prefetch_depth or prefetch_max_mb in config, using defaults.", file=sys.stderr)
+    on_done = (lambda seconds: report_startup_profile(startup_marks, seconds)) if profile_startup else None
+    fetch_engine.submit('warmup', warm_up_in_background, config.get('prewarm_connection', True),
+                        on_success=on_done, on_error=lambda e: on_done and on_done(None))
+
+def warm_up_in_background(prewarm_connection):
+    """Worker-thread half of startup: opens the API connection, then imports the optional accelerators
+    so the first fetch does not pay for them on the Tk thread. Returns the connection warm-up time."""
+    seconds = warm_up_connection() if prewarm_connection else None
+    for name in ('orjson', 'numpy'):
+        optional_module(name)
+    return seconds
+
+def report_startup_profile(startup_marks, warm_up_seconds):
+    """Prints the --startup-profile report as JSON and closes the window."""
+    since_start = lambda mark: round((startup_marks[mark] - STARTUP_BEGAN) * 1000, 1)
+    report = {
+        "module_import_ms": since_start('module_loaded'),
+        "tk_init_ms": round((startup_marks['tk_ready'] - startup_marks['module_loaded']) * 1000, 1),
+        "widgets_ms": round((startup_marks['widgets_built'] - startup_marks['tk_ready']) * 1000, 1),
+        "first_paint_ms": since_start('first_paint'),
+        "deferred_modules_loaded_before_paint": startup_marks['deferred_loaded'],
+        "connection_warm_up_ms": round(warm_up_seconds * 1000, 1) if warm_up_seconds is not None else None,
+    }
+    print(json.dumps(report, indent=4))
+    window.destroy()
+
+# --- Report Export ---
+# Audit results can be written as CSV, JSONL or a self-contained HTML page. Writers take a
+# book in three steps (begin_book, add_editions any number of times, end_book) and write
+# each row as soon as it is known, so batch exports stream with constant memory and the
+# streaming batch mode can report a book while it is still downloading. Flags are passed
+# in flag_to_dict form. The book row comes after its edition rows, because in streaming
+# mode the book flags are only known once the whole book has arrived.
+REPORT_FORMATS = { ".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl", ".html": "html", ".htm": "html" }
+REPORT_COLUMNS = ["row_type", "book_id", "book_title", "book_url", "edition_id", "edition_url", "score", "edition_format", "isbn_13", "isbn_10", "asin",
+                  "publisher", "language", "reading_format", "flags", "flag_rules", "platform_links", "error"]
+
+def edition_report_row(book, edition, flags):
+    """Returns the structured report row for one edition. flags are flag dicts."""
+    platform_links = [{ "platform": platform, "external_id": external_id, "url": get_platform_url(platform, external_id) }
+                      for platform, external_id in sorted(mapping_pairs(edition), key=lambda pair: (str(pair[0]), str(pair[1])))]
+    return {
+        "row_type": "edition", "book_id": book.get('id'), "book_title": book.get('title'), "book_url": get_book_url(book.get('slug')),
+        "edition_id": edition.get('id'), "edition_url": get_edition_edit_url(book.get('slug'), edition.get('id')), "score": edition.get('score'),
+        "edition_format": edition.get('edition_format'), "isbn_13": edition.get('isbn_13'), "isbn_10": edition.get('isbn_10'), "asin": edition.get('asin'),
+        "publisher": nested_field(edition, 'publisher', 'name'), "language": nested_field(edition, 'language', 'language'),
+        "reading_format": nested_field(edition, 'reading_format', 'format'), "flags": flags, "platform_links": platform_links,
+    }
+
+def book_report_row(book, flags, error=None):
+    """Returns the structured report row for a book (its own flags, not its editions')."""
+    row = { "row_type": "book", "book_id": book.get('id'), "book_title": book.get('title'), "book_url": get_book_url(book.get('slug')), "flags": flags }
+    if error: row["error"] = error
+    return row
+
+class ReportWriter:
+    """Base class for report writers. Subclasses implement write_row, and may add a header and footer."""
+
+    def __init__(self, stream, flagged_only=False):
+        self.stream = stream
+        self.flagged_only = flagged_only
+        self.books = 0
+        self.editions = 0
+        self.flag_counts = {}
+
+    def begin_book(self, book):
+        """Starts a book. Only its header fields (id, title, slug) are read."""
+
+    def add_editions(self, book, editions, edition_flags):
+        """Writes rows for some of a book's editions. edition_flags holds a list of flag dicts per edition."""
+        for edition, flags in zip(editions, edition_flags):
+            if self.flagged_only and not flags: continue
+            self.editions += 1
+            for flag in flags:
+                self.flag_counts[flag["rule"]] = self.flag_counts.get(flag["rule"], 0) + 1
+            self.write_row(edition_report_row(book, edition, flags))
+
+    def end_book(self, book, book_flags, error=None):
+        """Finishes a book with its own row, and flushes so the report grows as books arrive."""
+        self.books += 1
+        for flag in book_flags:
+            self.flag_counts[flag["rule"]] = self.flag_counts.get(flag["rule"], 0) + 1
+        self.write_row(book_report_row(book, book_flags, error))
+        self.stream.flush()
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        self.stream.close()
+
+class CsvReportWriter(ReportWriter):
+    """One CSV line per row. Flags and platform links are joined into single cells."""
+
+    def __init__(self, stream, flagged_only=False):
+        super().__init__(stream, flagged_only)
+        self.writer = csv.DictWriter(stream, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write_row(self, row):
+        flat = dict(row)
+        flat["flags"] = "; ".join(flag["text"] for flag in row["flags"])
+        flat["flag_rules"] = ";".join(flag["rule"] for flag in row["flags"])
+        flat["platform_links"] = " | ".join(f"{link['platform']}: {link['url'] or link['external_id']}" for link in row.get("platform_links", ()))
+        self.writer.writerow(flat)
+
+class JsonlReportWriter(ReportWriter):
+    """One JSON object per row, keeping flags and platform links as lists."""
+
+    def write_row(self, row):
+        self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+class HtmlReportWriter(ReportWriter):
+    """A single HTML page with inline styles: one section and table per book, and totals at the end."""
+    STYLE = (f"body{{background:{COLOR_BACKGROUND};color:{COLOR_FOREGROUND};font:13px Consolas,monospace;margin:20px}}"
+             f"h2{{color:{COLOR_HEADER_FG};margin:28px 0 6px}}a{{color:{COLOR_ACCENT_FG}}}"
+             f"table{{border-collapse:collapse;width:100%}}th,td{{border-bottom:1px solid {COLOR_SEPARATOR_FG};padding:3px 6px;text-align:left;vertical-align:top}}"
+             f"th{{color:{COLOR_LABEL_FG}}}.warning{{color:{COLOR_WARNING_FG};font-weight:bold}}.info{{color:{COLOR_INFO_FG};font-weight:bold}}.error{{color:{COLOR_ERROR_FG}}}")
+    HEADINGS = ("Edition", "Score", "Format", "ISBN-13", "ISBN-10", "ASIN", "Publisher", "Language", "Flags", "Links")
+
+    def __init__(self, stream, flagged_only=False):
+        super().__init__(stream, flagged_only)
+        stream.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Hardcover Audit Report</title><style>{self.STYLE}</style></head><body>\n"
+                     f"<h1>Hardcover Audit Report</h1><p>Generated {html.escape(time.strftime('%Y-%m-%d %H:%M'))}</p>\n")
+
+    def begin_book(self, book):
+        title = html.escape(str(book.get('title') or 'N/A'))
+        url = get_book_url(book.get('slug'))
+        stream = self.stream
+        stream.write(f"<section><h2>{link_html(url, title) if url else title} <small>(ID {html.escape(str(book.get('id')))})</small></h2>\n")
+        stream.write("<table><tr>" + "".join(f"<th>{h}</th>" for h in self.HEADINGS) + "</tr>\n")
+
+    def write_row(self, row):
+        flags = " ".join(f"<span class=\"{flag['severity']}\">{html.escape(flag['text'])}</span>" for flag in row["flags"])
+        if row["row_type"] == "book":
+            error = f"<p class=\"error\">{html.escape(row['error'])}</p>" if row.get("error") else ""
+            self.stream.write(f"</table><p>Book flags: {flags or 'none'}</p>{error}</section>\n")
+            return
+        cells = [link_html(row["edition_url"], html.escape(str(row["edition_id"]))) if row["edition_url"] else html.escape(str(row["edition_id"]))]
+        cells += [html.escape(str(row[key])) if row[key] is not None else "" for key in ("score", "edition_format", "isbn_13", "isbn_10", "asin", "publisher", "language")]
+        cells.append(flags)
+        cells.append(" ".join(link_html(link["url"], html.escape(str(link["platform"]))) if link["url"] else html.escape(f"{link['platform']}: {link['external_id']}")
+                              for link in row["platform_links"]))
+        self.stream.write("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>\n")
+
+    def close(self):
+        counts = "".join(f"<tr><td>{html.escape(rule)}</td><td>{count}</td></tr>" for rule, count in sorted(self.flag_counts.items(), key=lambda item: -item[1]))
+        self.stream.write(f"<h2>Totals</h2><p>{self.books} books, {self.editions} editions.</p><table><tr><th>Flag</th><th>Count</th></tr>{counts}</table>\n</body></html>\n")
+        super().close()
+
+def link_html(url, text):
+    return f"<a href=\"{html.escape(url)}\">{text}</a>"
+
+REPORT_WRITERS = { "csv": CsvReportWriter, "jsonl": JsonlReportWriter, "html": HtmlReportWriter }
+
+def open_report_writer(path, report_format=None, flagged_only=False):
+    """Opens a report writer for path. The format is 'csv', 'jsonl' or 'html', or is taken from the file extension."""
+    report_format = report_format or REPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if report_format not in REPORT_WRITERS:
+        raise ValueError(f"Cannot tell the report format of '{path}'. Use a .csv, .jsonl or .html file name.")
+    stream = open(path, 'w', encoding='utf-8', newline='' if report_format == 'csv' else None)
+    return REPORT_WRITERS[report_format](stream, flagged_only)
+
+def write_audit_report(writer, book, audit):
+    """Writes a whole book and its audit dict (from audit_books) to a report writer."""
+    editions = [e for e in book.get('editions') or [] if isinstance(e, dict)]
+    flags_by_id = { entry["edition_id"]: entry["flags"] for entry in audit["edition_flags"] }
+    writer.begin_book(book)
+    writer.add_editions(book, editions, [flags_by_id.get(e.get('id'), []) for e in editions])
+    writer.end_book(book, audit["book_flags"])
+
+# --- Batch Audit Mode (Headless) ---
+DEFAULT_BATCH_CHUNK_SIZE = 100
+STREAM_FLAG_BATCH = 256 # Editions flagged and written together in streaming mode
+
+def read_book_ids(source):
+    """Reads Book IDs from a file path (or '-' for stdin). See parse_book_ids for the format."""
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        return parse_book_ids(stream, warn=lambda message: print(f"Warning: {message}", file=sys.stderr))
+    finally:
+        if stream is not sys.stdin: stream.close()
+
+def read_identifiers(source):
+    """Reads ISBNs and ASINs from a file path (or '-' for stdin). See parse_identifiers."""
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        return parse_identifiers(stream, warn=lambda message: print(f"Warning: {message}", file=sys.stderr))
+    finally:
+        if stream is not sys.stdin: stream.close()
+
+def parse_book_ids(lines, warn=None):
+    """Parses Book IDs from lines of text. IDs may be separated by newlines, commas or spaces; '#' starts a comment.
+
+    Duplicates are dropped, keeping first-seen order. Invalid tokens are skipped and reported through warn(message).
+    """
+    book_ids = []
+    seen = set()
+    for line_no, line in enumerate(lines, start=1):
+        line = line.split('#', 1)[0]
+        for token in line.replace(',', ' ').split():
+            if not token.isdigit():
+                if warn: warn(f"Skipping invalid Book ID '{token}' on line {line_no}.")
+                continue
+            book_id = int(token)
+            if book_id not in seen:
+                seen.add(book_id)
+                book_ids.append(book_id)
+    return book_ids
+
+def chunked(items, size):
+    """Yields successive lists of at most 'size' items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def write_jsonl_record(stream, record):
+    """Writes one JSON record as a line and flushes so results stream out as they arrive."""
+    stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+    stream.flush()
+
+class StreamedBookRecord:
+    """Writes one book's JSONL record while its editions are still arriving.
+
+    The record has the same shape as write_jsonl_record's: {"book_id", "found", "book", "audit"},
+    with "editions" inside "book" and any fields the API listed after the editions following
+    it. Every value goes through json.dumps; this class only writes the punctuation between
+    them. A record cut short by an error gets top-level "truncated": true and "error" in place
+    of "audit".
+    """
+
+    def __init__(self, stream, book_id, header):
+        self.stream = stream
+        self.header_keys = set(header) # The header dict keeps growing after the editions
+        self.edition_count = 0
+        stream.write(f'{{"book_id": {json.dumps(book_id)}, "found": true, "book": {{')
+        for key, value in header.items():
+            self._member(key, value)
+        stream.write('"editions": [')
+
+    def _member(self, key, value, separator=", "):
+        self.stream.write(f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}{separator}")
+
+    def add_edition(self, edition):
+        self.stream.write(("," if self.edition_count else "") + json.dumps(edition, ensure_ascii=False))
+        self.edition_count += 1
+
+    def _close_book(self, book):
+        self.stream.write("]")
+        for key, value in book.items():
+            if key not in self.header_keys and key != 'editions':
+                self.stream.write(", ")
+                self._member(key, value, separator="")
+        self.stream.write("}")
+
+    def finish(self, book, audit):
+        """Closes the record with the complete book's remaining fields and its audit."""
+        self._close_book(book)
+        self.stream.write(", ")
+        self._member("audit", audit, separator="}\n")
+        self.stream.flush()
+
+    def abort(self, book, error):
+        """Closes a record cut short by an error, keeping the editions written so far."""
+        self._close_book(book)
+        self.stream.write(', "truncated": true, ')
+        self._member("error", str(error), separator="}\n")
+        self.stream.flush()
+
+def stream_batch_chunk(bearer_token, book_ids, out_stream, written, timeout=30, profile=DEFAULT_QUERY_PROFILE, check_links=False, report=None):
+    """Streams one request's books straight into JSONL records, flagging editions STREAM_FLAG_BATCH at a time.
+
+    Each record is written piece by piece (see StreamedBookRecord) while the response downloads,
+    so no whole book is ever held in memory. Records come out in the API's order and carry
+    "audit" after "book". shared_identifiers only sees a book's later editions once they have
+    been recorded, so duplicates within one book are caught inside a flag batch but not across
+    batches. 'written' maps each Book ID that got a line to True (complete) or False (cut short
+    by an error, in which case the record has top-level "truncated" and "error" instead of
+    "audit", and the error is re-raised). With check_links, each flag batch's links are probed
+    before it is flagged. A report writer gets each flag batch's rows as soon as they are flagged.
+    """
+    book_id = audit = book_header = record = None
+    pending = []
+
+    def flush_editions():
+        if not pending: return
+        record_book_identifiers(book_id, pending, append=record.edition_count > 0) # Later flag batches add to the first
+        if check_links: get_link_checker().check(edition_link_urls(pending))
+        all_flags = evaluate_edition_flags(pending)
+        for edition, flags in zip(pending, all_flags):
+            add_edition_audit(audit, edition, flags)
+            record.add_edition(edition)
+        if report: report.add_editions(book_header, pending, [[flag_to_dict(f) for f in flags] for flags in all_flags])
+        pending.clear()
+
+    try:
+        for kind, data in stream_books_batch(bearer_token, book_ids, timeout=timeout, profile=profile):
+            if kind == 'book':
+                book_id, book_header = data.get('id'), data
+                audit = { "book_flags": [], "edition_flags": [], "flag_counts": {} }
+                record = StreamedBookRecord(out_stream, book_id, data)
+                if report: report.begin_book(data)
+            elif kind == 'edition' and audit is not None:
+                pending.append(data)
+                if len(pending) >= STREAM_FLAG_BATCH: flush_editions()
+            elif kind == 'book_end':
+                flush_editions()
+                book_flags = evaluate_book_flags([data])[0]
+                audit["book_flags"] = [flag_to_dict(f) for f in book_flags]
+                count_flags(audit, book_flags)
+                record.finish(data, audit)
+                if report: report.end_book(data, audit["book_flags"])
+                written[book_id] = True
+                book_id = audit = record = None
+    except Exception as e:
+        if record is not None: # Close the half-written line so the output stays valid JSONL
+            for edition in pending: # Downloaded but not yet flagged
+                record.add_edition(edition)
+            record.abort(book_header, e)
+            if report: report.end_book(book_header, [], error=f"Truncated: {e}")
+            written[book_id] = False
+        raise
+
+def snapshot_changes(books_by_id, since, profile=DEFAULT_QUERY_PROFILE):
+    """Sorts fetched books by their snapshots. Returns ({ID: content hash} for books unchanged since 'since', {ID: diff} for changed books with an earlier version)."""
+    cache = get_response_cache()
+    if cache is None:
+        return {}, {}
+    qhash = profile_hash(profile)
+    unchanged = {}
+    diffs = {}
+    for book_id, (content_hash, changed_at, has_previous) in cache.snapshot_states(list(books_by_id), qhash).items():
+        if changed_at < since:
+            unchanged[book_id] = content_hash
+        elif has_previous:
+            diffs[book_id] = diff_books(cache.get_snapshot(book_id, qhash)["previous"], books_by_id[book_id])
+    return unchanged, diffs
+
+def run_batch_audit(bearer_token, book_ids, out_stream, chunk_size=DEFAULT_BATCH_CHUNK_SIZE, timeout=30, force_refresh=False, offline=False, profile=DEFAULT_QUERY_PROFILE, stream=False, skip_unchanged=False, check_links=False, report=None):
+    """Fetches books in chunks of 'chunk_size' IDs per request and writes one JSONL record per Book ID. Returns the number of failed IDs.
+
+    With stream=True, books that are not already cached are parsed and written while they
+    download (see stream_batch_chunk) instead of being decoded whole. With skip_unchanged=True,
+    books whose snapshot did not change in this run are not audited and get a short
+    {"unchanged": true} record, and changed books carry a "changes" diff against their
+    previous snapshot. With check_links=True, image and platform links are probed before
+    flagging, so dead_image and broken_links can fire. Audited books are also written to the
+    report writer, if one is given (see open_report_writer).
+    """
+    failed = 0
+    total_chunks = (len(book_ids) + chunk_size - 1) // chunk_size
+    for chunk_no, chunk in enumerate(chunked(book_ids, chunk_size), start=1):
+        print(f"Fetching chunk {chunk_no}/{total_chunks} ({len(chunk)} IDs)...", file=sys.stderr)
+        if stream and not offline:
+            failed += run_streamed_chunk(bearer_token, chunk, chunk_no, out_stream, timeout, force_refresh, profile, check_links, report)
+            forget_link_results()
+            continue
+        started = time.time()
+        try:
+            books_by_id = fetch_books_batch(bearer_token, chunk, timeout=timeout, force_refresh=force_refresh, offline=offline, profile=profile)
+        except (requests.exceptions.RequestException, GraphQLError, ValueError) as e:
+            print(f"Error fetching chunk {chunk_no}: {e}", file=sys.stderr)
+            for book_id in chunk:
+                write_jsonl_record(out_stream, { "book_id": book_id, "found": False, "error": str(e) })
+            failed += len(chunk)
+            continue
+        unchanged, diffs = snapshot_changes(books_by_id, started, profile) if skip_unchanged else ({}, {})
+        if check_links:
+            get_link_checker().check(book_link_urls(book for book_id, book in books_by_id.items() if book_id not in unchanged))
+        # The chunk is compacted into records (dropping the decoded dicts) and flagged in one pass
+        books_by_id = { book_id: BookRecord.from_dict(book) for book_id, book in books_by_id.items() if book_id not in unchanged }
+        found_books = [books_by_id[b] for b in chunk if b in books_by_id]
+        audits_by_id = {book.id: audit for book, audit in zip(found_books, audit_books(found_books))}
+        for book_id in chunk: # Keep input order in the output
+            book = books_by_id.get(book_id)
+            if book_id in unchanged:
+                write_jsonl_record(out_stream, { "book_id": book_id, "found": True, "unchanged": True, "content_hash": unchanged[book_id] })
+            elif book is None:
+                error = "Not in local cache." if offline else "No book found."
+                write_jsonl_record(out_stream, { "book_id": book_id, "found": False, "error": error })
+                failed += 1
+            else:
+                record = { "book_id": book_id, "found": True, "audit": audits_by_id[book_id], "book": book.to_dict() }
+                if book_id in diffs: record["changes"] = diffs[book_id]
+                write_jsonl_record(out_stream, record)
+                if report: write_audit_report(report, record["book"], record["audit"])
+        forget_link_results() # Only this chunk's results are needed for its flags
+    return failed
+
+def run_streamed_chunk(bearer_token, chunk, chunk_no, out_stream, timeout, force_refresh, profile, check_links=False, report=None):
+    """Writes records for one chunk in streaming mode: cached books first, then the rest as they download. Returns the number of failed IDs."""
+    written = {}
+    to_fetch = []
+    for book_id in chunk:
+        cached = None if force_refresh else get_cached_book(book_id, profile=profile)
+        if cached is None:
+            to_fetch.append(book_id)
+            continue
+        record_book_identifiers(book_id, cached[0].get('editions'))
+        if check_links: get_link_checker().check(book_link_urls([cached[0]]))
+        audit = audit_books([cached[0]])[0]
+        write_jsonl_record(out_stream, { "book_id": book_id, "found": True, "audit": audit, "book": cached[0] })
+        if report: write_audit_report(report, cached[0], audit)
+        written[book_id] = True
+    error = "No book found."
+    if to_fetch:
+        try:
+            stream_batch_chunk(bearer_token, to_fetch, out_stream, written, timeout=timeout, profile=profile, check_links=check_links, report=report)
+        except (requests.exceptions.RequestException, GraphQLError, ValueError) as e:
+            print(f"Error fetching chunk {chunk_no}: {e}", file=sys.stderr)
+            error = str(e)
+    for book_id in chunk:
+        if book_id not in written:
+            write_jsonl_record(out_stream, { "book_id": book_id, "found": False, "error": error })
+    return sum(1 for book_id in chunk if not written.get(book_id))
+
+# --- Catalogue Audit ---
+# Audits every book by an author, publisher or series without knowing their IDs up front.
+# ID pages are enumerated on the calling thread while up to 'concurrency' pages of books
+# are fetched in the background; each page is flagged and written as soon as it (and every
+# page before it) has arrived. Only the worst editions are kept for the final ranking.
+DEFAULT_CATALOG_CONCURRENCY = 4 # Stays below HTTP_POOL_SIZE so every fetch gets a pooled connection
+DEFAULT_CATALOG_TOP = 100
+SEVERITY_WEIGHTS = { "warning": 3, "info": 1 } # How much each flag counts towards an edition's badness
+
+def enumerate_book_ids(bearer_token, kind, name, page_size=DEFAULT_BATCH_CHUNK_SIZE, max_books=None, timeout=30):
+    """Yields lists of up to page_size Book IDs matching an author, publisher or series name, in ID order."""
+    query, operation = build_enumeration_query(kind)
+    after = total = 0
+    while max_books is None or total < max_books:
+        limit = page_size if max_books is None else min(page_size, max_books - total)
+        data = post_graphql(bearer_token, query, { "name": name, "after": after, "limit": limit }, operation, timeout=timeout)
+        book_ids = [book['id'] for book in data.get('books') or [] if isinstance(book, dict) and isinstance(book.get('id'), int)]
+        if not book_ids: return
+        yield book_ids
+        total += len(book_ids)
+        after = max(book_ids)
+        if len(book_ids) < limit: return
+
+def edition_badness(flags):
+    """Returns how bad an edition's flag dicts make it: warnings count SEVERITY_WEIGHTS["warning"], info flags less."""
+    return sum(SEVERITY_WEIGHTS.get(flag["severity"], 1) for flag in flags)
+
+class WorstEditions:
+    """Keeps the 'limit' worst editions seen so far in a min-heap, so a whole catalogue is ranked in constant memory.
+
+    Editions rank by badness, then by number of flags, then lowest score (no score first).
+    """
+
+    def __init__(self, limit=DEFAULT_CATALOG_TOP):
+        self.limit = limit
+        self.heap = []
+        self.editions = 0
+        self.flagged = 0
+
+    def add_book(self, book, audit):
+        """Offers every flagged edition of an audited book (a dict and its audit_books entry)."""
+        self.editions += len(book.get('editions') or [])
+        if not audit["edition_flags"]: return
+        editions = { edition.get('id'): edition for edition in book.get('editions') or [] if isinstance(edition, dict) }
+        for entry in audit["edition_flags"]:
+            self.flagged += 1
+            flags = entry["flags"]
+            score = editions.get(entry["edition_id"], {}).get('score')
+            key = (edition_badness(flags), len(flags), -score if isinstance(score, (int, float)) else 1)
+            if len(self.heap) >= self.limit and key <= self.heap[0][0]: continue
+            self.push(key, -self.flagged, { # Earlier editions win ties
+                "book_id": book.get('id'), "book_title": book.get('title'), "edition_id": entry["edition_id"],
+                "edition_url": get_edition_edit_url(book.get('slug'), entry["edition_id"]), "score": score,
+                "badness": key[0], "flags": [flag["text"] for flag in flags],
+            })
+
+    def push(self, key, order, entry):
+        """Adds an entry, dropping the least bad one when full. order breaks ties (higher ranks worse)."""
+        if len(self.heap) >= self.limit:
+            if (key, order) <= self.heap[0][:2]: return
+            heapq.heappop(self.heap)
+        heapq.heappush(self.heap, (key, order, entry))
+
+    def merge(self, other):
+        """Adds another ranking as if its editions had been seen after this one's, so parts of a file merged in order rank exactly like one pass."""
+        for key, order, entry in other.heap:
+            self.push(key, order - self.flagged, entry)
+        self.editions += other.editions
+        self.flagged += other.flagged
+
+    def ranked(self):
+        """Returns the kept editions, worst first, each with its 1-based rank."""
+        return [dict(entry, rank=rank) for rank, (_, _, entry) in enumerate(sorted(self.heap, key=lambda item: item[:2], reverse=True), start=1)]
+
+def audit_catalog_page(books_by_id, book_ids, out_stream, ranking, check_links=False, report=None):
+    """Flags one fetched page of books and writes their records. Returns the number of IDs that came back empty."""
+    if check_links:
+        get_link_checker().check(book_link_urls(books_by_id.values()))
+    records = [BookRecord.from_dict(books_by_id[book_id]) for book_id in book_ids if book_id in books_by_id]
+    for record, audit in zip(records, audit_books(records)):
+        book = record.to_dict()
+        write_jsonl_record(out_stream, { "book_id": record.id, "found": True, "audit": audit, "book": book })
+        if report: write_audit_report(report, book, audit)
+        ranking.add_book(book, audit)
+    forget_link_results()
+    return len(book_ids) - len(records)
+
+def run_catalog_audit(bearer_token, kind, name, out_stream, page_size=DEFAULT_BATCH_CHUNK_SIZE, concurrency=DEFAULT_CATALOG_CONCURRENCY,
+                      top=DEFAULT_CATALOG_TOP, max_books=None, timeout=30, force_refresh=False, profile=DEFAULT_QUERY_PROFILE, check_links=False, report=None):
+    """Enumerates the books matching an author, publisher or series and audits them page by page.
+
+    Writes one JSONL record per book (as batch does) while pages arrive, then a final
+    {"ranking": ...} record listing the 'top' worst editions of the whole slice.
+    Returns the number of IDs that could not be fetched, or -1 if the enumeration failed.
+    """
+    ranking = WorstEditions(top)
+    books = failed = 0
+    in_flight = deque() # (page number, IDs, future), oldest first so output keeps ID order
+
+    def finish_oldest():
+        nonlocal books, failed
+        page_no, book_ids, future = in_flight.popleft()
+        try:
+            books_by_id = future.result()
+        except (requests.exceptions.RequestException, GraphQLError, ValueError) as e:
+            print(f"Error fetching page {page_no}: {e}", file=sys.stderr)
+            for book_id in book_ids:
+                write_jsonl_record(out_stream, { "book_id": book_id, "found": False, "error": str(e) })
+            failed += len(book_ids)
+            return
+        with timings.span("catalog_page", books=len(book_ids)):
+            missing = audit_catalog_page(books_by_id, book_ids, out_stream, ranking, check_links, report)
+        failed += missing
+        books += len(book_ids) - missing
+        print(f"Page {page_no}: {len(book_ids) - missing} books audited ({books} so far, {ranking.flagged} flagged editions).", file=sys.stderr)
+
+    enumeration_error = None
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="catalog") as pool:
+        try:
+            for page_no, book_ids in enumerate(enumerate_book_ids(bearer_token, kind, name, page_size, max_books, timeout), start=1):
+                while len(in_flight) >= concurrency:
+                    finish_oldest()
+                in_flight.append((page_no, book_ids, pool.submit(fetch_books_batch, bearer_token, book_ids, timeout=timeout, force_refresh=force_refresh, profile=profile)))
+        except (requests.exceptions.RequestException, GraphQLError, ValueError) as e:
+            enumeration_error = str(e)
+            print(f"Error listing books: {e}", file=sys.stderr)
+        while in_flight:
+            finish_oldest()
+    summary = { kind: name, "books": books, "editions": ranking.editions, "flagged_editions": ranking.flagged, "worst_editions": ranking.ranked() }
+    if enumeration_error: summary["error"] = enumeration_error
+    write_jsonl_record(out_stream, { "ranking": summary })
+    print_worst_editions(summary["worst_editions"])
+    return -1 if enumeration_error else failed
+
+def print_worst_editions(worst, count=10):
+    """Prints the first few ranked editions to stderr."""
+    for entry in worst[:count]:
+        print(f"{entry['rank']:>4}. {entry['book_title']} / edition {entry['edition_id']} (badness {entry['badness']}): {' '.join(entry['flags'])}", file=sys.stderr)
+
+# --- Offline Dump Audit ---
+# Audits a local dump of books (the 'books' list of a query response) without the API,
+# spread over a process pool. A JSONL dump is split into byte ranges on line boundaries and
+# each worker reads its range through mmap, so no process ever holds the whole file. The
+# ranges are merged in file order, so counts and the worst-edition ranking come out the
+# same whatever the number of workers. shared_identifiers needs to see every identifier
+# in the dump before flagging, so it takes a first pass that builds one partial identifier
+# index per range, merged (in file order, first owner wins) on top of the saved index.
+DUMP_RANGES_PER_WORKER = 4 # More ranges than workers, so one slow range doesn't leave the others idle
+DUMP_AUDIT_BATCH = 64 # Books flagged together in one columnar pass
+
+def dump_line_books(value):
+    """Returns the books in one parsed dump line: a book, a list of books, a query response or a batch output record."""
+    if isinstance(value, list):
+        return [book for book in value if isinstance(book, dict)]
+    if not isinstance(value, dict):
+        return []
+    if isinstance(value.get('data'), dict):
+        return dump_line_books(value['data'].get('books') or [])
+    if isinstance(value.get('books'), list):
+        return dump_line_books(value['books'])
+    if 'found' in value: # A batch or catalog output record; not-found records have no book
+        return [value['book']] if isinstance(value.get('book'), dict) else []
+    return [value]
+
+def split_line_ranges(path, parts):
+    """Splits a file into at most 'parts' (start, end) byte ranges that begin and end on line boundaries."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    bounds = [0]
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for part in range(1, parts):
+            newline = mm.find(b"\n", max(bounds[-1], size * part // parts))
+            if newline < 0 or newline + 1 >= size: break
+            bounds.append(newline + 1)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+def iter_dump_lines(path, start, end):
+    """Yields (byte offset, line) for each non-blank line between two offsets, read through mmap."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = start
+        while position < end:
+            newline = mm.find(b"\n", position, end)
+            stop = end if newline < 0 else newline
+            line = mm[position:stop]
+            if line.strip(): yield position, line
+            position = stop + 1
+
+def iter_dump_books(path, start, end, errors):
+    """Yields every book in a byte range of a JSONL dump. Lines that don't parse are added to errors as {"offset", "error"}."""
+    for offset, line in iter_dump_lines(path, start, end):
+        try:
+            books = dump_line_books(decode_json(line))
+        except ValueError as e:
+            errors.append({ "offset": offset, "error": f"Invalid JSON: {e}" })
+            continue
+        yield from books
+
+def index_dump_range(path, start, end):
+    """Worker: records the identifiers of every edition in a byte range into a new IdentifierIndex and returns it."""
+    index = IdentifierIndex()
+    for book in iter_dump_books(path, start, end, []):
+        editions = book.get('editions')
+        if isinstance(book.get('id'), int) and isinstance(editions, list):
+            index.record_editions(book['id'], editions)
+    return index
+
+def init_dump_worker(flag_rules, index_path):
+    """Process pool initializer: uses the parent's flag rules and the merged identifier index (if any) instead of loading them again."""
+    global _flag_rules, _identifier_index
+    _flag_rules = flag_rules
+    _identifier_index = IdentifierIndex.load(index_path) if index_path else IdentifierIndex()
+
+def audit_dump_range(path, start, end, top, write_records):
+    """Worker: flags every book in a byte range. Returns its counts, worst editions, errors and (if asked) JSONL audit records."""
+    part = { "books": 0, "flag_counts": {}, "ranking": WorstEditions(top), "errors": [], "records": [] }
+
+    def flush(batch):
+        for book, audit in zip(batch, audit_books(batch)):
+            part["books"] += 1
+            for rule, count in audit["flag_counts"].items():
+                part["flag_counts"][rule] = part["flag_counts"].get(rule, 0) + count
+            part["ranking"].add_book(book, audit)
+            if write_records:
+                part["records"].append(json.dumps({ "book_id": book.get('id'), "title": book.get('title'), "audit": audit }, ensure_ascii=False))
+        batch.clear()
+
+    batch = []
+    for book in iter_dump_books(path, start, end, part["errors"]):
+        batch.append(book)
+        if len(batch) >= DUMP_AUDIT_BATCH: flush(batch)
+    flush(batch)
+    part["records"] = "".join(record + "\n" for record in part["records"])
+    return part
+
+def convert_dump_to_jsonl(path, out_path):
+    """Rewrites a single-document dump (a query response or a list of books) as one book per line. Returns the number of books."""
+    with open(path, 'rb') as f:
+        books = dump_line_books(decode_json(f.read()))
+    with open(out_path, 'w', encoding='utf-8') as out:
+        for book in books:
+            out.write(json.dumps(book, ensure_ascii=False) + "\n")
+    return len(books)
+
+def is_jsonl_dump(path):
+    """Tells a JSONL dump from a single JSON document by whether its first line parses on its own."""
+    with open(path, 'rb') as f:
+        first_line = f.readline()
+    if not first_line.strip():
+        return True # Empty, or nothing to tell from; read it line by line
+    try:
+        decode_json(first_line)
+    except ValueError:
+        return False
+    return True
+
+def make_temp_path(suffix):
+    """Returns the path of a new empty temporary file."""
+    handle, temp_path = tempfile.mkstemp(prefix="hardcover-", suffix=suffix)
+    os.close(handle)
+    return temp_path
+
+def run_dump_audit(path, workers=None, top=DEFAULT_CATALOG_TOP, out_stream=None, shared_identifiers=True):
+    """Audits a local dump on a process pool and returns the merged summary dict.
+
+    Per-book audit records are written to out_stream in file order, if one is given. With
+    shared_identifiers=False (or that rule disabled), the identifier pass is skipped.
+    """
+    workers = workers or os.cpu_count() or 1
+    temp_paths = []
+    try:
+        if not is_jsonl_dump(path):
+            jsonl_path = make_temp_path(".jsonl")
+            temp_paths.append(jsonl_path)
+            with timings.span("dump_convert"):
+                print(f"Converted {convert_dump_to_jsonl(path, jsonl_path)} books to one per line.", file=sys.stderr)
+            path = jsonl_path
+        ranges = split_line_ranges(path, workers * DUMP_RANGES_PER_WORKER)
+        starts, ends = [start for start, _ in ranges], [end for _, end in ranges]
+        paths = [path] * len(ranges)
+        book_rules, edition_rules = get_flag_rules()
+        if not shared_identifiers:
+            edition_rules = [rule for rule in edition_rules if rule['id'] != 'shared_identifiers']
+        index_path = None
+        if any(rule['id'] == 'shared_identifiers' for rule in edition_rules):
+            with timings.span("dump_index", ranges=len(ranges)), process_pool.ProcessPoolExecutor(max_workers=workers) as pool:
+                saved = get_identifier_index()
+                parts = list(pool.map(index_dump_range, paths, starts, ends))
+                # Sized up front so merging never rehashes; the merge is the one serial step
+                index = IdentifierIndex(capacity=1 << (2 * (saved.count + sum(part.count for part in parts)) + 1).bit_length())
+                for part in [saved] + parts:
+                    index.merge(part)
+            index_path = make_temp_path(".bin")
+            temp_paths.append(index_path)
+            index.save(index_path)
+            print(f"Indexed {index.count} identifiers.", file=sys.stderr)
+        summary = { "books": 0, "flag_counts": {}, "errors": [] }
+        ranking = WorstEditions(top)
+        with timings.span("dump_audit", ranges=len(ranges)), process_pool.ProcessPoolExecutor(max_workers=workers, initializer=init_dump_worker,
+                                                                                    initargs=((book_rules, edition_rules), index_path)) as pool:
+            parts = pool.map(audit_dump_range, paths, starts, ends, [top] * len(ranges), [out_stream is not None] * len(ranges))
+            for done, part in enumerate(parts, start=1):
+                summary["books"] += part["books"]
+                for rule, count in part["flag_counts"].items():
+                    summary["flag_counts"][rule] = summary["flag_counts"].get(rule, 0) + count
+                summary["errors"].extend(part["errors"])
+                ranking.merge(part["ranking"])
+                if out_stream is not None and part["records"]:
+                    out_stream.write(part["records"])
+                    out_stream.flush()
+                print(f"Range {done}/{len(ranges)}: {summary['books']} books audited.", file=sys.stderr)
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path): os.remove(temp_path)
+    summary.update(editions=ranking.editions, flagged_editions=ranking.flagged, worst_editions=ranking.ranked(),
+                   flag_counts=dict(sorted(summary["flag_counts"].items(), key=lambda item: (-item[1], item[0]))))
+    return summary
+
+def read_dump_books(path, errors):
+    """Yields every book in a JSONL dump or single-document dump, reading JSONL line by line. Unreadable lines go to errors."""
+    if is_jsonl_dump(path):
+        yield from iter_dump_books(path, 0, os.path.getsize(path), errors)
+    else:
+        with open(path, 'rb') as f:
+            yield from dump_line_books(decode_json(f.read()))
+
+# --- Aggregate Statistics ---
+# Data-quality statistics over many books at once. The books are flattened once into
+# EditionColumns (one typed array per field, one entry per edition; facet values as integer
+# codes; one 0/1 column per flag rule), and every statistic is then a few whole-column
+# operations: percentiles, a histogram and bincounts grouped by facet code or book. Changing
+# the low-score threshold or the number of rows shown only re-runs those, never the flag
+# rules. NumPy does the column work when installed; the pure-Python fallback gives the
+# same numbers, more slowly.
+STATS_FACETS = { "edition_format": "Format", "publisher": "Publisher", "language": "Language" }
+STATS_FACET_READERS = {
+    "edition_format": lambda edition: edition.get('edition_format'),
+    "publisher": lambda edition: nested_field(edition, 'publisher', 'name'),
+    "language": lambda edition: nested_field(edition, 'language', 'language'),
+}
+STATS_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+STATS_HISTOGRAM_BINS = 10
+STATS_BUILD_BATCH = 256 # Books flagged together while building columns
+DEFAULT_STATS_TOP = 15
+DEFAULT_STATS_MIN_EDITIONS = 3 # Books with fewer editions stay out of the low-score ranking (1 of 1 is not a pattern)
+MISSING_SCORE = float('nan')
+
+def default_low_score_threshold():
+    """Returns the low_score rule's threshold, with config overrides applied even when the rule is disabled."""
+    overrides = (load_config().get('flag_rules') or {}).get('low_score')
+    default = next(rule['threshold'] for rule in EDITION_FLAG_RULES if rule['id'] == 'low_score')
+    return overrides.get('threshold', default) if isinstance(overrides, dict) else default
+
+class EditionColumns:
+    """Per-edition columns of a collection of books, built once and shared by every statistics recompute.
+
+    score holds NaN for editions without one, book_index the position of each edition's book,
+    facet_codes indexes into facet_values, and flag_columns has one 0/1 column per edition
+    flag rule that fired at least once.
+    """
+
+    def __init__(self):
+        self.book_ids, self.book_titles, self.book_slugs = [], [], []
+        self.book_index = array('q')
+        self.score = array('d')
+        self.flag_count = array('q') # Flags per edition
+        self.facet_codes = { facet: array('q') for facet in STATS_FACETS }
+        self.facet_values = { facet: [] for facet in STATS_FACETS }
+        self.facet_lookup = { facet: {} for facet in STATS_FACETS }
+        self.flag_columns = {} # rule -> array('b')
+        self.flag_severity = {}
+        self.book_flag_counts = {} # rule -> books flagged
+
+    def __len__(self):
+        return len(self.score)
+
+    def add_books(self, books):
+        """Appends a list of books (dicts), flagging all of their editions in one columnar pass."""
+        books = [book for book in books if isinstance(book, dict)]
+        editions = []
+        for book in books:
+            book_number = len(self.book_ids)
+            self.book_ids.append(book.get('id'))
+            self.book_titles.append(book.get('title'))
+            self.book_slugs.append(book.get('slug'))
+            for edition in book.get('editions') or ():
+                if edition.__class__ is dict:
+                    editions.append(edition)
+                    self.book_index.append(book_number)
+        for flags in evaluate_book_flags(books):
+            for flag in flags:
+                self.book_flag_counts[flag.rule] = self.book_flag_counts.get(flag.rule, 0) + 1
+                self.flag_severity.setdefault(flag.rule, flag.severity)
+        first = len(self.score)
+        for edition in editions:
+            score = edition.get('score')
+            self.score.append(score if isinstance(score, (int, float)) else MISSING_SCORE)
+        for facet, read in STATS_FACET_READERS.items():
+            codes, values, lookup = self.facet_codes[facet], self.facet_values[facet], self.facet_lookup[facet]
+            for edition in editions:
+                value = read(edition) or NO_FACET_VALUE
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(values)
+                    values.append(value)
+                codes.append(code)
+        for column in self.flag_columns.values():
+            column.frombytes(bytes(len(editions)))
+        for position, flags in enumerate(evaluate_edition_flags(editions), start=first):
+            self.flag_count.append(len(flags))
+            for flag in flags:
+                column = self.flag_columns.get(flag.rule)
+                if column is None:
+                    column = self.flag_columns[flag.rule] = array('b', bytes(len(self.score)))
+                    self.flag_severity[flag.rule] = flag.severity
+                column[position] = 1
+
+def build_edition_columns(books, progress=None):
+    """Builds EditionColumns from an iterable of books, a batch at a time. progress(books, editions) is called after each batch."""
+    columns = EditionColumns()
+    books = iter(books)
+    with timings.span("stats_columns"):
+        while True:
+            batch = list(islice(books, STATS_BUILD_BATCH))
+            if not batch: break
+            columns.add_books(batch)
+            if progress is not None and progress(len(columns.book_ids), len(columns)) is False:
+                break # Stale GUI request
+    return columns
+
+def percentile(sorted_values, q):
+    """Returns the q-th percentile of a sorted list, interpolating linearly like numpy.percentile."""
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+def numpy_aggregates(np, columns, low_score):
+    """column_aggregates over NumPy views of the columns (no copies)."""
+    score = np.frombuffer(columns.score, dtype=np.float64)
+    scored_mask = ~np.isnan(score)
+    scored = score[scored_mask]
+    low = score < low_score # NaN never compares below
+    flagged = np.frombuffer(columns.flag_count, dtype=np.int64) > 0
+
+    def grouped(codes, size):
+        codes = np.frombuffer(codes, dtype=np.int64)
+        return { "editions": np.bincount(codes, minlength=size).tolist(),
+                 "scored": np.bincount(codes[scored_mask], minlength=size).tolist(),
+                 "score_sum": np.bincount(codes[scored_mask], weights=scored, minlength=size).tolist(),
+                 "low": np.bincount(codes[low], minlength=size).tolist(),
+                 "flagged": np.bincount(codes[flagged], minlength=size).tolist() }
+
+    result = { "scored": int(scored.size), "low": int(np.count_nonzero(low)), "flagged": int(np.count_nonzero(flagged)),
+               "flag_editions": { rule: int(np.count_nonzero(np.frombuffer(column, dtype=np.int8))) for rule, column in columns.flag_columns.items() },
+               "facets": { facet: grouped(columns.facet_codes[facet], len(columns.facet_values[facet])) for facet in STATS_FACETS },
+               "books": grouped(columns.book_index, len(columns.book_ids)) }
+    if scored.size:
+        counts, edges = np.histogram(scored, bins=STATS_HISTOGRAM_BINS)
+        result.update(score_sum=float(scored.sum()), score_min=float(scored.min()), score_max=float(scored.max()),
+                      percentiles=np.percentile(scored, STATS_PERCENTILES).tolist(), histogram=(counts.tolist(), edges.tolist()))
+    return result
+
+def python_aggregates(columns, low_score):
+    """column_aggregates without NumPy: one loop per grouping."""
+    score = columns.score
+    low = [value < low_score for value in score] # NaN never compares below
+    flagged = [count > 0 for count in columns.flag_count]
+
+    def grouped(codes, size):
+        totals = { name: [0] * size for name in ("editions", "scored", "score_sum", "low", "flagged") }
+        editions, scored, score_sum, low_counts, flagged_counts = totals.values()
+        for code, value, is_low, is_flagged in zip(codes, score, low, flagged):
+            editions[code] += 1
+            if value == value:
+                scored[code] += 1
+                score_sum[code] += value
+            if is_low: low_counts[code] += 1
+            if is_flagged: flagged_counts[code] += 1
+        return totals
+
+    scored = sorted(value for value in score if value == value)
+    result = { "scored": len(scored), "low": sum(low), "flagged": sum(flagged),
+               "flag_editions": { rule: sum(column) for rule, column in columns.flag_columns.items() },
+               "facets": { facet: grouped(columns.facet_codes[facet], len(columns.facet_values[facet])) for facet in STATS_FACETS },
+               "books": grouped(columns.book_index, len(columns.book_ids)) }
+    if scored:
+        first, last = scored[0], scored[-1]
+        if first == last: first, last = first - 0.5, last + 0.5 # Same range numpy.histogram picks
+        width = (last - first) / STATS_HISTOGRAM_BINS
+        counts = [0] * STATS_HISTOGRAM_BINS
+        for value in scored:
+            counts[min(int((value - first) / width), STATS_HISTOGRAM_BINS - 1)] += 1
+        edges = [first + width * i for i in range(STATS_HISTOGRAM_BINS)] + [last]
+        result.update(score_sum=float(sum(scored)), score_min=float(scored[0]), score_max=float(scored[-1]),
+                      percentiles=[percentile(scored, q) for q in STATS_PERCENTILES], histogram=(counts, edges))
+    return result
+
+def column_aggregates(columns, low_score):
+    """Returns the raw counts and sums every statistic is derived from, using NumPy when it is installed."""
+    np = optional_module('numpy')
+    if np is not None and len(columns):
+        return numpy_aggregates(np, columns, low_score)
+    return python_aggregates(columns, low_score)
+
+def share(part, whole):
+    return round(part / whole, 4) if whole else 0.0
+
+def edition_statistics(columns, low_score=None, top=DEFAULT_STATS_TOP, min_editions=DEFAULT_STATS_MIN_EDITIONS):
+    """Computes the data-quality statistics of EditionColumns as a JSON-friendly dict.
+
+    Scores below low_score (default: the low_score rule's threshold) count as low. Breakdowns
+    keep the 'top' most common values per facet; the low-score ranking keeps the 'top' books
+    (of at least min_editions editions) with the highest share of low-score editions.
+    """
+    low_score = default_low_score_threshold() if low_score is None else low_score
+    editions = len(columns)
+    with timings.span("stats_compute", rows=editions):
+        raw = column_aggregates(columns, low_score)
+        stats = { "books": len(columns.book_ids), "editions": editions, "low_score_threshold": low_score,
+                  "low_score_editions": raw["low"], "low_score_share": share(raw["low"], editions),
+                  "flagged_editions": raw["flagged"], "flagged_share": share(raw["flagged"], editions) }
+        score = { "scored": raw["scored"], "missing": editions - raw["scored"] }
+        if raw["scored"]:
+            counts, edges = raw["histogram"]
+            score.update(mean=round(raw["score_sum"] / raw["scored"], 1), min=raw["score_min"], max=raw["score_max"],
+                         percentiles={ f"p{q}": round(value, 1) for q, value in zip(STATS_PERCENTILES, raw["percentiles"]) },
+                         histogram=[{ "from": round(edges[i], 1), "to": round(edges[i + 1], 1), "editions": int(count) } for i, count in enumerate(counts)])
+        stats["score"] = score
+        stats["edition_flags"] = sorted(({ "rule": rule, "severity": columns.flag_severity[rule], "editions": count, "share": share(count, editions) }
+                                         for rule, count in raw["flag_editions"].items()), key=lambda item: (-item["editions"], item["rule"]))
+        stats["book_flags"] = sorted(({ "rule": rule, "severity": columns.flag_severity[rule], "books": count, "share": share(count, len(columns.book_ids)) }
+                                      for rule, count in columns.book_flag_counts.items()), key=lambda item: (-item["books"], item["rule"]))
+        stats["breakdowns"] = {}
+        for facet in STATS_FACETS:
+            groups = raw["facets"][facet]
+            codes = heapq.nsmallest(top, range(len(groups["editions"])), key=lambda code: (-groups["editions"][code], str(columns.facet_values[facet][code])))
+            stats["breakdowns"][facet] = [{ "value": columns.facet_values[facet][code], "editions": groups["editions"][code],
+                                            "share": share(groups["editions"][code], editions),
+                                            "mean_score": round(groups["score_sum"][code] / groups["scored"][code], 1) if groups["scored"][code] else None,
+                                            "low_score_share": share(groups["low"][code], groups["editions"][code]),
+                                            "flagged_share": share(groups["flagged"][code], groups["editions"][code]) } for code in codes]
+        books = raw["books"]
+        candidates = (book for book in range(len(columns.book_ids)) if books["low"][book] and books["editions"][book] >= min_editions)
+        worst = heapq.nsmallest(top, candidates, key=lambda book: (-books["low"][book] / books["editions"][book], -books["low"][book], book))
+        stats["worst_books"] = [{ "book_id": columns.book_ids[book], "title": columns.book_titles[book], "slug": columns.book_slugs[book],
+                                  "editions": books["editions"][book], "scored_editions": books["scored"][book], "low_score_editions": books["low"][book],
+                                  "low_score_share": share(books["low"][book], books["editions"][book]) } for book in worst]
+    return stats
+
+def histogram_bar(count, largest, width=40):
+    return "█" * (round(count / largest * width) if largest else 0)
+
+def build_statistics_model(stats):
+    """Builds a TextModel showing edition_statistics output in the Statistics tab."""
+    model = TextModel()
+    editions = stats["editions"]
+    model.add(f"Data-Quality Statistics: {stats['books']:,} books, {editions:,} editions\n", ("header",))
+    model.add("-" * 50 + "\n", ("separator",))
+    if not editions:
+        model.add("No editions to analyse.\n", ("value",))
+        return model
+    score = stats["score"]
+    model.add_pair("Scored Editions: ", f"{score['scored']:,} ({share(score['scored'], editions):.1%}), {score['missing']:,} without a score")
+    model.add_pair(f"Low Score (below {stats['low_score_threshold']:g}): ", f"{stats['low_score_editions']:,} editions ({stats['low_score_share']:.1%})")
+    model.add_pair("Flagged Editions: ", f"{stats['flagged_editions']:,} ({stats['flagged_share']:.1%})")
+    if score['scored']:
+        model.add_pair("Score Mean / Min / Max: ", f"{score['mean']:g} / {score['min']:g} / {score['max']:g}")
+        model.add_pair("Percentiles: ", "  ".join(f"{name} {value:g}" for name, value in score['percentiles'].items()))
+        model.add("\nScore Distribution:\n", ("header",))
+        largest = max(item["editions"] for item in score["histogram"])
+        for item in score["histogram"]:
+            model.add(f"  {item['from']:>8g} - {item['to']:<8g} ", ("label",))
+            model.add(f"{item['editions']:>8,} {histogram_bar(item['editions'], largest)}\n", ("value",))
+
+    model.add("\nEdition Flags:\n", ("header",))
+    for item in stats["edition_flags"]:
+        model.add(f"  {item['rule']:<22}", (SEVERITY_TAGS[item['severity']],))
+        model.add(f"{item['editions']:>10,}  {item['share']:>7.1%}\n", ("value",))
+    if stats["book_flags"]:
+        model.add("\nBook Flags:\n", ("header",))
+        for item in stats["book_flags"]:
+            model.add(f"  {item['rule']:<22}", (SEVERITY_TAGS[item['severity']],))
+            model.add(f"{item['books']:>10,}  {item['share']:>7.1%} of books\n", ("value",))
+
+    for facet, label in STATS_FACETS.items():
+        model.add(f"\nBy {label}:\n", ("header",))
+        model.add(f"  {'':<28}{'Editions':>10} {'Share':>7} {'Mean Score':>11} {'Low Score':>10} {'Flagged':>8}\n", ("label",))
+        for row in stats["breakdowns"][facet]:
+            mean = f"{row['mean_score']:g}" if row['mean_score'] is not None else "-"
+            model.add(f"  {str(row['value'])[:27]:<28}", ("label",))
+            model.add(f"{row['editions']:>10,} {row['share']:>7.1%} {mean:>11} {row['low_score_share']:>10.1%} {row['flagged_share']:>8.1%}\n", ("value",))
+
+    model.add("\nBooks With The Highest Share Of Low-Score Editions:\n", ("header",))
+    if not stats["worst_books"]:
+        model.add("  None.\n", ("value",))
+    for row in stats["worst_books"]:
+        model.add(f"  {row['low_score_share']:>7.1%}  ", ("warning_flag",))
+        model.add(f"{row['low_score_editions']:,} of {row['editions']:,} editions  ", ("value",))
+        title = str(row['title'] or f"Book {row['book_id']}")
+        url = get_book_url(row['slug'])
+        if url: model.add_link(title, url)
+        else: model.add(title, ("value",))
+        model.add(f"  (ID {row['book_id']})\n", ("label",))
+    return model
+
+def resolve_cli_token(args):
+    """Picks the bearer token from --token, the HARDCOVER_TOKEN environment variable or the saved config."""
+    return (args.token or os.getenv('HARDCOVER_TOKEN') or load_saved_token()).strip()
+
+def resolve_cli_identifiers(args, bearer_token, source):
+    """Reads and resolves the identifiers of a 'resolve' or 'batch --identifiers' run. Returns resolution records, or None after printing an error."""
+    try:
+        entries = read_identifiers(source)
+    except OSError as e:
+        print(f"Error reading identifiers: {e}", file=sys.stderr)
+        return None
+    if not entries:
+        print("Error: No identifiers to resolve.", file=sys.stderr)
+        return None
+    try:
+        resolutions = resolve_identifiers(bearer_token, [key for _, key in entries if key], batch_size=getattr(args, 'batch_size', DEFAULT_RESOLVE_BATCH_SIZE),
+                                          timeout=args.timeout, force_refresh=args.force_refresh, offline=args.offline,
+                                          progress=lambda done, total: print(f"Resolved {done} of {total} identifiers.", file=sys.stderr))
+    except (requests.exceptions.RequestException, GraphQLError) as e:
+        print(f"Error resolving identifiers: {e}", file=sys.stderr)
+        return None
+    records = resolution_records(entries, resolutions)
+    print(summarize_resolutions(records), file=sys.stderr)
+    return records
+
+def cmd_resolve(args):
+    """Entry point for the 'resolve' command."""
+    bearer_token = resolve_cli_token(args)
+    if not bearer_token and not args.offline:
+        print("Error: No bearer token. Use --token, set HARDCOVER_TOKEN, or save one from the GUI.", file=sys.stderr)
+        return 2
+    if args.batch_size < 1:
+        print("Error: --batch-size must be at least 1.", file=sys.stderr)
+        return 2
+    records = resolve_cli_identifiers(args, bearer_token, args.identifiers)
+    if records is None:
+        return 2
+    out_stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        if args.ids_only:
+            for book_id in resolved_book_ids(records):
+                out_stream.write(f"{book_id}\n")
+        else:
+            for record in records:
+                write_jsonl_record(out_stream, record)
+    finally:
+        if out_stream is not sys.stdout: out_stream.close()
+    if not args.offline: print(get_request_scheduler().summary(), file=sys.stderr)
+    return 0 if all(record["status"] == "resolved" for record in records) else 1
+
+def cmd_batch(args):
+    """Entry point for the 'batch' command."""
+    bearer_token = resolve_cli_token(args)
+    if not bearer_token and not args.offline:
+        print("Error: No bearer token. Use --token, set HARDCOVER_TOKEN, or save one from the GUI.", file=sys.stderr)
+        return 2
+    if args.chunk_size < 1:
+        print("Error: --chunk-size must be at least 1.", file=sys.stderr)
+        return 2
+    if args.check_links and args.offline:
+        print("Error: --check-links needs the network and cannot be combined with --offline.", file=sys.stderr)
+        return 2
+    if args.skip_unchanged and args.stream:
+        print("Error: --skip-unchanged cannot be combined with --stream (streamed books are not snapshotted).", file=sys.stderr)
+        return 2
+    if args.skip_unchanged and get_response_cache() is None:
+        print("Warning: --skip-unchanged needs the response cache, which is disabled; auditing every book.", file=sys.stderr)
+    if args.profile not in get_query_profiles():
+        print(f"Error: Unknown query profile '{args.profile}'. Choose from: {', '.join(sorted(get_query_profiles()))}.", file=sys.stderr)
+        return 2
+    if args.identifiers:
+        records = resolve_cli_identifiers(args, bearer_token, args.ids)
+        if records is None:
+            return 2
+        book_ids = resolved_book_ids(records)
+    else:
+        try:
+            book_ids = read_book_ids(args.ids)
+        except OSError as e:
+            print(f"Error reading Book IDs: {e}", file=sys.stderr)
+            return 2
+    if not book_ids:
+        print("Error: No Book IDs to audit.", file=sys.stderr)
+        return 2
+    try:
+        report = open_report_writer(args.report, args.report_format, args.report_flagged_only) if args.report else None
+    except (ValueError, OSError) as e:
+        print(f"Error opening report: {e}", file=sys.stderr)
+        return 2
+    out_stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    timings.set_profiling(bool(args.cprofile))
+    try:
+        failed = timings.profiled(run_batch_audit)(bearer_token, book_ids, out_stream, chunk_size=args.chunk_size, timeout=args.timeout,
+                                                   force_refresh=args.force_refresh, offline=args.offline, profile=args.profile, stream=args.stream, skip_unchanged=args.skip_unchanged,
+                                                   check_links=args.check_links, report=report)
+    finally:
+        if out_stream is not sys.stdout: out_stream.close()
+        if report: report.close()
+        save_identifier_index()
+        write_timing_exports(args)
+    if not args.offline: print(get_request_scheduler().summary(), file=sys.stderr)
+    print(f"Done: {len(book_ids) - failed} of {len(book_ids)} books fetched.", file=sys.stderr)
+    return 1 if failed else 0
+
+def cmd_catalog(args):
+    """Entry point for the 'catalog' command."""
+    bearer_token = resolve_cli_token(args)
+    kind, name = next(((kind, getattr(args, kind)) for kind in ENUMERATION_FILTERS if getattr(args, kind)), (None, None))
+    if not bearer_token:
+        print("Error: No bearer token. Use --token, set HARDCOVER_TOKEN, or save one from the GUI.", file=sys.stderr)
+        return 2
+    if not name or not name.strip():
+        print("Error: Give an --author, --publisher or --series name.", file=sys.stderr)
+        return 2
+    if min(args.page_size, args.concurrency, args.top) < 1 or (args.max_books is not None and args.max_books < 1):
+        print("Error: --page-size, --concurrency, --top and --max-books must be at least 1.", file=sys.stderr)
+        return 2
+    if args.concurrency >= HTTP_POOL_SIZE: # One pooled connection is left for listing the next page
+        print(f"Warning: --concurrency is limited to {HTTP_POOL_SIZE - 1}.", file=sys.stderr)
+        args.concurrency = HTTP_POOL_SIZE - 1
+    if args.profile not in get_query_profiles():
+        print(f"Error: Unknown query profile '{args.profile}'. Choose from: {', '.join(sorted(get_query_profiles()))}.", file=sys.stderr)
+        return 2
+    try:
+        report = open_report_writer(args.report, args.report_format, args.report_flagged_only) if args.report else None
+    except (ValueError, OSError) as e:
+        print(f"Error opening report: {e}", file=sys.stderr)
+        return 2
+    out_stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    timings.set_profiling(bool(args.cprofile))
+    try:
+        failed = timings.profiled(run_catalog_audit)(bearer_token, kind, name.strip(), out_stream, page_size=args.page_size, concurrency=args.concurrency,
+                                                     top=args.top, max_books=args.max_books, timeout=args.timeout, force_refresh=args.force_refresh,
+                                                     profile=args.profile, check_links=args.check_links, report=report)
+    finally:
+        if out_stream is not sys.stdout: out_stream.close()
+        if report: report.close()
+        save_identifier_index()
+        write_timing_exports(args)
+    print(get_request_scheduler().summary(), file=sys.stderr)
+    if failed:
+        print("Done with errors: the listing stopped early." if failed < 0 else f"Done: {failed} books could not be fetched.", file=sys.stderr)
+        return 1
+    print("Done.", file=sys.stderr)
+    return 0
+
+def cmd_audit_dump(args):
+    """Entry point for the 'audit-dump' command."""
+    if not os.path.isfile(args.dump):
+        print(f"Error: No such file: {args.dump}", file=sys.stderr)
+        return 2
+    if (args.workers is not None and args.workers < 1) or args.top < 1:
+        print("Error: --workers and --top must be at least 1.", file=sys.stderr)
+        return 2
+    out_stream = open(args.output, 'w', encoding='utf-8') if args.output else None
+    start = time.perf_counter()
+    try:
+        summary = run_dump_audit(args.dump, workers=args.workers, top=args.top, out_stream=out_stream, shared_identifiers=not args.no_shared_identifiers)
+    except (OSError, ValueError) as e:
+        print(f"Error reading dump: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if out_stream is not None: out_stream.close()
+        write_timing_exports(args)
+    seconds = time.perf_counter() - start
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    print_worst_editions(summary["worst_editions"])
+    print(f"Done: {summary['books']} books, {summary['editions']} editions in {seconds:.1f} s ({summary['editions'] / max(seconds, 1e-9):.0f} editions/s)"
+          + (f", {len(summary['errors'])} unreadable lines." if summary['errors'] else "."), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+def cmd_stats(args):
+    """Entry point for the 'stats' command."""
+    if args.top < 1 or args.min_editions < 1:
+        print("Error: --top and --min-editions must be at least 1.", file=sys.stderr)
+        return 2
+    errors = []
+    if args.source:
+        if not os.path.isfile(args.source):
+            print(f"Error: No such file: {args.source}", file=sys.stderr)
+            return 2
+        books = read_dump_books(args.source, errors)
+    else:
+        cache = get_response_cache()
+        if cache is None:
+            print("Error: The response cache is disabled or could not be opened.", file=sys.stderr)
+            return 2
+        books = cache.iter_books(profile_hash(args.profile))
+    start = time.perf_counter()
+    try:
+        columns = build_edition_columns(books)
+    except (OSError, ValueError) as e:
+        print(f"Error reading books: {e}", file=sys.stderr)
+        return 2
+    built = time.perf_counter()
+    stats = edition_statistics(columns, low_score=args.low_score, top=args.top, min_editions=args.min_editions)
+    computed = time.perf_counter()
+    write_timing_exports(args)
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    print(f"Done: {len(columns.book_ids)} books, {len(columns)} editions; columns built in {built - start:.2f} s, statistics computed in "
+          f"{(computed - built) * 1000:.1f} ms ({'NumPy' if optional_module('numpy') else 'pure Python'})"
+          + (f", {len(errors)} unreadable lines." if errors else "."), file=sys.stderr)
+    return 1 if errors else 0
+
+def write_timing_exports(args):
+    """Writes the --trace and --cprofile files requested on the command line."""
+    try:
+        if args.trace:
+            timings.export_chrome_trace(args.trace)
+            print(f"Trace written to {args.trace}.", file=sys.stderr)
+        if getattr(args, 'cprofile', None) and timings.save_profile(args.cprofile):
+            print(f"cProfile data written to {args.cprofile}.", file=sys.stderr)
+    except OSError as e:
+        print(f"Error writing timing exports: {e}", file=sys.stderr)
+
+def cmd_cache(args):
+    """Entry point for the 'cache' command."""
+    cache = get_response_cache()
+    if cache is None:
+        print("Error: The response cache is disabled or could not be opened.", file=sys.stderr)
+        return 2
+    if args.clear:
+        cache.clear()
+        global _identifier_index
+        _identifier_index = IdentifierIndex()
+        if os.path.exists(get_identifier_index_path()): os.remove(get_identifier_index_path())
+        print("Cache, snapshots, identifier resolutions and identifier index cleared.", file=sys.stderr)
+    stats = cache.stats()
+    stats["identifiers_indexed"] = get_identifier_index().count
+    print(json.dumps(stats, indent=4))
+    return 0
+
+def add_fetch_arguments(parser):
+    """Adds the options every fetching command shares."""
+    parser.add_argument('--timeout', type=float, default=30, help="Request timeout in seconds (default 30).")
+    parser.add_argument('--token', help="Hardcover bearer token (defaults to HARDCOVER_TOKEN or the saved token).")
+    parser.add_argument('--force-refresh', action='store_true', help="Ignore cached responses and re-fetch every book.")
+    parser.add_argument('--profile', default=DEFAULT_QUERY_PROFILE, help="Query profile: 'full', 'flags' (only what the flag rules need), 'identifiers', or one from config.json.")
+
+def add_output_arguments(parser):
+    """Adds the link check, report and timing options every auditing command shares."""
+    parser.add_argument('--check-links', action='store_true', help="Probe image and platform links so dead ones are flagged (dead_image, broken_links).")
+    parser.add_argument('--report', help="Also write a per-edition report to this file (.csv, .jsonl or .html), one book at a time as it is audited.")
+    parser.add_argument('--report-format', choices=sorted(REPORT_WRITERS), help="Report format, if the --report file name does not say.")
+    parser.add_argument('--report-flagged-only', action='store_true', help="Leave editions without flags out of the report.")
+    parser.add_argument('--trace', help="Write per-phase timings to this file as a Chrome trace (chrome://tracing, Perfetto).")
+    parser.add_argument('--cprofile', help="Profile the run with cProfile and write pstats data to this file.")
+
+def build_arg_parser():
+    """Builds the command-line parser. With no command the GUI is started."""
+    parser = argparse.ArgumentParser(description="Hardcover Librarian Tool. Run without a command to start the GUI.")
+    parser.add_argument('--startup-profile', action='store_true', help="Start the GUI, print how long startup took (JSON) and exit.")
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch_parser = subparsers.add_parser('batch', help="Fetch many Book IDs headlessly and write JSONL.")
+    batch_parser.add_argument('ids', help="File with Book IDs (one per line, or comma/space separated). Use '-' for stdin.")
+    batch_parser.add_argument('-o', '--output', help="Write JSONL to this file instead of stdout.")
+    batch_parser.add_argument('--identifiers', action='store_true', help="The file lists ISBNs and ASINs instead; resolve them to Book IDs first (see 'resolve').")
+    batch_parser.add_argument('--chunk-size', type=int, default=DEFAULT_BATCH_CHUNK_SIZE, help=f"Book IDs per GraphQL request (default {DEFAULT_BATCH_CHUNK_SIZE}).")
+    add_fetch_arguments(batch_parser)
+    batch_parser.add_argument('--offline', action='store_true', help="Only use previously fetched books from the local cache.")
+    batch_parser.add_argument('--stream', action='store_true', help="Parse and write books while they download, keeping memory flat for very large books.")
+    batch_parser.add_argument('--skip-unchanged', action='store_true', help="Don't audit books whose content has not changed since they were last fetched; add a diff to the ones that have. Use with --force-refresh to re-check the API.")
+    add_output_arguments(batch_parser)
+    batch_parser.set_defaults(func=cmd_batch)
+
+    resolve_parser = subparsers.add_parser('resolve', help="Map ISBNs and ASINs to Hardcover Book IDs, writing one JSONL record per value.")
+    resolve_parser.add_argument('identifiers', help="File with ISBN-10s, ISBN-13s or ASINs (one per line, or comma/space separated). Use '-' for stdin.")
+    resolve_parser.add_argument('-o', '--output', help="Write to this file instead of stdout.")
+    resolve_parser.add_argument('--ids-only', action='store_true', help="Write only the distinct Book IDs, one per line, ready for 'batch' or the Worklist tab.")
+    resolve_parser.add_argument('--batch-size', type=int, default=DEFAULT_RESOLVE_BATCH_SIZE, help=f"Identifiers per GraphQL request (default {DEFAULT_RESOLVE_BATCH_SIZE}).")
+    resolve_parser.add_argument('--timeout', type=float, default=30, help="Request timeout in seconds (default 30).")
+    resolve_parser.add_argument('--token', help="Hardcover bearer token (defaults to HARDCOVER_TOKEN or the saved token).")
+    resolve_parser.add_argument('--force-refresh', action='store_true', help="Ignore cached resolutions and query every identifier again.")
+    resolve_parser.add_argument('--offline', action='store_true', help="Only use earlier resolutions and the identifiers of previously fetched books.")
+    resolve_parser.set_defaults(func=cmd_resolve)
+
+    catalog_parser = subparsers.add_parser('catalog', help="Audit every book by an author, publisher or series and rank the worst editions.")
+    target = catalog_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--author', help="Exact author name.")
+    target.add_argument('--publisher', help="Exact publisher name (books with at least one edition from it).")
+    target.add_argument('--series', help="Exact series name.")
+    catalog_parser.add_argument('-o', '--output', help="Write JSONL to this file instead of stdout.")
+    catalog_parser.add_argument('--page-size', type=int, default=DEFAULT_BATCH_CHUNK_SIZE, help=f"Books listed and fetched per request (default {DEFAULT_BATCH_CHUNK_SIZE}).")
+    catalog_parser.add_argument('--concurrency', type=int, default=DEFAULT_CATALOG_CONCURRENCY, help=f"Pages fetched at the same time (default {DEFAULT_CATALOG_CONCURRENCY}, at most {HTTP_POOL_SIZE - 1}).")
+    catalog_parser.add_argument('--top', type=int, default=DEFAULT_CATALOG_TOP, help=f"Worst editions kept in the final ranking (default {DEFAULT_CATALOG_TOP}).")
+    catalog_parser.add_argument('--max-books', type=int, help="Stop after this many books.")
+    add_fetch_arguments(catalog_parser)
+    add_output_arguments(catalog_parser)
+    catalog_parser.set_defaults(func=cmd_catalog)
+
+    dump_parser = subparsers.add_parser('audit-dump', help="Audit a local JSON/JSONL dump of books on every CPU core, without the API.")
+    dump_parser.add_argument('dump', help="JSONL file with one book (or query response, or batch record) per line, or one JSON query response / list of books.")
+    dump_parser.add_argument('-o', '--output', help="Also write each book's audit to this JSONL file, in dump order.")
+    dump_parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU core).")
+    dump_parser.add_argument('--top', type=int, default=DEFAULT_CATALOG_TOP, help=f"Worst editions kept in the summary (default {DEFAULT_CATALOG_TOP}).")
+    dump_parser.add_argument('--no-shared-identifiers', action='store_true', help="Skip the identifier pass and the shared_identifiers flag.")
+    dump_parser.add_argument('--trace', help="Write per-phase timings to this file as a Chrome trace (chrome://tracing, Perfetto).")
+    dump_parser.set_defaults(func=cmd_audit_dump)
+
+    stats_parser = subparsers.add_parser('stats', help="Print aggregate data-quality statistics (JSON) for a dump, batch output or the cached books.")
+    stats_parser.add_argument('source', nargs='?', help="JSON/JSONL dump or batch/catalog output (default: every cached book fetched with --profile).")
+    stats_parser.add_argument('--profile', default=DEFAULT_QUERY_PROFILE, help="Query profile whose cached books are used when no file is given.")
+    stats_parser.add_argument('--low-score', type=float, help="Scores below this count as low (default: the low_score rule's threshold).")
+    stats_parser.add_argument('--top', type=int, default=DEFAULT_STATS_TOP, help=f"Rows per breakdown and books in the low-score ranking (default {DEFAULT_STATS_TOP}).")
+    stats_parser.add_argument('--min-editions', type=int, default=DEFAULT_STATS_MIN_EDITIONS, help=f"Editions a book needs to be ranked (default {DEFAULT_STATS_MIN_EDITIONS}).")
+    stats_parser.add_argument('--trace', help="Write per-phase timings to this file as a Chrome trace (chrome://tracing, Perfetto).")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    cache_parser = subparsers.add_parser('cache', help="Show or clear the local response cache and identifier index.")
+    cache_parser.add_argument('--clear', action='store_true', help="Remove every cached response, snapshot, identifier resolution and indexed identifier.")
+    cache_parser.set_defaults(func=cmd_cache)
+    return parser
+
+# --- GUI Setup ---
+if __name__ == "__main__":
+    cli_args = build_arg_parser().parse_args()
+    if cli_args.command:
+        sys.exit(cli_args.func(cli_args))
+    startup_marks = { "module_loaded": time.perf_counter() }
+
+    window = tk.Tk()
+    startup_marks['tk_ready'] = time.perf_counter()
+    fetch_engine = FetchEngine(window)
+    worklist = WorklistPrefetcher(fetch_engine, on_change=lambda index: refresh_worklist_row(index)) # Limits are read from config in finish_startup
+    streamed_view = None # Model and progress of the book whose editions are arriving page by page
+    displayed_book_id = None # Book ID whose full model is in the Output tab, for in-place re-fetches
+    displayed_book = None # That book's data, for report export
+    scheduler_retries_shown = 0 # Request scheduler retries already reported in the status bar
+    window.title("Hardcover Librarian Tool") # New Title
+    window.geometry("850x700") # Adjusted size
+    window.config(bg=COLOR_BACKGROUND)
+
+    # The dark ttk theme is applied in finish_startup, once the window has been drawn
+    style = ttk.Style()
+
+    # Main Notebook
+    notebook = ttk.Notebook(window, style='TNotebook')
+    notebook.pack(pady=10, padx=10, fill="both", expand=True)
+
+    # Tab 1: Input & Controls
+    input_frame = ttk.Frame(notebook, padding="20", style='TFrame')
+    notebook.add(input_frame, text='Fetch Data')
+    input_frame.columnconfigure(1, weight=1)
+    token_label = ttk.Label(input_frame, text="Bearer Token:")
+    token_label.grid(row=0, column=0, sticky=tk.W, pady=5, padx=(0, 10))
+    token_entry = ttk.Entry(input_frame, width=60, show="*", style='TEntry')
+    token_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
+    book_id_label = ttk.Label(input_frame, text="Book ID:")
+    book_id_label.grid(row=1, column=0, sticky=tk.W, pady=5, padx=(0, 10))
+    book_id_entry = ttk.Entry(input_frame, width=20, style='TEntry')
+    book_id_entry.grid(row=1, column=1, sticky=tk.W, pady=5)
+    fetch_options_frame = ttk.Frame(input_frame, style='TFrame')
+    fetch_options_frame.grid(row=2, column=1, sticky=tk.W, pady=5)
+    force_refresh_var = tk.BooleanVar(value=False)
+    offline_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(fetch_options_frame, text="Force refresh", variable=force_refresh_var, style='TCheckbutton').pack(side=tk.LEFT, padx=(0, 15))
+    ttk.Checkbutton(fetch_options_frame, text="Offline (cached books only)", variable=offline_var, style='TCheckbutton').pack(side=tk.LEFT, padx=(0, 15))
+    check_links_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(fetch_options_frame, text="Check links", variable=check_links_var, style='TCheckbutton').pack(side=tk.LEFT, padx=(0, 15))
+    ttk.Label(fetch_options_frame, text="Fields:").pack(side=tk.LEFT, padx=(0, 5))
+    profile_names_by_label = {QUERY_PROFILES[DEFAULT_QUERY_PROFILE]['label']: DEFAULT_QUERY_PROFILE} # Rest loaded in finish_startup
+    profile_var = tk.StringVar(value=QUERY_PROFILES[DEFAULT_QUERY_PROFILE]['label'])
+    profile_combo = ttk.Combobox(fetch_options_frame, textvariable=profile_var, values=list(profile_names_by_label), state='readonly', width=18, style='TCombobox')
+    profile_combo.pack(side=tk.LEFT)
+    diagnostics_frame = ttk.Frame(input_frame, style='TFrame')
+    diagnostics_frame.grid(row=6, column=0, columnspan=2, sticky=tk.W, pady=(15, 0))
+    cprofile_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(diagnostics_frame, text="Capture cProfile", variable=cprofile_var, style='TCheckbutton',
+                    command=lambda: timings.set_profiling(cprofile_var.get())).pack(side=tk.LEFT, padx=(0, 15))
+    ttk.Button(diagnostics_frame, text="Export Timings...", command=export_timings, style='TButton').pack(side=tk.LEFT)
+    fetch_button = ttk.Button(input_frame, text="Fetch Data", command=fetch_and_process_data, style='TButton', width=15)
+    fetch_button.grid(row=3, column=0, columnspan=2, pady=(25, 15))
+    status_var = tk.StringVar()
+    status_label = ttk.Label(input_frame, textvariable=status_var, wraplength=750) # Wider wrap
+    status_label.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+    link_font = tkFont.Font(family="Segoe UI", size=10, underline=True) # Consider generic font families later
+    link_label = ttk.Label(input_frame, text="", style='TLabel', cursor="hand2", font=link_font)
+    link_label.grid(row=5, column=0, columnspan=2, sticky=tk.W, pady=(5, 10))
+    link_label.grid_remove()
+
+    # Tab 2: Worklist
+    worklist_frame = ttk.Frame(notebook, padding="20", style='TFrame')
+    notebook.add(worklist_frame, text='Worklist')
+    worklist_frame.columnconfigure(0, weight=1)
+    worklist_frame.rowconfigure(3, weight=1)
+    ttk.Label(worklist_frame, text="Book IDs, or ISBNs/ASINs to resolve (one per line, or separated by commas or spaces):").grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
+    worklist_text = scrolledtext.ScrolledText(
+        worklist_frame, height=5, wrap=tk.WORD, bg=COLOR_WIDGET_BG, fg=COLOR_FOREGROUND, insertbackground=COLOR_FOREGROUND,
+        borderwidth=0, highlightthickness=1, highlightbackground=COLOR_BACKGROUND, highlightcolor=COLOR_ACCENT_FG, font=("Consolas", 10)
+    )
+    worklist_text.grid(row=1, column=0, sticky=(tk.W, tk.E))
+    worklist_buttons = ttk.Frame(worklist_frame, style='TFrame')
+    worklist_buttons.grid(row=2, column=0, sticky=tk.W, pady=10)
+    ttk.Button(worklist_buttons, text="Load List", command=load_worklist, style='TButton').pack(side=tk.LEFT, padx=(0, 10))
+    ttk.Button(worklist_buttons, text="Load File...", command=load_worklist_file, style='TButton').pack(side=tk.LEFT, padx=(0, 10))
+    ttk.Button(worklist_buttons, text="Resolve ISBNs/ASINs", command=resolve_worklist_identifiers, style='TButton').pack(side=tk.LEFT)
+    worklist_listbox = tk.Listbox(
+        worklist_frame, bg=COLOR_WIDGET_BG, fg=COLOR_FOREGROUND, selectbackground=COLOR_ACCENT_FG, selectforeground=COLOR_BACKGROUND,
+        borderwidth=0, highlightthickness=1, highlightbackground=COLOR_BACKGROUND, activestyle='none', font=("Consolas", 10)
+    )
+    worklist_listbox.grid(row=3, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+    worklist_listbox.bind("<Double-Button-1>", on_worklist_double_click)
+    worklist_nav = ttk.Frame(worklist_frame, style='TFrame')
+    worklist_nav.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+    ttk.Button(worklist_nav, text="◀ Previous", command=lambda: show_worklist_book(worklist.position - 1), style='TButton').pack(side=tk.LEFT, padx=(0, 10))
+    ttk.Button(worklist_nav, text="Next ▶", command=lambda: show_worklist_book(worklist.position + 1), style='TButton').pack(side=tk.LEFT, padx=(0, 15))
+    worklist_status_var = tk.StringVar(value="No worklist loaded. Alt+Right/Alt+Left move through it from any tab.")
+    ttk.Label(worklist_nav, textvariable=worklist_status_var).pack(side=tk.LEFT)
+    window.bind("<Alt-Right>", lambda e: show_worklist_book(worklist.position + 1))
+    window.bind("<Alt-Left>", lambda e: show_worklist_book(worklist.position - 1))
+
+    # Tab 3: Output Viewer, with the filter bar above it
+    output_frame = ttk.Frame(notebook, padding="5", style='TFrame')
+    notebook.add(output_frame, text='Output')
+    output_frame.rowconfigure(1, weight=1)
+    output_frame.columnconfigure(0, weight=1)
+    filter_frame = ttk.Frame(output_frame, style='TFrame')
+    filter_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+    filter_vars = {}
+    filter_combos = {}
+    filter_choices = {} # facet -> dropdown text -> facet value
+    filter_view = None # {"source": full model, "shown": filtered model} while a filter is active
+    for facet in EDITION_FACETS:
+        ttk.Label(filter_frame, text=FILTER_LABELS[facet] + ":", style='TLabel').pack(side=tk.LEFT, padx=(0, 3))
+        filter_vars[facet] = tk.StringVar(value=FILTER_ANY)
+        filter_combos[facet] = ttk.Combobox(filter_frame, textvariable=filter_vars[facet], values=[FILTER_ANY], state='readonly', width=14, style='TCombobox',
+                                            postcommand=lambda f=facet: refresh_filter_choices(f))
+        filter_combos[facet].pack(side=tk.LEFT, padx=(0, 10))
+        filter_combos[facet].bind("<<ComboboxSelected>>", apply_output_filters)
+    ttk.Button(filter_frame, text="Clear", command=lambda: clear_output_filters(rerender=True), style='TButton').pack(side=tk.LEFT)
+    ttk.Button(filter_frame, text="Export Report...", command=export_output_report, style='TButton').pack(side=tk.LEFT, padx=(5, 0))
+    filter_status_var = tk.StringVar()
+    ttk.Label(filter_frame, textvariable=filter_status_var, style='TLabel').pack(side=tk.LEFT, padx=(10, 0))
+    output_viewer = scrolledtext.ScrolledText(
+        output_frame, wrap=tk.WORD, state=tk.DISABLED, bg=COLOR_WIDGET_BG, fg=COLOR_FOREGROUND,
+        insertbackground=COLOR_FOREGROUND, selectbackground=COLOR_ACCENT_FG, selectforeground=COLOR_BACKGROUND,
+        borderwidth=0, highlightthickness=1, highlightbackground=COLOR_BACKGROUND, highlightcolor=COLOR_ACCENT_FG,
+        padx=8, pady=8, font=("Consolas", 10) # Monospace preferred for alignment
+    )
+    output_viewer.grid(row=1, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+    configure_output_tags(output_viewer)
+    output_viewer.tag_bind("hyperlink", "<Enter>", on_link_enter)
+    output_viewer.tag_bind("hyperlink", "<Leave>", on_link_leave)
+    output_viewer.bind("<Button-1>", on_link_click)
+
+    # Tab 4: Statistics across many books
+    stats_columns = None # EditionColumns of the loaded books
+    stats_skipped_lines = 0
+    stats_frame = ttk.Frame(notebook, padding="5", style='TFrame')
+    notebook.add(stats_frame, text='Statistics')
+    stats_frame.rowconfigure(2, weight=1)
+    stats_frame.columnconfigure(0, weight=1)
+    stats_controls = ttk.Frame(stats_frame, style='TFrame')
+    stats_controls.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+    ttk.Button(stats_controls, text="Cached Books", command=load_statistics_from_cache, style='TButton').pack(side=tk.LEFT, padx=(0, 5))
+    ttk.Button(stats_controls, text="Load File...", command=load_statistics_file, style='TButton').pack(side=tk.LEFT, padx=(0, 15))
+    ttk.Label(stats_controls, text="Low score below:", style='TLabel').pack(side=tk.LEFT, padx=(0, 3))
+    stats_threshold_var = tk.StringVar()
+    stats_threshold_entry = ttk.Entry(stats_controls, textvariable=stats_threshold_var, width=7, style='TEntry')
+    stats_threshold_entry.pack(side=tk.LEFT, padx=(0, 10))
+    ttk.Label(stats_controls, text="Rows:", style='TLabel').pack(side=tk.LEFT, padx=(0, 3))
+    stats_top_var = tk.StringVar(value=str(DEFAULT_STATS_TOP))
+    stats_top_entry = ttk.Entry(stats_controls, textvariable=stats_top_var, width=4, style='TEntry')
+    stats_top_entry.pack(side=tk.LEFT, padx=(0, 10))
+    ttk.Button(stats_controls, text="Recompute", command=recompute_statistics, style='TButton').pack(side=tk.LEFT)
+    for entry in (stats_threshold_entry, stats_top_entry):
+        entry.bind("<Return>", recompute_statistics)
+    stats_status_var = tk.StringVar(value="Load the cached books of the selected query profile, or a dump or batch output file.")
+    ttk.Label(stats_frame, textvariable=stats_status_var, style='TLabel').grid(row=1, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+    stats_viewer = scrolledtext.ScrolledText(
+        stats_frame, wrap=tk.NONE, state=tk.DISABLED, bg=COLOR_WIDGET_BG, fg=COLOR_FOREGROUND,
+        insertbackground=COLOR_FOREGROUND, selectbackground=COLOR_ACCENT_FG, selectforeground=COLOR_BACKGROUND,
+        borderwidth=0, highlightthickness=1, highlightbackground=COLOR_BACKGROUND, highlightcolor=COLOR_ACCENT_FG,
+        padx=8, pady=8, font=("Consolas", 10) # Monospace keeps the tables aligned
+    )
+    stats_viewer.grid(row=2, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+    configure_output_tags(stats_viewer)
+    stats_viewer.tag_bind("hyperlink", "<Enter>", on_link_enter)
+    stats_viewer.tag_bind("hyperlink", "<Leave>", on_link_leave)
+    stats_viewer.bind("<Button-1>", on_link_click)
+
+    # --- Load Configuration once the window is up ---
+    startup_marks['widgets_built'] = time.perf_counter()
+    window.after_idle(finish_startup, startup_marks, cli_args.startup_profile)
 
     # --- Run the GUI ---
-    window.mainloop()
\ No newline at end of file
+    book_id_entry.bind("<Return>", lambda e: fetch_and_process_data())
+    window.mainloop()
+    fetch_engine.shutdown()
+    save_identifier_index()
\ No newline at end of file
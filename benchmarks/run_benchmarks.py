@@ -0,0 +1,245 @@
+"""Times the hot paths of Hardcover_Librarian.py on synthetic books and reports the results as JSON.
+
+    python benchmarks/run_benchmarks.py --editions 100,1000,5000 --repeat 5 -o bench_output.json
+
+Each benchmark runs 'repeat' times and reports min/median/mean in milliseconds. The JSON
+report goes to stdout, or only to the -o file if one is given; progress goes to stderr. Fetch
+benchmarks (and the link check) go through the local stub server; rendering uses a hidden ScrolledText and is
+skipped when no display is available.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep the app's config, cache and identifier index away from the user's real ones.
+os.environ['APPDATA'] = tempfile.mkdtemp(prefix="hardcover-bench-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Hardcover_Librarian as librarian
+from stub_server import make_book, start_stub_server
+
+# The API's 60 requests/minute would dominate every fetch benchmark; the stub has no limit
+# unless bench_scheduler asks for one.
+librarian._request_scheduler = librarian.RequestScheduler(requests_per_minute=0)
+
+def summarize(samples):
+    """Returns min/median/mean of millisecond samples."""
+    return { "min_ms": round(min(samples), 3), "median_ms": round(statistics.median(samples), 3), "mean_ms": round(statistics.fmean(samples), 3) }
+
+def time_calls(func, repeat):
+    """Calls func() 'repeat' times and returns timing stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+def bench_processing(book, repeat):
+    """JSON decode, edition sort, flag evaluation (on dicts and on compact records), text model build and memory per edition for one book."""
+    payload = json.dumps({ "data": { "books": [book] } }).encode('utf-8')
+    editions = book['editions']
+    record = librarian.BookRecord.from_dict(book)
+    results = {
+        "json_decode": time_calls(lambda: json.loads(payload), repeat),
+        "edition_sort": time_calls(lambda: sorted(editions, key=librarian.edition_sort_key), repeat),
+        "flag_evaluation": time_calls(lambda: librarian.audit_books([book]), repeat),
+        "model_build": time_calls(lambda: librarian.build_book_model(book), repeat),
+        "record_build": time_calls(lambda: librarian.BookRecord.from_dict(book), repeat),
+        "flag_evaluation_records": time_calls(lambda: librarian.audit_books([record]), repeat),
+    }
+    results["json_decode"]["payload_bytes"] = len(payload)
+    results["memory_per_edition"] = measure_memory(payload, len(editions))
+    return results
+
+def measure_memory(payload, edition_count):
+    """Bytes held per edition by the decoded dicts versus the same book as compact records."""
+    tracemalloc.start()
+    try:
+        book = json.loads(payload)["data"]["books"][0]
+        as_dicts = tracemalloc.get_traced_memory()[0]
+        record = librarian.BookRecord.from_dict(book)
+        del book
+        as_records = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del record
+    return { "dict_bytes": round(as_dicts / max(edition_count, 1)), "record_bytes": round(as_records / max(edition_count, 1)) }
+
+def make_hidden_viewer():
+    """Creates a withdrawn Tk root with a ScrolledText configured like the Output tab. Returns None without a display."""
+    import tkinter as tk
+    from tkinter import scrolledtext
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Skipping render benchmarks (no display): {e}", file=sys.stderr)
+        return None
+    root.withdraw()
+    viewer = scrolledtext.ScrolledText(root, wrap=tk.WORD, state=tk.DISABLED, font=("Consolas", 10))
+    viewer.pack()
+    librarian.configure_output_tags(viewer)
+    return viewer
+
+def bench_render(viewer, book, repeat):
+    """Times display_formatted_data: the synchronous first chunk, and until every chunk is inserted."""
+    first_chunk = []
+    def render():
+        librarian._render_model_cache.clear() # Measure a cold render, not a memo hit
+        start = time.perf_counter()
+        librarian.display_formatted_data(viewer, book)
+        first_chunk.append((time.perf_counter() - start) * 1000)
+        while viewer.render_job is not None:
+            viewer.update()
+    full = time_calls(render, repeat)
+    return { "render_first_chunk": summarize(first_chunk), "render_full": full }
+
+def bench_fetch(url, book_id, batch_ids, repeat):
+    """Paged single-book fetch, one batch request and the same request parsed as a stream, all against the stub server."""
+    librarian.API_URL = url
+    return {
+        "fetch_paged": time_calls(lambda: librarian.fetch_book_paged("bench-token", book_id), repeat),
+        "fetch_batch": time_calls(lambda: librarian.fetch_books_batch("bench-token", batch_ids, force_refresh=True), repeat),
+        "fetch_batch_stream": time_calls(lambda: sum(1 for _ in librarian.stream_books_batch("bench-token", batch_ids)), repeat),
+    }
+
+def bench_link_check(edition_count, mappings, link_latency, repeat):
+    """Checks every image and platform link of one book against the stub, which answers each link after link_latency seconds."""
+    server, url = start_stub_server(edition_count, mappings, links=True, link_latency=link_latency)
+    try:
+        librarian.API_URL = url
+        urls = librarian.book_link_urls([librarian.fetch_book("bench-token", 1, force_refresh=True)])
+        checker = librarian.LinkChecker(ttl_seconds=0) # Every repeat probes again instead of reading the cache
+        result = time_calls(lambda: checker.check(urls), repeat)
+    finally:
+        server.shutdown()
+    result["urls"] = len(urls)
+    return { "link_check": result }
+
+def bench_scheduler(edition_count, mappings, rate_limit, requests_total=200, threads=8):
+    """Sends requests_total batch requests from 'threads' threads at a stub that allows rate_limit per second.
+
+    The client side has no token bucket, so this measures how close AIMD plus Retry-After
+    backoff gets to the server's limit, and how many requests were throttled on the way.
+    """
+    server, url = start_stub_server(edition_count, mappings, rate_limit=rate_limit)
+    scheduler = librarian.RequestScheduler(requests_per_minute=0, max_retries=10)
+    previous, librarian._request_scheduler = librarian._request_scheduler, scheduler
+    try:
+        librarian.API_URL = url
+        start = time.perf_counter()
+        with librarian.ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda n: librarian.fetch_books_batch("bench-token", [n % 50 + 1], force_refresh=True), range(requests_total)))
+        elapsed = time.perf_counter() - start
+    finally:
+        librarian._request_scheduler = previous
+        server.shutdown()
+    stats = scheduler.stats()
+    return { "scheduler": { "requests": requests_total, "seconds": round(elapsed, 3), "per_second": round(requests_total / elapsed, 2),
+                            "server_limit_per_second": rate_limit, "throttled": server.throttled_count, "retries": stats["retries"],
+                            "final_concurrency": stats["concurrency_limit"] } }
+
+def bench_dump_audit(edition_count, mappings, workers_list, target_editions=40000):
+    """Audits a JSONL dump of about target_editions editions with each worker count; reports editions/s and speedup over one worker."""
+    books = max(4, target_editions // max(edition_count, 1))
+    handle, path = tempfile.mkstemp(suffix=".jsonl", prefix="hardcover-bench-dump-")
+    with os.fdopen(handle, 'w', encoding='utf-8') as f:
+        for book_id in range(1, books + 1):
+            f.write(json.dumps(make_book(book_id, edition_count, mappings)) + "\n")
+    results = {}
+    saved_index = librarian._identifier_index
+    try:
+        for workers in workers_list:
+            # The fetch benchmarks fill the process-wide identifier index, which the dump audit merges
+            # in; start each run from an empty one so every run indexes the same identifiers.
+            librarian._identifier_index = librarian.IdentifierIndex()
+            start = time.perf_counter()
+            summary = librarian.run_dump_audit(path, workers=workers)
+            seconds = time.perf_counter() - start
+            results[f"dump_audit_{workers}_workers"] = { "seconds": round(seconds, 3), "editions": summary["editions"],
+                                                         "editions_per_second": round(summary["editions"] / seconds),
+                                                         "speedup": round(results.get("dump_audit_1_workers", {}).get("seconds", seconds) / seconds, 2) }
+    finally:
+        librarian._identifier_index = saved_index
+        os.remove(path)
+    return results
+
+def bench_statistics(edition_count, mappings, repeat, target_editions=100000):
+    """Builds statistics columns for about target_editions editions once, then times recomputing the Statistics tab over them, with and without NumPy."""
+    books = max(1, target_editions // max(edition_count, 1))
+    start = time.perf_counter()
+    columns = librarian.build_edition_columns(make_book(book_id, edition_count, mappings) for book_id in range(1, books + 1))
+    build_seconds = time.perf_counter() - start
+    results = { "statistics_recompute": time_calls(lambda: librarian.edition_statistics(columns), repeat) }
+    numpy_module = librarian.optional_module('numpy')
+    librarian._optional_modules['numpy'] = None
+    try:
+        results["statistics_recompute_pure_python"] = time_calls(lambda: librarian.edition_statistics(columns), repeat)
+    finally:
+        librarian._optional_modules['numpy'] = numpy_module
+    for timing in results.values():
+        timing.update(stats_editions=len(columns), columns_build_seconds=round(build_seconds, 3))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Hardcover Librarian on synthetic books.")
+    parser.add_argument('--editions', default="100,1000,5000", help="Comma-separated edition counts to test.")
+    parser.add_argument('--mappings', type=int, default=4, help="Platform mappings per edition.")
+    parser.add_argument('--batch-size', type=int, default=10, help="Books per request in the batch fetch benchmark.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-render', action='store_true', help="Do not open a hidden Tk window.")
+    parser.add_argument('--skip-fetch', action='store_true', help="Do not start the stub server.")
+    parser.add_argument('--dump-workers', default=f"1,{os.cpu_count() or 1}", help="Comma-separated worker counts for the dump audit benchmark (first should be 1).")
+    parser.add_argument('--link-latency', type=float, default=0.02, help="Seconds the stub takes per link in the link check benchmark.")
+    parser.add_argument('--rate-limit', type=float, default=40, help="Requests per second the stub allows in the scheduler benchmark.")
+    parser.add_argument('-o', '--output', help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    viewer = None if args.skip_render else make_hidden_viewer()
+    report = {
+        "meta": {
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": librarian.optional_module('numpy') is not None,
+            "repeat": args.repeat,
+            "mappings_per_edition": args.mappings,
+        },
+        "results": [],
+    }
+    for edition_count in [int(n) for n in args.editions.split(',') if n.strip()]:
+        print(f"Benchmarking {edition_count} editions...", file=sys.stderr)
+        book = make_book(1, edition_count, args.mappings)
+        results = bench_processing(book, args.repeat)
+        if viewer is not None:
+            results.update(bench_render(viewer, book, args.repeat))
+        if not args.skip_fetch:
+            server, url = start_stub_server(edition_count, args.mappings)
+            try:
+                results.update(bench_fetch(url, 1, list(range(1, args.batch_size + 1)), args.repeat))
+            finally:
+                server.shutdown()
+            results.update(bench_link_check(edition_count, args.mappings, args.link_latency, args.repeat))
+            results.update(bench_scheduler(min(edition_count, 100), args.mappings, args.rate_limit))
+        results.update(bench_statistics(edition_count, args.mappings, args.repeat))
+        results.update(bench_dump_audit(edition_count, args.mappings, sorted({int(n) for n in args.dump_workers.split(',') if n.strip()})))
+        for name, timing in results.items():
+            report["results"].append(dict({ "benchmark": name, "editions": edition_count }, **timing))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Synthetic Hardcover payloads and a local GraphQL stub server for benchmarks.
+
+Run standalone to point the app at it:
+    python benchmarks/stub_server.py --port 8765 --editions 2000
+    HARDCOVER_API_URL=http://127.0.0.1:8765/v1/graphql python Hardcover_Librarian.py
+
+With --links, image URLs and platform mapping IDs point back at the stub, which answers
+them like image hosts and book sites would (some dead, some refusing HEAD), so the link
+checker can be exercised without touching the internet.
+"""
+import argparse
+import functools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLATFORMS = ["goodreads", "google", "openlibrary", "amazon", "librarything"]
+FORMATS = ["Hardcover", "Paperback", "Ebook", "Audiobook", "Mass Market Paperback", None]
+PUBLISHERS = [f"Publisher {n}" for n in range(40)]
+LANGUAGES = ["English", "German", "French", "Spanish", "Italian", None]
+READING_FORMATS = ["Read", "Listened", "Ebook", None]
+
+# --- Payload Generator ---
+def make_isbn13(rng):
+    """Returns a random ISBN-13 with a valid checksum."""
+    core = "978" + "".join(str(rng.randint(0, 9)) for _ in range(9))
+    total = sum(int(c) * (1 if i % 2 == 0 else 3) for i, c in enumerate(core))
+    return core + str((10 - total % 10) % 10)
+
+def make_edition(rng, edition_id, mappings, link_base=None):
+    """Builds one edition shaped like the 'full' query profile's response. link_base points its links at a stub server."""
+    mapping_list = []
+    for _ in range(mappings):
+        platform = rng.choice(PLATFORMS)
+        external_id = f"/books/OL{rng.randint(1, 10**7)}M" if platform == "openlibrary" else str(rng.randint(1, 10**8))
+        if link_base: # URL-shaped IDs are linked as-is by get_platform_url
+            external_id = f"{link_base}/{platform}/{rng.randint(1, 10**8)}"
+        mapping_list.append({ "external_id": external_id, "platform": { "name": platform } })
+    publisher = rng.choice(PUBLISHERS + [None])
+    language = rng.choice(LANGUAGES)
+    reading_format = rng.choice(READING_FORMATS)
+    return {
+        "id": edition_id,
+        "score": rng.choice([None, rng.randint(0, 2000)]),
+        "edition_format": rng.choice(FORMATS),
+        "asin": rng.choice([None, f"B0{rng.randint(10**7, 10**8 - 1)}"]),
+        "isbn_10": None,
+        "isbn_13": rng.choice([None, make_isbn13(rng)]),
+        "pages": rng.choice([None, rng.randint(50, 1200)]),
+        "release_date": rng.choice([None, f"{rng.randint(1950, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"]),
+        "image": rng.choice([None, { "url": f"{link_base or 'https://assets.hardcover.app'}/editions/{edition_id}.jpg" }]),
+        "book_mappings": mapping_list,
+        "publisher": { "name": publisher } if publisher else None,
+        "reading_format": { "format": reading_format } if reading_format else None,
+        "language": { "language": language } if language else None,
+    }
+
+def make_book(book_id, editions=100, mappings=4, seed=0, link_base=None):
+    """Builds a book shaped like the 'full' query profile's response. The same arguments always give the same book."""
+    rng = random.Random(seed * 1000003 + book_id)
+    def default_edition():
+        return rng.choice([None, { "id": rng.randint(1, 10**7), "edition_format": rng.choice(FORMATS) }])
+    return {
+        "id": book_id,
+        "title": f"Synthetic Book {book_id}",
+        "slug": f"synthetic-book-{book_id}",
+        "editions_count": editions,
+        "description": rng.choice([None, "A synthetic description. " * rng.randint(1, 60)]),
+        "contributions": [{ "author": { "name": f"Author {book_id % 997}" } }],
+        "default_audio_edition": default_edition(),
+        "default_cover_edition": default_edition(),
+        "default_ebook_edition": default_edition(),
+        "default_physical_edition": default_edition(),
+        "editions": [make_edition(rng, book_id * 100000 + n, mappings, link_base) for n in range(editions)],
+    }
+
+def make_books_response(book_ids, editions=100, mappings=4, seed=0):
+    """Builds a full GraphQL response body for a 'books' query."""
+    return { "data": { "books": [make_book(b, editions, mappings, seed) for b in book_ids] } }
+
+def server_order(editions):
+    """Sorts editions the way the paged queries ask the server to (score ascending, nulls first, then id)."""
+    return sorted(editions, key=lambda e: (e['score'] is not None, e['score'] or 0, e['id']))
+
+@functools.lru_cache(maxsize=64)
+def cached_book(book_id, editions, mappings, seed, link_base=None):
+    """Returns (book, editions in server order), generated once so paged requests stay cheap. Do not mutate."""
+    book = make_book(book_id, editions, mappings, seed, link_base)
+    return book, server_order(book['editions'])
+
+def catalog_ids(operation, name, catalog_size):
+    """Book IDs 1..catalog_size that match a BooksByAuthor/BooksByPublisher/BooksBySeries name.
+
+    Authors match the books make_book credits them with ("Author 5" wrote books 5, 1002, ...);
+    every publisher and series name matches the whole catalogue.
+    """
+    if operation == 'BooksByAuthor':
+        match = re.fullmatch(r"Author (\d+)", name or "")
+        return range(int(match.group(1)) or 997, catalog_size + 1, 997) if match else range(0)
+    return range(1, catalog_size + 1)
+
+RESOLVE_MISS_EVERY = 7 # Identifiers whose digits form a multiple of 7 are not on any edition
+
+def resolved_editions(variables, catalog_size, editions):
+    """Answers ResolveIdentifiers. An ISBN-13 or ASIN whose digits form a number N resolves to
+    book N % catalog_size + 1, unless N is a multiple of RESOLVE_MISS_EVERY. The isbn10 list is
+    ignored: the app also sends every ISBN-10 as an ISBN-13.
+    """
+    results = []
+    for field, values in (("isbn_13", variables.get('isbn13') or []), ("asin", variables.get('asins') or [])):
+        for value in values:
+            number = int("".join(c for c in value if c.isdigit()) or 0)
+            if number % RESOLVE_MISS_EVERY == 0: continue
+            book_id = number % catalog_size + 1
+            edition = { "id": book_id * 100000 + number % editions, "book_id": book_id, "isbn_13": None, "isbn_10": None, "asin": None }
+            edition[field] = value
+            results.append(edition)
+    return sorted(results, key=lambda edition: edition["id"])
+
+LINK_PATH = re.compile(r"^/(editions|goodreads|google|openlibrary|amazon|librarything)/(\d+)")
+DEAD_LINK_EVERY = 13 # Every 13th image or platform page is gone
+HEAD_REFUSING_PLATFORMS = ("google", "amazon") # Answer HEAD with 405, like some real sites
+
+class RateLimiter:
+    """Server-side token bucket: allows 'rate' requests per second with bursts of 'burst'. Thread-safe."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+# --- Stub Server ---
+class StubGraphQLHandler(BaseHTTPRequestHandler):
+    """Answers the app's GraphQL operations at /v1/graphql with synthetic books."""
+    server_version = "HardcoverStub/1.0"
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real API
+    disable_nagle_algorithm = True # Headers and body go out in separate writes
+
+    def do_OPTIONS(self):
+        # CORS preflight; the app sends one to open a pooled connection at startup.
+        self.send_response(204)
+        self.send_header('content-length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.rstrip('/') != "/v1/graphql":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('content-length', 0))) or b"{}")
+        self.server.request_count += 1
+        if self.server.rate_limiter is not None and not self.server.rate_limiter.allow():
+            self.server.throttled_count += 1
+            self.send_response(429)
+            self.send_header('retry-after', '1')
+            self.send_header('content-length', '0')
+            self.end_headers()
+            return
+        operation = body.get('operationName')
+        variables = body.get('variables') or {}
+        book_args = (self.server.editions, self.server.mappings, self.server.seed, self.server.link_base)
+        if operation == 'BatchBooks':
+            result = { "data": { "books": [cached_book(b, *book_args)[0] for b in variables.get('bookIds') or []] } }
+        elif operation == 'MyQuery':
+            result = { "data": { "books": [cached_book(variables['bookId'], *book_args)[0]] } }
+        elif operation == 'BookHeader':
+            book, ordered = cached_book(variables['bookId'], *book_args)
+            result = { "data": { "books": [dict(book, editions=ordered[:variables['limit']])] } }
+        elif operation == 'EditionsPage':
+            ordered = cached_book(variables['bookId'], *book_args)[1]
+            offset = variables['offset']
+            result = { "data": { "editions": ordered[offset:offset + variables['limit']] } }
+        elif operation in ('BooksByAuthor', 'BooksByPublisher', 'BooksBySeries'):
+            ids = [b for b in catalog_ids(operation, variables.get('name'), self.server.catalog_size) if b > variables['after']]
+            result = { "data": { "books": [{ "id": b } for b in ids[:variables['limit']]] } }
+        elif operation == 'ResolveIdentifiers':
+            result = { "data": { "editions": resolved_editions(variables, self.server.catalog_size, self.server.editions) } }
+        else:
+            result = { "errors": [{ "message": f"Stub server does not know operation '{operation}'." }] }
+        self.send_json(result)
+
+    def do_HEAD(self):
+        self.answer_link(send_body=False)
+
+    def do_GET(self):
+        self.answer_link(send_body=True)
+
+    def answer_link(self, send_body):
+        """Serves the image and platform URLs generated with --links: a 1 KB 'image', a 404 for dead ones."""
+        match = LINK_PATH.match(self.path)
+        if self.server.link_latency:
+            time.sleep(self.server.link_latency)
+        self.server.link_requests += 1
+        if match is None or int(match.group(2)) % DEAD_LINK_EVERY == 0:
+            status, body = 404, b""
+        elif not send_body and match.group(1) in HEAD_REFUSING_PLATFORMS:
+            status, body = 405, b""
+        else:
+            status, body = 200, b"\xff" * 1024
+            if self.headers.get('range') == "bytes=0-0":
+                status, body = 206, body[:1]
+        self.send_response(status)
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        if send_body: self.wfile.write(body)
+
+    def send_json(self, result):
+        payload = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+def start_stub_server(editions=100, mappings=4, seed=0, port=0, links=False, link_latency=0.0, catalog_size=1000, rate_limit=None):
+    """Starts the stub server on a background thread. Returns (server, graphql_url).
+
+    With links=True, the books' image and platform URLs point at this server, which answers
+    each after link_latency seconds. Catalogue listings cover Book IDs 1..catalog_size.
+    With rate_limit, GraphQL requests beyond that many per second get a 429 with Retry-After.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubGraphQLHandler)
+    server.daemon_threads = True
+    server.editions, server.mappings, server.seed = editions, mappings, seed
+    server.link_base = f"http://127.0.0.1:{server.server_port}" if links else None
+    server.link_latency = link_latency
+    server.catalog_size = catalog_size
+    server.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+    server.throttled_count = 0
+    server.request_count = 0
+    server.link_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True, name="stub-server").start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/graphql"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic Hardcover GraphQL responses at /v1/graphql.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--editions', type=int, default=100, help="Editions per book.")
+    parser.add_argument('--mappings', type=int, default=4, help="Platform mappings per edition.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--links', action='store_true', help="Point image and platform URLs at this server and answer them.")
+    parser.add_argument('--link-latency', type=float, default=0.05, help="Seconds each link request takes with --links (default 0.05).")
+    parser.add_argument('--catalog-size', type=int, default=1000, help="Books listed by author/publisher/series queries (default 1000).")
+    parser.add_argument('--rate-limit', type=float, help="Answer GraphQL requests beyond this many per second with 429 and Retry-After.")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.editions, args.mappings, args.seed, args.port, args.links, args.link_latency, args.catalog_size, args.rate_limit)
+    print(f"Serving synthetic books at {url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
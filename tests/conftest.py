@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep the app's config, cache and identifier index away from the user's real ones, even at import.
+os.environ['APPDATA'] = tempfile.mkdtemp(prefix="hardcover-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Hardcover_Librarian as librarian
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Gives every test its own config folder and fresh process-wide caches, rules and indexes."""
+    monkeypatch.setenv('APPDATA', str(tmp_path))
+    for name in ('_response_cache', '_identifier_index', '_flag_rules', '_query_profiles', '_link_checker'):
+        monkeypatch.setattr(librarian, name, None)
+    librarian._link_results.clear()
+    librarian._render_model_cache.clear()
+    librarian._book_versions.clear()
+    yield
+    if librarian._response_cache is not None:
+        librarian._response_cache.conn.close()
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+    """Makes optional_module('numpy') return None, so the pure-Python paths run."""
+    monkeypatch.setitem(librarian._optional_modules, 'numpy', None)
+
+def make_edition(edition_id, **fields):
+    """An edition dict shaped like the API's, with every field the flag rules read filled in unless overridden."""
+    edition = {
+        "id": edition_id, "score": 1000, "edition_format": "Hardcover", "asin": None,
+        "isbn_10": None, "isbn_13": None, "pages": 320, "release_date": "2001-01-01",
+        "image": {"url": f"https://img.example/{edition_id}.jpg"}, "publisher": {"name": "Acme"},
+        "reading_format": {"format": "Read"}, "language": {"language": "English"}, "book_mappings": [],
+    }
+    edition.update(fields)
+    return edition
+
+def make_book(book_id, editions, **fields):
+    """A book dict shaped like the API's, with every field the book flag rules read filled in unless overridden."""
+    book = {
+        "id": book_id, "title": f"Book {book_id}", "slug": f"book-{book_id}", "editions_count": len(editions),
+        "description": "A book.", "contributions": [], "default_audio_edition": {"id": 1, "edition_format": "Audio"},
+        "default_cover_edition": {"id": 1, "edition_format": "Hardcover"}, "default_ebook_edition": {"id": 1, "edition_format": "Kindle"},
+        "default_physical_edition": {"id": 1, "edition_format": "Hardcover"}, "editions": editions,
+    }
+    book.update(fields)
+    return book
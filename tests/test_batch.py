@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+
+import Hardcover_Librarian as librarian
+from conftest import make_book, make_edition
+
+class FakeAPI:
+    """Stands in for post_graphql: answers BatchBooks with the known books among the requested IDs."""
+
+    def __init__(self, books):
+        self.books = { book["id"]: book for book in books }
+        self.requests = []
+
+    def __call__(self, bearer_token, query, variables, operation_name, timeout=30):
+        assert operation_name == "BatchBooks"
+        self.requests.append(list(variables["bookIds"]))
+        return { "books": [self.books[book_id] for book_id in variables["bookIds"] if book_id in self.books] }
+
+def read_records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_chunked_splits_in_order():
+    assert list(librarian.chunked(list(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(librarian.chunked(list(range(6)), 3)) == [[0, 1, 2], [3, 4, 5]]
+    assert list(librarian.chunked([], 3)) == []
+
+def test_batch_query_uses_in_filter():
+    assert "_in: $bookIds" in librarian.build_query('batch', librarian.DEFAULT_QUERY_PROFILE)
+
+def test_parse_book_ids_skips_invalid_and_duplicates():
+    warnings = []
+    ids = librarian.parse_book_ids(["1, 2 2", "x3 # 4", "5"], warn=warnings.append)
+    assert ids == [1, 2, 5]
+    assert warnings == ["Skipping invalid Book ID 'x3' on line 2."]
+
+def test_fetch_books_batch_returns_only_found_books(monkeypatch):
+    api = FakeAPI([make_book(1, [make_edition(10)]), make_book(3, [make_edition(30)])])
+    monkeypatch.setattr(librarian, 'post_graphql', api)
+    books = librarian.fetch_books_batch("token", [1, 2, 3])
+    assert sorted(books) == [1, 3]
+    assert api.requests == [[1, 2, 3]]
+
+def test_fetch_books_batch_requests_only_uncached_ids(monkeypatch):
+    api = FakeAPI([make_book(1, [make_edition(10)]), make_book(3, [make_edition(30)])])
+    monkeypatch.setattr(librarian, 'post_graphql', api)
+    librarian.fetch_books_batch("token", [1, 2])
+    books = librarian.fetch_books_batch("token", [1, 2, 3])
+    assert sorted(books) == [1, 3]
+    assert api.requests == [[1, 2], [2, 3]] # Book 1 came from the cache; the missing book 2 is asked for again
+
+def test_run_batch_audit_chunks_and_reports_missing_ids_in_input_order(monkeypatch):
+    api = FakeAPI([make_book(book_id, [make_edition(book_id * 10)]) for book_id in (1, 3, 4)])
+    monkeypatch.setattr(librarian, 'post_graphql', api)
+    out = io.StringIO()
+    failed = librarian.run_batch_audit("token", [4, 1, 2, 3, 5], out, chunk_size=2)
+    records = read_records(out)
+    assert failed == 2
+    assert api.requests == [[4, 1], [2, 3], [5]]
+    assert [(r["book_id"], r["found"]) for r in records] == [(4, True), (1, True), (2, False), (3, True), (5, False)]
+    assert records[2]["error"] == "No book found."
+    assert records[0]["book"]["id"] == 4 and "audit" in records[0]
+
+def test_run_batch_audit_reports_failed_chunk(monkeypatch):
+    def failing(*args, **kwargs):
+        raise librarian.GraphQLError("boom")
+    monkeypatch.setattr(librarian, 'post_graphql', failing)
+    out = io.StringIO()
+    assert librarian.run_batch_audit("token", [1, 2, 3], out, chunk_size=2) == 3
+    assert [(r["book_id"], r["found"], r["error"]) for r in read_records(out)] == [(1, False, "boom"), (2, False, "boom"), (3, False, "boom")]
+
+def fake_stream(events, error=None):
+    def stream_books_batch(*args, **kwargs):
+        yield from events
+        if error is not None: raise error
+    return stream_books_batch
+
+def test_stream_batch_chunk_writes_complete_records(monkeypatch):
+    header = { "id": 1, "title": "A \"quoted\" title" }
+    editions = [make_edition(n, score=n) for n in range(1, librarian.STREAM_FLAG_BATCH + 5)]
+    events = [('book', header)] + [('edition', e) for e in editions]
+    monkeypatch.setattr(librarian, 'stream_books_batch', fake_stream(events + [('book_end', dict(header, rating=4.5))]))
+    out, written = io.StringIO(), {}
+    librarian.stream_batch_chunk("token", [1], out, written)
+    [record] = read_records(out)
+    assert written == {1: True}
+    assert list(record) == ["book_id", "found", "book", "audit"]
+    assert record["book"] == dict(header, editions=editions, rating=4.5)
+    assert record["audit"]["flag_counts"]["low_score"] == len(editions) # Flagged across both flag batches
+
+def test_stream_batch_chunk_closes_truncated_record_at_top_level(monkeypatch):
+    header = { "id": 2, "title": "B" }
+    editions = [make_edition(n) for n in range(1, 6)] # Fewer than a flag batch, so still pending at the error
+    events = [('book', header)] + [('edition', e) for e in editions]
+    monkeypatch.setattr(librarian, 'stream_books_batch', fake_stream(events, error=ValueError("connection lost")))
+    out, written = io.StringIO(), {}
+    with pytest.raises(ValueError):
+        librarian.stream_batch_chunk("token", [2], out, written)
+    [record] = read_records(out)
+    assert written == {2: False}
+    assert record["truncated"] is True and record["error"] == "connection lost"
+    assert "truncated" not in record["book"] and "audit" not in record
+    assert record["book"]["editions"] == editions
+
+def test_stream_batch_chunk_indexes_every_flag_batch(monkeypatch):
+    header = { "id": 3, "title": "C" }
+    editions = [make_edition(n, asin=f"B{n:09d}") for n in range(1, 2 * librarian.STREAM_FLAG_BATCH + 2)]
+    events = [('book', header)] + [('edition', e) for e in editions] + [('book_end', header)]
+    monkeypatch.setattr(librarian, 'stream_books_batch', fake_stream(events))
+    librarian.stream_batch_chunk("token", [3], io.StringIO(), {})
+    index = librarian.get_identifier_index()
+    assert [index.lookup(f"asin:B{n:09d}") for n in (1, librarian.STREAM_FLAG_BATCH + 1, len(editions))] == [(3, 1), (3, librarian.STREAM_FLAG_BATCH + 1), (3, len(editions))]
@@ -0,0 +1,58 @@
+import Hardcover_Librarian as librarian
+from conftest import make_book, make_edition
+
+def mapping(platform, external_id):
+    return {"external_id": external_id, "platform": {"name": platform}}
+
+def edition(edition_id, **fields):
+    """An edition with no flags unless fields take something away."""
+    return make_edition(edition_id, **dict({"isbn_10": "0306406152"}, **fields))
+
+def old_and_new():
+    old = make_book(1, [
+        edition(1, score=100, book_mappings=[mapping("goodreads", "1")]),
+        edition(2, pages=None),
+        edition(3),
+        edition(None, score=1), # No ID: ignored
+    ], description=None)
+    new = make_book(1, [
+        edition(4, release_date=None),
+        edition(3),
+        edition(2, pages=200),
+        edition(1, score=900, book_mappings=[mapping("goodreads", "1"), mapping("openlibrary", "OL1")]),
+    ], title="Renamed")
+    return old, new
+
+def test_identical_books_have_an_empty_diff():
+    old, _ = old_and_new()
+    diff = librarian.diff_books(old, dict(old, editions=list(reversed(old["editions"]))))
+    assert librarian.diff_is_empty(diff)
+    assert librarian.summarize_diff(diff) == "no changes"
+
+def test_diff_reports_book_fields_and_flags():
+    old, new = old_and_new()
+    diff = librarian.diff_books(old, new)
+    assert diff["book_fields"] == ["description", "title"]
+    assert diff["book_flags_fixed"] == ["no_description"]
+    assert diff["book_flags_introduced"] == []
+
+def test_diff_reports_edition_changes():
+    old, new = old_and_new()
+    changes = { change["id"]: change for change in librarian.diff_books(old, new)["editions"] }
+    assert sorted(changes) == [1, 2, 4]
+    assert changes[1] == { "id": 1, "status": "changed", "fields": ["book_mappings", "score"], "score": [100, 900],
+                           "mappings_added": [["openlibrary", "OL1"]], "flags_fixed": ["low_score"] }
+    assert changes[2] == { "id": 2, "status": "changed", "fields": ["pages"], "flags_fixed": ["no_pages"] }
+    assert changes[4] == { "id": 4, "status": "added", "flags_introduced": ["no_release_date"] }
+
+def test_diff_reports_removed_editions_and_their_flags():
+    old, new = old_and_new()
+    diff = librarian.diff_books(new, old)
+    removed = [change for change in diff["editions"] if change["status"] == "removed"]
+    assert removed == [{ "id": 4, "status": "removed", "flags_fixed": ["no_release_date"] }]
+    changed = next(change for change in diff["editions"] if change["id"] == 1)
+    assert changed["mappings_removed"] == [["openlibrary", "OL1"]] and changed["flags_introduced"] == ["low_score"]
+
+def test_summarize_diff():
+    old, new = old_and_new()
+    assert librarian.summarize_diff(librarian.diff_books(old, new)) == "book details changed; editions: 2 changed, 1 added; flags: 3 fixed, 1 introduced"
@@ -0,0 +1,72 @@
+import json
+import pickle
+
+import pytest
+
+import Hardcover_Librarian as librarian
+from conftest import make_book, make_edition
+
+def write_lines(path, lines, trailing_newline=True):
+    data = "\n".join(lines) + ("\n" if trailing_newline else "")
+    path.write_bytes(data.encode('utf-8'))
+    return str(path)
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7, 50])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_split_line_ranges_cover_every_line_once(tmp_path, parts, trailing_newline):
+    lines = [json.dumps({"id": n, "pad": "x" * (n * 7 % 23)}) for n in range(20)]
+    path = write_lines(tmp_path / "dump.jsonl", lines, trailing_newline)
+    data = open(path, 'rb').read()
+    ranges = librarian.split_line_ranges(path, parts)
+    assert 1 <= len(ranges) <= parts
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(start == 0 or data[start - 1:start] == b"\n" for start, _ in ranges)
+    read = [line.decode('utf-8') for start, end in ranges for _, line in librarian.iter_dump_lines(path, start, end)]
+    assert [line.strip() for line in read] == lines
+
+def test_split_line_ranges_of_empty_and_single_line_files(tmp_path):
+    empty = tmp_path / "empty.jsonl"
+    empty.write_bytes(b"")
+    assert librarian.split_line_ranges(str(empty), 4) == []
+    single = write_lines(tmp_path / "single.jsonl", ['{"id": 1}'])
+    assert librarian.split_line_ranges(single, 4) == [(0, 10)]
+
+def audited_books():
+    """Books with many equally bad editions, so ties have to break by order."""
+    books = []
+    for book_id in range(1, 13):
+        editions = [make_edition(book_id * 10 + n, score=(book_id * 37 + n * 11) % 600 if n % 3 else None,
+                                 pages=None if n % 2 else 100, isbn_13=None if n % 4 else "9780306406157")
+                    for n in range(5)]
+        books.append(make_book(book_id, editions))
+    return books, librarian.audit_books(books)
+
+@pytest.mark.parametrize("limit", [1, 5, 100])
+def test_worst_editions_merged_in_order_match_one_pass(limit):
+    books, audits = audited_books()
+    one_pass = librarian.WorstEditions(limit)
+    for book, audit in zip(books, audits):
+        one_pass.add_book(book, audit)
+    for cuts in ([6], [1, 2, 11], [3, 6, 9]):
+        parts = []
+        for start, end in zip([0] + cuts, cuts + [len(books)]):
+            part = librarian.WorstEditions(limit)
+            for book, audit in zip(books[start:end], audits[start:end]):
+                part.add_book(book, audit)
+            parts.append(pickle.loads(pickle.dumps(part))) # Worker processes send their parts pickled
+        merged = librarian.WorstEditions(limit)
+        for part in parts:
+            merged.merge(part)
+        assert merged.ranked() == one_pass.ranked()
+        assert (merged.editions, merged.flagged) == (one_pass.editions, one_pass.flagged)
+
+def test_worst_editions_rank_worst_first():
+    books, audits = audited_books()
+    ranking = librarian.WorstEditions(10)
+    for book, audit in zip(books, audits):
+        ranking.add_book(book, audit)
+    ranked = ranking.ranked()
+    assert [entry["rank"] for entry in ranked] == list(range(1, 11))
+    badness = [entry["badness"] for entry in ranked]
+    assert badness == sorted(badness, reverse=True)
@@ -0,0 +1,130 @@
+import os
+import sys
+
+import pytest
+
+import Hardcover_Librarian as librarian
+from conftest import make_book, make_edition
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from stub_server import make_book as make_synthetic_book
+
+# The flag checks as they were written inline in display_formatted_data before the rule engine.
+def legacy_book_flags(book_data):
+    book_flags = []
+    if not book_data.get('description'):
+        book_flags.append(("[NO DESCRIPTION]", "warning_flag"))
+    if not book_data.get('default_cover_edition'): book_flags.append(("[NO DEFAULT COVER]", "info_flag"))
+    if not book_data.get('default_ebook_edition'): book_flags.append(("[NO DEFAULT EBOOK]", "info_flag"))
+    if not book_data.get('default_audio_edition'): book_flags.append(("[NO DEFAULT AUDIO]", "info_flag"))
+    if not book_data.get('default_physical_edition'): book_flags.append(("[NO DEFAULT PHYSICAL]", "info_flag"))
+    return book_flags
+
+def legacy_edition_flags(edition):
+    edition_flags = []
+    edition_score = edition.get('score')
+    if edition_score is not None and edition_score < 500:
+        edition_flags.append((f"[LOW SCORE:{edition_score}]", "warning_flag"))
+    if not edition.get('isbn_10') and not edition.get('isbn_13'):
+        edition_flags.append(("[MISSING ISBN]", "warning_flag"))
+    image_info = edition.get('image')
+    image_url = image_info.get('url') if image_info and isinstance(image_info, dict) else None
+    if not image_url:
+        edition_flags.append(("[NO IMAGE]", "warning_flag"))
+    if not edition.get('pages'): edition_flags.append(("[NO PAGES]", "info_flag"))
+    if not edition.get('release_date'): edition_flags.append(("[NO RELEASE DATE]", "info_flag"))
+    if not edition.get('publisher'): edition_flags.append(("[NO PUBLISHER]", "info_flag"))
+    if not edition.get('language'): edition_flags.append(("[NO LANGUAGE]", "info_flag"))
+    if not edition.get('edition_format'): edition_flags.append(("[NO FORMAT]", "info_flag"))
+    platform_counts = {}
+    for mapping in edition.get('book_mappings', []) or []:
+        if not isinstance(mapping, dict): continue
+        platform = mapping.get('platform')
+        platform_name = platform.get('name', 'N/A') if platform and isinstance(platform, dict) else "N/A"
+        if platform_name != "N/A":
+            platform_counts[platform_name] = platform_counts.get(platform_name, 0) + 1
+    dupe_platforms = [p for p, c in platform_counts.items() if c > 1]
+    if dupe_platforms:
+        edition_flags.append((f"[DUPE PLATFORMS: {', '.join(dupe_platforms)}]", "info_flag"))
+    return edition_flags
+
+def as_tagged(flags):
+    return [(flag.text, librarian.SEVERITY_TAGS[flag.severity]) for flag in flags]
+
+def synthetic_books():
+    books = [make_synthetic_book(book_id, editions=40, mappings=3) for book_id in range(1, 26)]
+    books.append(make_book(99, [
+        make_edition(1, score=0, isbn_13="9780306406157", pages=0, image={"url": ""}),
+        make_edition(2, score=499.5, image=None, publisher=None, language={}),
+        make_edition(3, score=None, release_date="", edition_format=None,
+                     book_mappings=[{"external_id": "a", "platform": {"name": "goodreads"}}, {"external_id": "b", "platform": {"name": "goodreads"}},
+                                    {"external_id": "c", "platform": None}]),
+    ], description="", default_cover_edition=None))
+    return books
+
+@pytest.mark.parametrize("numpy_enabled", [True, False])
+def test_rules_match_legacy_inline_flags(numpy_enabled, monkeypatch):
+    if not numpy_enabled:
+        monkeypatch.setitem(librarian._optional_modules, 'numpy', None)
+    books = synthetic_books()
+    editions = [edition for book in books for edition in book["editions"]]
+    assert [as_tagged(flags) for flags in librarian.evaluate_book_flags(books)] == [legacy_book_flags(book) for book in books]
+    assert [as_tagged(flags) for flags in librarian.evaluate_edition_flags(editions)] == [legacy_edition_flags(edition) for edition in editions]
+
+def test_records_flag_like_dicts():
+    books = synthetic_books()
+    records = [librarian.BookRecord.from_dict(book) for book in books]
+    assert librarian.audit_books(records) == librarian.audit_books(books)
+
+def test_records_give_the_same_link_urls():
+    books = synthetic_books()
+    records = [librarian.BookRecord.from_dict(book) for book in books]
+    urls = librarian.book_link_urls(books)
+    assert urls and librarian.book_link_urls(records) == urls
+
+def test_missing_test_matches_without_numpy(monkeypatch):
+    rule = { "id": "r", "test": "missing" }
+    column = [None, "", [], "x", {}, {"a": 1}, 0, 3.5, ["p"]]
+    with_numpy = librarian.rule_mask(rule, column)
+    monkeypatch.setitem(librarian._optional_modules, 'numpy', None)
+    assert with_numpy == librarian.rule_mask(rule, column) == [0, 1, 2, 4, 6]
+
+def test_below_test_ignores_non_numbers(without_numpy):
+    rule = { "id": "r", "test": "below", "threshold": 5 }
+    assert librarian.rule_mask(rule, [1, None, "2", 5, 4.9]) == [0, 4]
+
+def test_unrequested_fields_are_not_flagged_missing():
+    rules = [rule for rule in librarian.EDITION_FLAG_RULES if rule['column'] == 'pages']
+    assert librarian.evaluate_edition_flags([{"id": 1}, {"id": 2}], rules) == [[], []]
+
+def test_field_present_on_any_record_is_evaluated():
+    rules = [rule for rule in librarian.EDITION_FLAG_RULES if rule['column'] == 'pages']
+    flags = librarian.evaluate_edition_flags([{"id": 1}, {"id": 2, "pages": 100}, {"id": 3, "pages": None}], rules)
+    assert [[flag.rule for flag in row] for row in flags] == [["no_pages"], [], ["no_pages"]]
+
+def test_config_overrides_threshold_severity_and_enabled():
+    overrides = { "low_score": {"threshold": 10, "severity": "info"}, "no_pages": {"enabled": False} }
+    rules = librarian.apply_rule_overrides(librarian.EDITION_FLAG_RULES, overrides)
+    low_score = next(rule for rule in rules if rule['id'] == 'low_score')
+    assert (low_score['threshold'], low_score['severity']) == (10, "info")
+    assert 'no_pages' not in [rule['id'] for rule in rules]
+    assert librarian.EDITION_FLAG_RULES[0]['threshold'] == 500 # Defaults are not modified
+
+def test_book_model_memo_follows_identifier_index_and_link_results():
+    book = make_book(1, [make_edition(10, isbn_13="9780306406157")])
+    librarian.record_book_identifiers(1, book["editions"])
+    model = librarian.get_book_model(book)
+    assert librarian.get_book_model(book) is model
+    librarian.record_book_identifiers(2, [make_edition(20, isbn_13="9780306406157")]) # Now a shared identifier
+    rebuilt = librarian.get_book_model(book)
+    assert rebuilt is not model
+    librarian.remember_link_results({ "https://img.example/10.jpg": librarian.LinkStatus(False, "404", 0) })
+    assert librarian.get_book_model(book) is not rebuilt
+
+def test_cached_books_are_keyed_by_their_cache_row(monkeypatch):
+    book = make_book(1, [make_edition(10)])
+    librarian.store_fetched_book(1, librarian.DEFAULT_QUERY_PROFILE, book)
+    cached, _ = librarian.get_cached_book(1)
+    monkeypatch.setattr(librarian, 'book_content_hash', lambda book: pytest.fail("a cached book was hashed"))
+    model = librarian.get_book_model(book)
+    assert cached is not book and librarian.get_book_model(cached) is model # Another dict read from the same row
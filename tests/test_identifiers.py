@@ -0,0 +1,235 @@
+import pickle
+import random
+
+import pytest
+
+import Hardcover_Librarian as librarian
+from conftest import make_edition
+
+ISBN13 = "9780306406157"
+ISBN10 = "0306406152"
+
+def test_isbn_conversions_round_trip():
+    assert librarian.isbn10_to_isbn13(ISBN10) == ISBN13
+    assert librarian.isbn13_to_isbn10(ISBN13) == ISBN10
+    assert librarian.isbn10_to_isbn13("080442957X") == "9780804429573"
+    assert librarian.isbn13_to_isbn10("9780804429573") == "080442957X"
+
+def test_invalid_isbns_are_rejected():
+    assert librarian.isbn10_to_isbn13("0306406153") is None # Bad check digit
+    assert librarian.isbn13_to_isbn10("9790000000001") is None # 979 ISBNs have no ISBN-10
+    assert not librarian.is_valid_isbn13("9780306406158")
+
+@pytest.mark.parametrize("value", [ISBN13, ISBN10, "978-0-306-40615-7", " 0 306 40615 2 "])
+def test_normalize_isbn_accepts_both_forms(value):
+    assert librarian.normalize_isbn(value) == ISBN13
+
+@pytest.mark.parametrize("value", [None, "", "12345", "9780306406158", "03064061X2"])
+def test_normalize_isbn_rejects_invalid(value):
+    assert librarian.normalize_isbn(value) is None
+
+@pytest.mark.parametrize("value, key", [
+    (ISBN10, "isbn:" + ISBN13),
+    ("978-0-306-40615-7", "isbn:" + ISBN13),
+    ("b00abc1234", "asin:B00ABC1234"),
+    ("B0 0ABC-1234", "asin:B00ABC1234"),
+    ("0306406153", None), # Ten digits are an ISBN, and this one fails the checksum
+    ("B00ABC123", None),
+    ("not-an-id!", None),
+])
+def test_normalize_identifier(value, key):
+    assert librarian.normalize_identifier(value) == key
+
+def test_parse_identifiers_drops_duplicate_keys_and_keeps_invalid():
+    warnings = []
+    entries = librarian.parse_identifiers([f"{ISBN13}, {ISBN10}", "B00ABC1234 bogus # comment"], warn=warnings.append)
+    assert entries == [(ISBN13, "isbn:" + ISBN13), ("B00ABC1234", "asin:B00ABC1234"), ("bogus", None)]
+    assert len(warnings) == 1
+
+def test_edition_identifiers_normalizes_every_source():
+    edition = make_edition(1, isbn_13=ISBN13, isbn_10=ISBN10, asin=" b00abc1234 ", book_mappings=[
+        {"external_id": " 123 ", "platform": {"name": "Goodreads"}},
+        {"external_id": None, "platform": {"name": "openlibrary"}},
+        {"external_id": "x", "platform": None},
+        "not a mapping",
+    ])
+    assert librarian.edition_identifiers(edition) == {"isbn:" + ISBN13, "asin:B00ABC1234", "goodreads:123"}
+    assert librarian.edition_identifiers(make_edition(2)) == set()
+
+def test_edition_identifiers_reads_records_like_dicts():
+    edition = make_edition(1, isbn_10=ISBN10, book_mappings=[{"external_id": "9", "platform": {"name": "Amazon"}}])
+    record = librarian.EditionRecord.from_dict(edition)
+    assert librarian.edition_identifiers(record) == librarian.edition_identifiers(edition) == {"isbn:" + ISBN13, "amazon:9"}
+
+def test_records_index_like_dicts():
+    editions = [make_edition(10, isbn_13=ISBN13), make_edition(11, asin="B00ABC1234")]
+    from_dicts, from_records = librarian.IdentifierIndex(), librarian.IdentifierIndex()
+    from_dicts.record_editions(1, editions)
+    from_records.record_editions(1, [librarian.EditionRecord.from_dict(edition) for edition in editions])
+    assert from_records.book_entries == from_dicts.book_entries
+    assert from_records.lookup("asin:B00ABC1234") == (1, 11)
+
+def isbn_edition(edition_id, isbn13):
+    return {"id": edition_id, "isbn_13": isbn13}
+
+def test_index_records_and_looks_up_first_owner():
+    index = librarian.IdentifierIndex()
+    index.record_editions(1, [isbn_edition(10, ISBN13)])
+    index.record_editions(2, [isbn_edition(20, ISBN13)])
+    assert index.lookup("isbn:" + ISBN13) == (1, 10)
+    assert index.owners("isbn:" + ISBN13) == [(1, 10), (2, 20)]
+    assert index.lookup("isbn:9780804429573") is None
+
+def test_index_flags_both_sides_of_a_duplicate():
+    index = librarian.IdentifierIndex()
+    index.record_editions(1, [isbn_edition(10, ISBN13)])
+    index.record_editions(2, [isbn_edition(20, ISBN13)])
+    assert index.find_conflicts(isbn_edition(10, ISBN13)) == [("isbn:" + ISBN13, 2, 20)]
+    assert index.find_conflicts(isbn_edition(20, ISBN13)) == [("isbn:" + ISBN13, 1, 10)]
+
+def test_rerecording_a_book_drops_identifiers_it_no_longer_has():
+    index = librarian.IdentifierIndex()
+    index.record_editions(1, [isbn_edition(10, ISBN13)])
+    index.record_editions(2, [isbn_edition(20, ISBN13)])
+    index.dirty = False
+    index.record_editions(1, [isbn_edition(10, "9780804429573")])
+    assert index.dirty
+    assert index.owners("isbn:" + ISBN13) == [(2, 20)]
+    assert index.find_conflicts(isbn_edition(20, ISBN13)) == []
+    index.record_editions(1, [])
+    index.record_editions(2, [])
+    assert index.count == 0 and index.book_entries == {}
+
+def test_unchanged_rerecord_is_not_a_change():
+    index = librarian.IdentifierIndex()
+    index.record_editions(1, [isbn_edition(10, ISBN13)])
+    index.dirty = False
+    generation = index.generation
+    index.record_editions(1, [isbn_edition(10, ISBN13)])
+    assert not index.dirty and index.generation == generation
+
+def test_dropped_owner_is_refilled_from_remaining_holders():
+    index = librarian.IdentifierIndex()
+    for book_id in (1, 2, 3):
+        index.record_editions(book_id, [isbn_edition(book_id * 10, ISBN13)])
+    index.record_editions(2, [])
+    assert index.owners("isbn:" + ISBN13) == [(1, 10), (3, 30)]
+    index.record_editions(1, [])
+    assert index.owners("isbn:" + ISBN13) == [(3, 30)]
+
+def test_book_recorded_in_pieces_keeps_every_piece():
+    index = librarian.IdentifierIndex()
+    first_page = [isbn_edition(10, ISBN13), isbn_edition(11, "9780804429573")]
+    second_page = [isbn_edition(12, ISBN13)]
+    index.record_editions(1, first_page)
+    index.record_editions(1, second_page, append=True)
+    index.record_editions(1, second_page, append=True) # Recording the same editions again adds nothing
+    assert index.lookup("isbn:9780804429573") == (1, 11)
+    assert index.owners("isbn:" + ISBN13) == [(1, 10), (1, 12)]
+    assert index.find_conflicts(isbn_edition(10, ISBN13)) == [("isbn:" + ISBN13, 1, 12)]
+    generation = index.generation
+    index.record_editions(1, first_page + second_page) # The whole book, as stored after the last page
+    assert index.generation == generation
+    index.record_editions(1, second_page) # Without append, the book's earlier editions are dropped
+    assert index.lookup("isbn:9780804429573") is None
+
+def test_paged_fetch_indexes_every_page(monkeypatch):
+    pages = [[isbn_edition(10, ISBN13), isbn_edition(11, "9780804429573")], [isbn_edition(12, ISBN13)]]
+
+    def post_graphql(bearer_token, query, variables, operation_name, timeout=30):
+        if operation_name == "BookHeader":
+            return { "books": [{ "id": 1, "title": "Paged", "editions": pages[0] }] }
+        return { "editions": pages[variables["offset"] // 2] if variables["offset"] < 4 else [] }
+    monkeypatch.setattr(librarian, 'post_graphql', post_graphql)
+    librarian.fetch_book_paged("token", 1, page_size=2)
+    index = librarian.get_identifier_index()
+    assert index.lookup("isbn:9780804429573") == (1, 11)
+    assert index.owners("isbn:" + ISBN13) == [(1, 10), (1, 12)]
+
+def random_books(seed, books=300, pool=400):
+    """Books whose editions draw ASINs from a small pool, so many identifiers are shared."""
+    rng = random.Random(seed)
+    return [(book_id, [{"id": book_id * 100 + n, "asin": f"B{rng.randrange(pool):09d}"} for n in range(rng.randint(0, 4))])
+            for book_id in [rng.randint(1, books // 2) for _ in range(books)]] # Some books are recorded more than once
+
+def reference_owners(books):
+    """What the index should hold: every identifier's holders, by the latest recording of each book."""
+    latest = dict(books)
+    holders = {}
+    for book_id, editions in latest.items():
+        for edition in editions:
+            holders.setdefault("asin:" + edition["asin"], set()).add((book_id, edition["id"]))
+    return holders
+
+def test_index_grows_and_matches_a_reference():
+    index = librarian.IdentifierIndex(capacity=8)
+    books = random_books(seed=1)
+    for book_id, editions in books:
+        index.record_editions(book_id, editions)
+    expected = reference_owners(books)
+    assert len(index.keys) > 8 and index.count == len(expected)
+    for key, holders in expected.items():
+        owners = index.owners(key)
+        assert set(owners) <= holders and len(owners) == min(len(holders), 2)
+        between = index.overflow.get(index.hash_identifier(key), [])
+        assert set(owners) | {(value >> 32, value & 0xFFFFFFFF) for value in between} == holders
+        assert index.holders[index._find_slot(index.hash_identifier(key))] == len(holders)
+
+def test_index_persists_round_trip(tmp_path):
+    index = librarian.IdentifierIndex(capacity=8)
+    for book_id, editions in random_books(seed=2):
+        index.record_editions(book_id, editions)
+    path = str(tmp_path / "index.bin")
+    index.save(path)
+    assert not index.dirty
+    loaded = librarian.IdentifierIndex.load(path)
+    assert loaded.count == index.count and loaded.book_entries == index.book_entries and loaded.overflow == index.overflow
+    for column in ("keys", "values", "others", "holders"):
+        assert getattr(loaded, column) == getattr(index, column)
+    loaded.record_editions(1, [isbn_edition(1, ISBN13)]) # Still usable after loading
+    assert loaded.lookup("isbn:" + ISBN13) == (1, 1)
+
+def test_version_2_files_rebuild_the_overflow(tmp_path):
+    index = librarian.IdentifierIndex(capacity=8)
+    for book_id, editions in random_books(seed=4):
+        index.record_editions(book_id, editions)
+    path = str(tmp_path / "index.bin")
+    index.save(path)
+    data = open(path, 'rb').read()
+    overflow_size = 8 + 16 * len(index.overflow) + 8 * sum(len(owners) for owners in index.overflow.values())
+    assert index.overflow and len(data) > overflow_size
+    open(path, 'wb').write(data[:4] + (2).to_bytes(4, 'little') + data[8:-overflow_size]) # As saved before overflow was kept
+    loaded = librarian.IdentifierIndex.load(path)
+    assert loaded.dirty
+    assert { key: sorted(owners) for key, owners in loaded.overflow.items() } == { key: sorted(owners) for key, owners in index.overflow.items() }
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"not an index at all, just some bytes")
+    with pytest.raises(ValueError):
+        librarian.IdentifierIndex.load(str(path))
+
+def test_merge_matches_recording_in_order():
+    books = random_books(seed=3)
+    books = list(dict(books).items()) # Each book once, as in the ranges of a dump
+    sequential = librarian.IdentifierIndex()
+    for book_id, editions in books:
+        sequential.record_editions(book_id, editions)
+    first, second = librarian.IdentifierIndex(), librarian.IdentifierIndex()
+    for book_id, editions in books[:len(books) // 2]:
+        first.record_editions(book_id, editions)
+    for book_id, editions in books[len(books) // 2:]:
+        second.record_editions(book_id, editions)
+    first.merge(pickle.loads(pickle.dumps(second))) # Worker processes send their parts pickled
+    assert first.count == sequential.count and first.book_entries == sequential.book_entries
+    for key in reference_owners(books):
+        assert first.owners(key) == sequential.owners(key)
+
+def test_merge_replaces_books_both_indexes_have():
+    first, second = librarian.IdentifierIndex(), librarian.IdentifierIndex()
+    first.record_editions(1, [isbn_edition(10, ISBN13)])
+    first.record_editions(2, [isbn_edition(20, ISBN13)])
+    second.record_editions(1, [isbn_edition(10, "9780804429573")])
+    first.merge(second)
+    assert first.owners("isbn:" + ISBN13) == [(2, 20)]
+    assert first.lookup("isbn:9780804429573") == (1, 10)
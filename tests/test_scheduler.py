@@ -0,0 +1,170 @@
+import email.utils
+import time
+
+import pytest
+
+import Hardcover_Librarian as librarian
+
+class FakeClock:
+    """Replaces the app's time module: sleeping advances the clock instead of waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {"retry-after": retry_after} if retry_after is not None else {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeSender:
+    """send() for RequestScheduler.request: returns (or raises) the given outcomes in turn."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException): raise outcome
+        return outcome
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(librarian, 'time', clock)
+    return clock
+
+@pytest.fixture
+def max_jitter(monkeypatch):
+    """Makes the full-jitter backoff always pick its upper bound."""
+    monkeypatch.setattr(librarian.random, 'uniform', lambda low, high: high)
+
+def send(scheduler, sender):
+    with scheduler.request(sender) as response:
+        return response
+
+def test_backoff_doubles_up_to_the_cap(max_jitter):
+    scheduler = librarian.RequestScheduler()
+    assert [scheduler.backoff(attempt) for attempt in range(8)] == [0.5, 1, 2, 4, 8, 16, 30, 30]
+
+def test_backoff_is_jittered_below_the_bound():
+    scheduler = librarian.RequestScheduler()
+    delays = [scheduler.backoff(3) for _ in range(200)]
+    assert all(0 <= delay <= 4 for delay in delays) and len(set(delays)) > 1
+
+def test_aimd_adds_one_over_limit_per_success(clock):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0, max_concurrency=4)
+    assert scheduler.limit == 2
+    for expected in (2.5, 2.9, 3.2448275862068965):
+        scheduler.acquire()
+        scheduler.release("ok")
+        assert scheduler.limit == pytest.approx(expected)
+    for _ in range(20):
+        scheduler.acquire()
+        scheduler.release("ok")
+    assert scheduler.limit == 4 # Never above max_concurrency
+
+def test_aimd_halves_at_most_once_per_interval(clock):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0, max_concurrency=16)
+    scheduler.limit = 8.0
+    for _ in range(3): # One burst of failures counts once
+        scheduler.acquire()
+        scheduler.release("throttled")
+    assert scheduler.limit == 4
+    clock.now += librarian.DECREASE_INTERVAL_SECONDS
+    scheduler.acquire()
+    scheduler.release("server_errors")
+    assert scheduler.limit == 2
+    for _ in range(3):
+        clock.now += librarian.DECREASE_INTERVAL_SECONDS
+        scheduler.acquire()
+        scheduler.release("connection_errors")
+    assert scheduler.limit == 1 # Never below one
+    assert (scheduler.counters["throttled"], scheduler.counters["server_errors"], scheduler.counters["connection_errors"]) == (3, 1, 3)
+
+def test_neutral_outcomes_leave_the_limit_alone(clock):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0)
+    scheduler.acquire()
+    scheduler.release("neutral")
+    assert scheduler.limit == 2 and scheduler.in_flight == 0
+
+def test_token_bucket_waits_for_a_token(clock):
+    scheduler = librarian.RequestScheduler(requests_per_minute=60, burst=2)
+    now = clock.monotonic()
+    assert scheduler.next_wait(now) == 0
+    scheduler.tokens = 0.25
+    assert scheduler.next_wait(now) == pytest.approx(0.75)
+    scheduler.in_flight = 2
+    assert scheduler.next_wait(now) is None # At the concurrency limit: wait for a release instead
+
+@pytest.mark.parametrize("value, seconds", [("7", 7.0), (" 0 ", 0.0), ("", None), (None, None), ("soon", None)])
+def test_parse_retry_after_seconds(value, seconds):
+    assert librarian.parse_retry_after(value) == seconds
+
+def test_parse_retry_after_http_date():
+    value = email.utils.formatdate(time.time() + 120, usegmt=True)
+    assert 110 < librarian.parse_retry_after(value) <= 120
+    assert librarian.parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0
+
+def test_retry_after_pauses_every_request(clock, max_jitter):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0)
+    throttled = FakeResponse(429, retry_after="5")
+    sender = FakeSender(throttled, FakeResponse(200))
+    assert send(scheduler, sender).status_code == 200
+    assert throttled.closed and sender.calls == 2
+    assert clock.slept == [5.0] # Retry-After outranks the 0.5 s backoff
+    assert scheduler.paused_until == 1005.0
+    assert scheduler.stats()["retries"] == 1 and scheduler.stats()["throttled"] == 1
+
+def test_pause_holds_back_other_requests(clock):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0)
+    scheduler.pause(3)
+    assert scheduler.next_wait(clock.monotonic()) == 3
+    clock.now += 3
+    assert scheduler.next_wait(clock.monotonic()) == 0
+
+def test_retry_after_is_capped(clock, max_jitter):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0)
+    send(scheduler, FakeSender(FakeResponse(503, retry_after="100000"), FakeResponse(200)))
+    assert clock.slept == [librarian.RETRY_AFTER_MAX_SECONDS]
+
+def test_retries_give_up_with_the_last_response(clock, max_jitter):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0, max_retries=2)
+    sender = FakeSender(*[FakeResponse(500) for _ in range(3)])
+    assert send(scheduler, sender).status_code == 500
+    assert sender.calls == 3 and clock.slept == [0.5, 1]
+    assert scheduler.stats()["failed"] == 1 and scheduler.in_flight == 0
+
+def test_client_errors_are_not_retried(clock):
+    scheduler = librarian.RequestScheduler(requests_per_minute=0)
+    sender = FakeSender(FakeResponse(401))
+    assert send(scheduler, sender).status_code == 401
+    assert sender.calls == 1 and clock.slept == [] and scheduler.limit == 2
+
+def test_connection_errors_are_retried_then_raised(clock, max_jitter):
+    error = librarian.requests.exceptions.ConnectionError("refused")
+    scheduler = librarian.RequestScheduler(requests_per_minute=0, max_retries=1)
+    sender = FakeSender(error, FakeResponse(200))
+    assert send(scheduler, sender).status_code == 200
+    sender = FakeSender(error, error)
+    with pytest.raises(librarian.requests.exceptions.ConnectionError):
+        send(scheduler, sender)
+    assert scheduler.stats()["connection_errors"] == 3 and scheduler.in_flight == 0
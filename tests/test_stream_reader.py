@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import Hardcover_Librarian as librarian
+
+DOCUMENT = {
+    "data": {
+        "books": [
+            { "id": 1, "title": "Café 漢字 \U0001f600 \"quoted\" \\ back", "rating": 3.25, "big": 12345678901234,
+              "neg": -0.5e-3, "flags": [True, False, None], "editions": [{ "id": 10, "score": 512.75 }, { "id": 11, "score": None }],
+              "after": {"nested": []} },
+            None,
+            { "id": 2, "title": "", "editions": [] },
+            { "id": 3, "title": "No editions key" },
+        ],
+    },
+}
+
+def split_bytes(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def read_value(chunks):
+    reader = librarian.JSONStreamReader(chunks)
+    return reader.value()
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_value_survives_any_chunk_boundary(size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+    assert read_value(split_bytes(data, size)) == DOCUMENT
+
+@pytest.mark.parametrize("text", ["3.25", "-12", "1e10", "12345678901234567890", "true", "null", "\"café\""])
+def test_scalars_split_at_every_position(text):
+    data = text.encode('utf-8')
+    for cut in range(1, len(data)):
+        assert read_value([data[:cut], data[cut:]]) == json.loads(text)
+
+def test_number_cut_at_chunk_end_is_not_accepted_early():
+    reader = librarian.JSONStreamReader([b'[3.', b'25, 4', b'0]'])
+    values = []
+    for _ in reader.items():
+        values.append(reader.value())
+    assert values == [3.25, 40]
+
+def test_members_and_items_walk_containers():
+    reader = librarian.JSONStreamReader(split_bytes(b' { "a" : [1, {"b": 2}], "c": "d" } ', 2))
+    seen = []
+    for key in reader.members():
+        if key == "a":
+            for _ in reader.items():
+                seen.append(reader.value())
+        else:
+            seen.append((key, reader.value()))
+    assert seen == [1, {"b": 2}, ("c", "d")]
+    assert reader.peek() == ""
+
+def test_truncated_input_raises():
+    with pytest.raises(json.JSONDecodeError):
+        read_value([b'{"a": [1, 2'])
+
+@pytest.mark.parametrize("size", [1, 4, 4096])
+def test_graphql_events_rebuild_the_books(size):
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    books, editions = [], None
+    for kind, value in librarian.stream_graphql_events(split_bytes(data, size)):
+        if kind == 'book':
+            editions = []
+        elif kind == 'edition':
+            editions.append(value)
+        else:
+            books.append(dict(value, editions=editions))
+    # Null books are skipped; a book without an 'editions' key looks like one with an empty list
+    assert books == [dict(book, editions=book.get("editions", [])) for book in DOCUMENT["data"]["books"] if book is not None]
+
+def test_header_event_comes_before_editions_and_excludes_them():
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    events = list(librarian.stream_graphql_events(split_bytes(data, 3)))
+    assert [kind for kind, _ in events[:4]] == ['book', 'edition', 'edition', 'book_end']
+    book_end = events[3][1]
+    assert 'editions' not in book_end and book_end["after"] == {"nested": []}
+
+def test_graphql_errors_raise():
+    data = json.dumps({ "errors": [{ "message": "bad query" }] }).encode('utf-8')
+    with pytest.raises(librarian.GraphQLError, match="bad query"):
+        list(librarian.stream_graphql_events(split_bytes(data, 5)))